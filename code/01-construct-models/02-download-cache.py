@@ -1,36 +1,51 @@
 #!/usr/bin/env python
 
 import json
-import logging as lg
 import multiprocessing as mp
+import sys
 import time
 from pathlib import Path
 
 import geopandas as gpd
 import osmnx as ox
+from snm import httpcache, overpass
 
 print(ox.ts(), "OSMnx version", ox.__version__)
 
-# hardcode CPU count to parallelize it without hammering Overpass server
-cpus = 3
-
 # load configs
 with Path("./config.json").open() as f:
     config = json.load(f)
 
+# graphs are built from a local OSM PBF extract instead, if one is configured
+if config["osm_pbf_path"]:
+    print(ox.ts(), f"Graphs will be built from {config['osm_pbf_path']!r}: nothing to download")
+    sys.exit()
+
+# configure multiprocessing for planning the queries. the queries themselves
+# are sent with as many in flight as the Overpass server gives us slots, or
+# at most max_concurrency if it doesn't rate limit us
+cpus = mp.cpu_count() if config["cpus"] == 0 else config["cpus"]
+max_concurrency = 8
+
+# save responses to the cache in batches of this many
+flush_count = 10
+
 # configure OSMnx
 ox.settings.log_file = True
 ox.settings.log_console = False
 ox.settings.logs_folder = config["osmnx_log_path"]
-ox.settings.cache_folder = config["osmnx_cache_path"]
-ox.settings.use_cache = True
-ox.settings.cache_only_mode = True
+
+# keep HTTP responses in the consolidated cache, first importing any responses
+# in OSMnx's old per-file cache folder if the cache doesn't exist yet
+http_cache_path = Path(config["http_cache_path"])
+osmnx_cache_path = Path(config["osmnx_cache_path"])
+if not http_cache_path.exists() and osmnx_cache_path.is_dir():
+    count = httpcache.import_folder(http_cache_path, osmnx_cache_path)
+    msg = f"Imported {count:,} responses from {str(osmnx_cache_path)!r} to {str(http_cache_path)!r}"
+    print(ox.ts(), msg)
 
 # configure queries
 network_type = "drive"
-retain_all = True
-simplify = True
-truncate_by_edge = True
 
 # load the prepped urban centers dataset
 uc_gpkg_path = config["uc_gpkg_path"]
@@ -38,34 +53,42 @@ ucs = gpd.read_file(uc_gpkg_path).sort_values("GH_BUS_TOT_2025", ascending=True)
 msg = f"Loaded urban centers data with shape {ucs.shape} from {uc_gpkg_path!r}"
 print(ox.ts(), msg)
 
+# plan every urban center's Overpass sub-queries up front, exactly the way
+# graph_from_polygon will make them, then keep the ones not cached yet
+print(ox.ts(), f"Planning {len(ucs):,} graphs' queries using {cpus} CPUs")
+args = ((geometry, network_type) for geometry in ucs["geometry"])
+with mp.get_context().Pool(cpus) as pool:
+    planned = pool.starmap_async(overpass.plan_queries, args).get()
+queries = dict(query for uc_queries in planned for query in uc_queries)
+urls = list(queries)
+cached = httpcache.exists(http_cache_path, urls)
+uncached_urls = [url for url, c in zip(urls, cached, strict=True) if not c]
+msg = f"Planned {len(urls):,} queries: {sum(cached):,} cached, {len(uncached_urls):,} to download"
+print(ox.ts(), msg)
 
-def download_data(name, geometry) -> None:
-    try:
-        ox.graph_from_polygon(
-            polygon=geometry,
-            network_type=network_type,
-            retain_all=retain_all,
-            simplify=simplify,
-            truncate_by_edge=truncate_by_edge,
-        )
-    except ox._errors.CacheOnlyInterruptError:
-        # error on success, because cache_only_mode is True
-        print(ox.ts(), "Finished", name, flush=True)
+# send the queries, saving the responses to the cache in batches as they arrive
+failed = []
+pending = []
 
-    except Exception as e:
-        ox.log(f'"{name}" failed: {e}', level=lg.ERROR)
-        print(name, e)
 
+def on_result(i, response_json, attempts) -> None:
+    url = uncached_urls[i]
+    if response_json is None:
+        ox.log(f"Failed to get query after {attempts} attempts: {url}")
+        failed.append(url)
+        return
+    pending.append((url, response_json))
+    if len(pending) >= flush_count:
+        httpcache.write(http_cache_path, pending)
+        pending.clear()
 
-names = ucs["country_iso"] + "-" + ucs["GC_UCN_MAI_2025"] + "-" + ucs["ID_UC_G0"].astype(str)
-args = zip(names, ucs["geometry"], strict=True)
 
-print(ox.ts(), f"Downloading {len(ucs):,} graphs' data using {cpus} CPUs")
 start_time = time.time()
-
-with mp.get_context().Pool(cpus) as pool:
-    pool.starmap_async(download_data, args).get()
+try:
+    overpass.fetch([queries[url] for url in uncached_urls], on_result, max_concurrency)
+finally:
+    httpcache.write(http_cache_path, pending)
 
 elapsed = time.time() - start_time
 msg = f"Finished caching data for {len(ucs):,} graphs in {elapsed:,.0f} seconds"
-print(ox.ts(), msg)
+print(ox.ts(), f"{msg}, {len(failed):,} queries failed")
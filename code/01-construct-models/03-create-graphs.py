@@ -8,6 +8,7 @@ from pathlib import Path
 
 import geopandas as gpd
 import osmnx as ox
+from snm import graphstore, httpcache, overpass, pbf, scheduler
 
 print(ox.ts(), "OSMnx version", ox.__version__)
 
@@ -19,7 +20,6 @@ with Path("./config.json").open() as f:
 ox.settings.log_file = True
 ox.settings.log_console = False
 ox.settings.logs_folder = config["osmnx_log_path"]
-ox.settings.cache_folder = config["osmnx_cache_path"]
 ox.settings.use_cache = True
 
 # configure queries
@@ -30,6 +30,7 @@ truncate_by_edge = True
 
 # configure multiprocessing
 cpus = mp.cpu_count() if config["cpus"] == 0 else config["cpus"]
+memory_budget = config["memory_budget_gb"]
 
 # load the prepped urban centers dataset
 uc_gpkg_path = config["uc_gpkg_path"]
@@ -37,11 +38,33 @@ ucs = gpd.read_file(uc_gpkg_path).sort_values("GH_BUS_TOT_2025", ascending=False
 msg = f"Loaded urban centers data with shape {ucs.shape} from {uc_gpkg_path!r}"
 print(ox.ts(), msg)
 
+# if a local OSM PBF extract is configured, build graphs from it instead of
+# the Overpass API: plan every urban center's Overpass queries, then stream
+# the extract once to make the responses the Overpass API would return and
+# save them to a cache of their own, for graph_from_polygon to build from
+pbf_path = config["osm_pbf_path"]
+if pbf_path:
+    cache_path = config["osm_pbf_cache_path"]
+    args = ((geometry, network_type) for geometry in ucs["geometry"])
+    with mp.get_context().Pool(cpus) as pool:
+        planned = pool.starmap_async(overpass.plan_queries, args).get()
+    queries = dict(query for uc_queries in planned for query in uc_queries)
+    cached = httpcache.exists(cache_path, queries)
+    urls = [url for url, c in zip(queries, cached, strict=True) if not c]
+    print(ox.ts(), f"Making {len(urls):,} queries' responses from {pbf_path!r}")
+    locations_path = config["osm_pbf_locations_path"]
+    url_queries = [queries[url] for url in urls]
+    responses = pbf.make_responses(pbf_path, url_queries, network_type, locations_path)
+    httpcache.write(cache_path, zip(urls, responses, strict=True))
+else:
+    cache_path = config["http_cache_path"]
+httpcache.install(cache_path)
+
 
 def get_graph(uc, root) -> None:
     try:
         country_folder = f"{uc['GC_CNT_GAD_2025']}-{uc['country_iso']}"
-        uc_filename = f"{uc['GC_UCN_MAI_2025']}-{uc['ID_UC_G0']}.graphml"
+        uc_filename = f"{uc['GC_UCN_MAI_2025']}-{uc['ID_UC_G0']}.npz"
         filepath = root / country_folder / uc_filename
         if not filepath.is_file():
             G = ox.graph_from_polygon(
@@ -55,7 +78,7 @@ def get_graph(uc, root) -> None:
             # don't save graphs if they have fewer than 3 nodes
             min_nodes = 3
             if len(G) >= min_nodes:
-                ox.save_graphml(G, filepath=filepath)
+                graphstore.save_graph(G, filepath)
                 print(ox.ts(), f"Saved {filepath}", flush=True)
 
     except Exception as e:
@@ -63,21 +86,26 @@ def get_graph(uc, root) -> None:
         print(e, filepath)
 
 
-ucs = ucs.sample(len(ucs))  # .tail(10)
-
-# create function arguments for multiprocessing
-root = Path(config["models_graphml_path"])
+# create function arguments for multiprocessing, keyed by graph file stem,
+# with each urban center's built-up area as its size to predict its cost
+root = Path(config["models_npz_path"])
 cols = ["GC_CNT_GAD_2025", "country_iso", "GC_UCN_MAI_2025", "ID_UC_G0", "geometry"]
-args = ((uc[cols].to_dict(), root) for _, uc in ucs.iterrows())
+items = {
+    f"{uc['GC_UCN_MAI_2025']}-{uc['ID_UC_G0']}": (
+        (uc[cols].to_dict(), root),
+        (uc["GH_BUS_TOT_2025"],),
+    )
+    for _, uc in ucs.iterrows()
+}
+profile_path = Path(config["stage_profiles_path"]) / "create-graphs.json"
 
 print(ox.ts(), f"Begin creating {len(ucs):,} graphs using {cpus} CPUs")
 start_time = time.time()
-with mp.get_context().Pool(cpus) as pool:
-    pool.starmap_async(get_graph, args).get()
+scheduler.starmap(get_graph, items, cpus, memory_budget, profile_path)
 
 elapsed = time.time() - start_time
 msg = f"Finished creating {len(ucs):,} graphs in {elapsed:,.0f} seconds"
 print(ox.ts(), msg)
 file_count = len(list(root.glob("*/*")))
-msg = f"There are {file_count:,} GraphML files in {str(root)!r}"
+msg = f"There are {file_count:,} graph files in {str(root)!r}"
 print(ox.ts(), msg)
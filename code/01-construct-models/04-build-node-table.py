@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+import json
+import multiprocessing as mp
+from pathlib import Path
+
+import numpy as np
+import osmnx as ox
+from snm import fusion, graphstore, tables
+
+# load configs
+with Path("./config.json").open() as f:
+    config = json.load(f)
+
+# configure multiprocessing
+cpus = mp.cpu_count() if config["cpus"] == 0 else config["cpus"]
+
+
+# return graph nodes' IDs and x-y coordinates, and edges' u, v, and length
+def get_graph_arrays(fp):
+    nodes, edges = graphstore.load_arrays(fp, node_attrs=["x", "y"], edge_attrs=["length"])
+    del edges["key"]
+    return nodes, edges
+
+
+# extract all nodes and coordinates and all edges from all graphs
+filepaths = sorted(Path(config["models_npz_path"]).glob("*/*"))
+print(ox.ts(), f"Loading nodes and edges from {len(filepaths):,} graph files with {cpus} CPUs")
+with mp.get_context().Pool(cpus) as pool:
+    results = pool.map(get_graph_arrays, filepaths)
+osmids = np.concatenate([nodes["osmid"] for nodes, _ in results])
+xs = np.concatenate([nodes["x"] for nodes, _ in results])
+ys = np.concatenate([nodes["y"] for nodes, _ in results])
+us = np.concatenate([edges["u"] for _, edges in results])
+vs = np.concatenate([edges["v"] for _, edges in results])
+lengths = np.concatenate([edges["length"] for _, edges in results])
+results = None
+print(ox.ts(), f"Loaded {len(osmids):,} total nodes and {len(us):,} total edges")
+
+# nodes shared by overlapping urban centers appear in multiple graphs, so
+# deduplicate by osmid to get one global table of every node's coordinates
+osmids, pos = np.unique(osmids, return_index=True)
+save_path = config["nodes_table_path"]
+tables.save_table(save_path, {"osmid": osmids, "x": xs[pos], "y": ys[pos]})
+print(ox.ts(), f"Saved {len(osmids):,} unique nodes to {save_path!r}")
+
+# likewise deduplicate edges by u, v, and length to get one global table of
+# every edge's (u, v, length), the inputs to its grade
+edges = {"u": us, "v": vs, "length": lengths}
+edges = tables.drop_duplicates(edges, key=fusion.edge_key)
+save_path = config["edges_table_path"]
+tables.save_table(save_path, edges, key=fusion.edge_key)
+print(ox.ts(), f"Saved {len(edges['u']):,} unique edges to {save_path!r}")
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+
+import json
+from pathlib import Path
+
+import geopandas as gpd
+import osmnx as ox
+from snm import tables, tiles
+
+# load configs
+with Path("./config.json").open() as f:
+    config = json.load(f)
+
+# the global grid has this many 1-degree tiles with any land in them
+land_tiles = 22_000
+
+# get the urban centers' bounding boxes and the global node table
+bboxes = gpd.read_file(config["uc_gpkg_path"]).bounds.to_numpy()
+nodes = tables.load_table(config["nodes_table_path"], columns=["x", "y"])
+msg = f"Planning DEM tiles for {len(bboxes):,} urban centers and {len(nodes['x']):,} nodes"
+print(ox.ts(), msg)
+
+# plan the tiles that urban centers or their nodes touch, so only these get
+# downloaded and built into the VRTs
+plan = tiles.plan_tiles(bboxes, nodes["x"], nodes["y"])
+save_path = Path(config["gdem_tiles_path"])
+save_path.parent.mkdir(parents=True, exist_ok=True)
+plan.to_csv(save_path, index=False, encoding="utf-8")
+pct = 100 * len(plan) / land_tiles
+msg = f"Saved plan of {len(plan):,} DEM tiles (~{pct:0.1f}% of land tiles) to {str(save_path)!r}"
+print(ox.ts(), msg)
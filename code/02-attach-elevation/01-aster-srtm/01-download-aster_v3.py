@@ -1,40 +1,34 @@
 #!/usr/bin/env python
 
 import json
-import multiprocessing as mp
 from pathlib import Path
 
 import osmnx as ox
 import pandas as pd
-import requests
+import rasterio
+from rasterio.errors import RasterioError
 
 # username/password for https://www.earthdata.nasa.gov/
 from keys import pwd, usr
+from snm import downloader, tiles
 
 # load configs
 with Path("./config.json").open() as f:
     config = json.load(f)
 
-# configurations
-cpus = 4
+# configurations: download with this many threads, each reusing one session
+threads = 8
 urls_path = config["gdem_aster_urls_path"]
 dl_path = Path(config["gdem_aster_path"])
 dl_path.mkdir(parents=True, exist_ok=True)
 
 
-def download(url, usr=usr, pwd=pwd, dl_path=dl_path) -> None:
-    with requests.Session() as session:
-        filename = Path(url).name
-        session.trust_env = False
-        request = session.request("get", url, auth=(usr, pwd))
-        response = session.get(request.url, auth=(usr, pwd))
-
-        if response.ok:
-            filepath = dl_path / filename
-            with filepath.open(mode="wb") as f:
-                f.write(response.content)
-        else:
-            print(response.status_code, response.text)
+# check a downloaded GeoTIFF's integrity by opening it and reading every block
+# of its elevation band, which fails on a truncated or corrupt file
+def check_tif(filepath) -> None:
+    with rasterio.open(filepath) as src:
+        for _, window in src.block_windows(1):
+            src.read(1, window=window)
 
 
 # get all the URLs pointing at dem tif files
@@ -42,20 +36,33 @@ urls = pd.read_csv(urls_path, header=None).iloc[:, 0].sort_values()
 urls = urls[urls.str.endswith("_dem.tif")]
 print(ox.ts(), f"There are {len(urls):,} total ASTER URLs")
 
+# only download the tiles in the tile plan
+urls = tiles.filter_planned(urls, tiles.load_plan(config["gdem_tiles_path"]))
+print(ox.ts(), f"There are {len(urls):,} ASTER URLs in the tile plan")
+
 # how many files have already been downloaded?
 existing = {path.name for path in dl_path.glob("*.tif")}
 print(ox.ts(), f"There are {len(existing):,} files already downloaded")
 
 # how many files are remaining to download?
 urls = [url for url in urls if Path(url).name not in existing]
-print(ox.ts(), f"Downloading {len(urls):,} URLs with {cpus} CPUs")
+print(ox.ts(), f"Downloading {len(urls):,} URLs with {threads} threads")
 
-# multiprocess the queue
-if len(urls) > 0:
-    args = ((url,) for url in urls)
-    with mp.get_context().Pool(cpus) as pool:
-        pool.starmap_async(download, args).get()
+# stream each file to disk, resuming any interrupted downloads. the URL list
+# has no checksums, so each GeoTIFF is checked by reading it, and a corrupt one
+# is deleted so it's downloaded again on the next run
+items = [(url, dl_path / Path(url).name) for url in urls]
+results = downloader.download_all(items, (usr, pwd), threads)
+for url, filepath in items:
+    if isinstance(results[url], Exception):
+        print(ox.ts(), f"Failed to download {url}: {results[url]}")
+        continue
+    try:
+        check_tif(filepath)
+    except RasterioError as e:
+        print(ox.ts(), f"Failed to check {filepath}: {e}")
+        filepath.unlink()
 
-file_count = len(list(dl_path.glob("*")))
+file_count = len(list(dl_path.glob("*.tif")))
 msg = f"Finished: {file_count:,} files in {str(dl_path)!r}"
 print(ox.ts(), msg)
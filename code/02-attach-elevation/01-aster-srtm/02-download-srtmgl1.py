@@ -1,67 +1,69 @@
 #!/usr/bin/env python
 
 import json
-import multiprocessing as mp
 from pathlib import Path
-from zipfile import ZipFile
+from zipfile import BadZipFile, ZipFile
 
 import osmnx as ox
 import pandas as pd
-import requests
 
 # username/password for https://www.earthdata.nasa.gov/
 from keys import pwd, usr
+from snm import downloader, tiles
 
 # load configs
 with Path("./config.json").open() as f:
     config = json.load(f)
 
-# configurations
-cpus = 4
+# configurations: download with this many threads, each reusing one session
+threads = 8
 urls_path = config["gdem_srtm_urls_path"]
 dl_path = Path(config["gdem_srtm_path"])
 dl_path.mkdir(parents=True, exist_ok=True)
 
 
-def download(url, usr=usr, pwd=pwd, dl_path=dl_path) -> None:
-    with requests.Session() as session:
-        filename = Path(url).name
-        session.trust_env = False
-        request = session.request("get", url, auth=(usr, pwd))
-        response = session.get(request.url, auth=(usr, pwd))
-
-        if response.ok:
-            filepath = dl_path / filename
-            with filepath.open(mode="wb") as f:
-                f.write(response.content)
-
-            with ZipFile(filepath, "r") as z:
-                z.extractall(dl_path)
-            filepath.unlink()
-
-        else:
-            print(response.status_code, response.text)
+# check a downloaded zip file's integrity by reading its contents and checking
+# their CRCs. zips are kept compressed and read in place via GDAL's /vsizip/
+def check_zip(filepath) -> None:
+    with ZipFile(filepath, "r") as z:
+        bad_name = z.testzip()
+    if bad_name is not None:
+        msg = f"Bad CRC for {bad_name!r}"
+        raise BadZipFile(msg)
 
 
 # get all the URLs
 urls = pd.read_csv(urls_path, header=None).iloc[:, 0].sort_values()
 print(ox.ts(), f"There are {len(urls):,} total SRTM URLs")
 
-# how many files have already been downloaded?
-existing = {fp.name.split(".")[0] for fp in dl_path.glob("*.hgt")}
+# only download the tiles in the tile plan
+urls = tiles.filter_planned(urls, tiles.load_plan(config["gdem_tiles_path"]))
+print(ox.ts(), f"There are {len(urls):,} SRTM URLs in the tile plan")
+
+# how many files have already been downloaded? (tiles downloaded by earlier
+# versions of this script were extracted to hgt files)
+existing = {fp.name.split(".")[0] for fp in [*dl_path.glob("*.zip"), *dl_path.glob("*.hgt")]}
 print(ox.ts(), f"There are {len(existing):,} files already downloaded")
 
 # how many files are remaining to download?
-tiles = (Path(url).name.split(".")[0] for url in urls)
-remaining = [url for url, tile in zip(urls, tiles, strict=True) if tile not in existing]
-print(ox.ts(), f"Downloading {len(remaining):,} URLs with {cpus} CPUs")
-
-# multiprocess the queue
-if len(remaining) > 0:
-    args = ((url,) for url in remaining)
-    with mp.get_context().Pool(cpus) as pool:
-        pool.starmap_async(download, args).get()
-
-file_count = len(list(dl_path.glob("*")))
+tile_names = (Path(url).name.split(".")[0] for url in urls)
+remaining = [url for url, tile in zip(urls, tile_names, strict=True) if tile not in existing]
+print(ox.ts(), f"Downloading {len(remaining):,} URLs with {threads} threads")
+
+# stream each zip file to disk, resuming any interrupted downloads. a corrupt
+# zip is deleted so it's downloaded again on the next run
+items = [(url, dl_path / Path(url).name) for url in remaining]
+results = downloader.download_all(items, (usr, pwd), threads)
+for url, filepath in items:
+    if isinstance(results[url], Exception):
+        print(ox.ts(), f"Failed to download {url}: {results[url]}")
+        continue
+    try:
+        check_zip(filepath)
+    except BadZipFile as e:
+        print(ox.ts(), f"Failed to check {filepath}: {e}")
+        filepath.unlink()
+
+file_count = len(list(dl_path.glob("*.zip")))
 msg = f"Finished: {file_count:,} files in {str(dl_path)!r}"
 print(ox.ts(), msg)
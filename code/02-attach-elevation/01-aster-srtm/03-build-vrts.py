@@ -4,28 +4,46 @@ import json
 from pathlib import Path
 
 import osmnx as ox
+import pandas as pd
+from snm import elevation, graphstore, tiles
 
 with Path("./config.json").open() as f:
     config = json.load(f)
-ox.settings.cache_folder = config["osmnx_cache_path"]
 aster_path = Path(config["gdem_aster_path"])
 srtm_path = Path(config["gdem_srtm_path"])
+plan = tiles.load_plan(config["gdem_tiles_path"])
 
-# get one sample graph, just to build the VRTs for the first time
-filepath = sorted(Path(config["models_graphml_path"]).glob("*/*"))[0]
-G = ox.io.load_graphml(filepath)
 
-# build VRT files for the SRTM and ASTER raster files
-args = [("srtm", srtm_path, "*.hgt"), ("aster", aster_path, "*.tif")]
-for data_source, rasters_path, glob_pattern in args:
-    rasters = sorted(rasters_path.glob(glob_pattern))
-    msg = f"Building VRT for {len(rasters):,} files from {str(rasters_path)!r}"
+# get the SRTM rasters: zipped tiles read in place via /vsizip/, plus any tiles
+# extracted to hgt files by earlier versions of the download script
+def get_srtm_rasters(rasters_path):
+    rasters = sorted(rasters_path.glob("*.hgt"))
+    extracted = {tiles.find_tile_name(fp) for fp in rasters}
+    for zip_path in sorted(rasters_path.glob("*.zip")):
+        if tiles.find_tile_name(zip_path) not in extracted:
+            rasters.extend(elevation.get_zip_raster_paths(zip_path))
+    return rasters
+
+
+# build VRT files for the SRTM and ASTER raster files in the tile plan, once,
+# for all graphs
+args = [
+    ("srtm", srtm_path, get_srtm_rasters(srtm_path), config["gdem_srtm_vrt_path"]),
+    ("aster", aster_path, sorted(aster_path.glob("*.tif")), config["gdem_aster_vrt_path"]),
+]
+
+# get one sample graph, just to check the VRTs return sensible values
+filepath = sorted(Path(config["models_npz_path"]).glob("*/*"))[0]
+nodes, _ = graphstore.load_arrays(filepath, node_attrs=["x", "y"], edge_attrs=[])
+elevs = pd.DataFrame(index=nodes["osmid"])
+
+for data_source, rasters_path, all_rasters, vrt_path in args:
+    rasters = tiles.filter_planned(all_rasters, plan)
+    msg = f"Building VRT for {len(rasters):,} files from {str(rasters_path)!r} at {vrt_path!r}"
     print(ox.ts(), msg)
-    G = ox.elevation.add_node_elevations_raster(G, rasters)
-    for _, data in G.nodes(data=True):
-        data[f"elevation_{data_source}"] = data.pop("elevation")
+    elevation.get_vrt(vrt_path, rasters)
+    values, _ = elevation.sample_raster(vrt_path, nodes["x"], nodes["y"])
+    elevs[f"elevation_{data_source}"] = values
 
 # show descriptive stats for the elevation values in this one city
-cols = ["elevation_aster", "elevation_srtm"]
-stats = ox.convert.graph_to_gdfs(G, edges=False)[cols].describe()
-print(ox.ts(), stats)
+print(ox.ts(), elevs.describe())
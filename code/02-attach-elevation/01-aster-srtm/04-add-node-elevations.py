@@ -4,43 +4,77 @@ import json
 import multiprocessing as mp
 from pathlib import Path
 
-import networkx as nx
+import geopandas as gpd
+import numpy as np
 import osmnx as ox
+import pandas as pd
+from snm import elevation, tables, tiles
 
 with Path("./config.json").open() as f:
     config = json.load(f)
-ox.settings.cache_folder = config["osmnx_cache_path"]
 
 # configure multiprocessing
 cpus = mp.cpu_count() if config["cpus"] == 0 else config["cpus"]
 
-# get the paths of all the ASTER/SRTM rasters
-srtm_files = sorted(Path(config["gdem_srtm_path"]).glob("*.hgt"))
-aster_files = sorted(Path(config["gdem_aster_path"]).glob("*.tif"))
-attr_rasters = [("elevation_aster", aster_files), ("elevation_srtm", srtm_files)]
-
-
-def process_graph(filepath, attr_rasters=attr_rasters) -> None:
-    G = ox.io.load_graphml(filepath)
-    for attr, rasters in attr_rasters:
-        # if not all graph nodes have this attr, then add elevation from
-        # raster files, rename elevation -> this attr name, then save graph
-        if set(G.nodes) != set(nx.get_node_attributes(G, attr)):
-            try:
-                G = ox.elevation.add_node_elevations_raster(G, rasters, cpus=1)
-                for _, data in G.nodes(data=True):
-                    data[attr] = data.pop("elevation")
-                ox.io.save_graphml(G, filepath)
-            except ValueError as e:
-                print(e, filepath, attr)
-
-
-# set up the args
-filepaths = sorted(Path(config["models_graphml_path"]).glob("*/*"))
-args = ((fp,) for fp in filepaths)
-
-# multiprocess the queue
-print(ox.ts(), f"Adding elevation to {len(filepaths):,} graphs with {cpus} CPUs")
-with mp.get_context().Pool(cpus) as pool:
-    pool.starmap_async(process_graph, args).get()
-print(ox.ts(), f"Finished adding elevation to {len(filepaths):,} graphs")
+# how many batches of tiles to make per CPU, so workers stay evenly loaded
+batches_per_cpu = 4
+
+# get the paths of the ASTER/SRTM VRTs built in the previous step
+attr_vrts = [
+    ("elevation_aster", Path(config["gdem_aster_vrt_path"])),
+    ("elevation_srtm", Path(config["gdem_srtm_vrt_path"])),
+]
+
+# load the global table of every graph's (deduplicated) node coordinates
+nodes = tables.load_table(config["nodes_table_path"])
+print(ox.ts(), f"Loaded {len(nodes['osmid']):,} unique nodes")
+
+# map each urban center's bounding box to the DEM tiles it covers, so tiles
+# that share an urban center get grouped into the same batch
+bboxes = gpd.read_file(config["uc_gpkg_path"]).bounds.to_numpy()
+tile_groups = tiles.get_tile_groups(bboxes)
+
+# cut the tiles into batches (weighted by node count) in hilbert curve order
+# then get each batch's node positions in the node table
+tile_ids = tiles.get_tile_ids(nodes["x"], nodes["y"])
+unique_tile_ids, tile_counts = np.unique(tile_ids, return_counts=True)
+n_batches = cpus * batches_per_cpu
+tile_batches = tiles.make_batches(unique_tile_ids, tile_counts, tile_groups, n_batches)
+node_batches = tile_batches[tile_ids]
+order = np.argsort(node_batches, kind="stable")
+splits = np.flatnonzero(np.diff(node_batches[order])) + 1
+batches = np.split(order, splits)
+msg = f"Split {len(unique_tile_ids):,} DEM tiles into {len(batches):,} batches"
+print(ox.ts(), msg)
+
+# sample each DEM source's VRT at every node, then save as one global table
+results = {"osmid": nodes["osmid"]}
+reports = []
+for attr, vrt_path in attr_vrts:
+    msg = f"Sampling {attr!r} from {str(vrt_path)!r} in {len(batches):,} batches with {cpus} CPUs"
+    print(ox.ts(), msg)
+    args = ((vrt_path, nodes["x"][batch], nodes["y"][batch]) for batch in batches)
+    with mp.get_context().Pool(cpus) as pool:
+        values_stats = pool.starmap_async(elevation.sample_raster, args).get()
+    results[attr] = np.full(len(order), np.nan)
+    for batch, (values, stats) in zip(batches, values_stats, strict=True):
+        results[attr][batch] = values
+        reports.append(pd.DataFrame(stats).assign(source=attr))
+    pct = 100 * np.isnan(results[attr]).mean()
+    print(ox.ts(), f"Finished {attr!r}, {pct:0.2f}% of nodes have no value")
+
+save_path = config["elevation_raster_path"]
+tables.save_table(save_path, results)
+print(ox.ts(), f"Saved {len(order):,} node elevations to {save_path!r}")
+
+# report the bytes read per tile and the (modeled) block cache hit rate of each
+# source, counting only hits within a batch since each batch opens its own VRT
+report = pd.concat(reports, ignore_index=True)
+report_path = Path(config["elevation_raster_report_path"])
+report.to_csv(report_path, index=False, encoding="utf-8")
+for source, df in report.groupby("source"):
+    hit_rate = df["blocks_cached"].sum() / df["blocks_read"].sum()
+    mb_read = df["bytes_read"].sum() / 1e6
+    msg = f"{source!r}: read {mb_read:,.0f} MB from {df['tile'].nunique():,} tiles"
+    print(ox.ts(), f"{msg}, {100 * hit_rate:0.1f}% block cache hit rate")
+print(ox.ts(), f"Saved per-tile read report to {str(report_path)!r}")
@@ -1,95 +1,59 @@
 #!/usr/bin/env python
 
-import itertools
 import json
-import math
-import multiprocessing as mp
 from pathlib import Path
 
 import numpy as np
 import osmnx as ox
-from scipy.spatial import cKDTree
+from snm import partition, tables
 
 # google usage limit: 512 locations per request
 coords_per_request = 512
 
+# split nodes into regions separated by at least this many degrees of empty
+# space, so no cluster (and request) spans the gap between distant regions
+region_cell_degrees = 0.05
+
 # load configs
 with Path("./config.json").open() as f:
     config = json.load(f)
 
-# configure multiprocessing
-cpus = mp.cpu_count() if config["cpus"] == 0 else config["cpus"]
-
-graphml_folder = Path(config["models_graphml_path"])
-save_folder = Path(config["elevation_nodeclusters_path"])
-
-
-# return graph nodes' x-y coordinates
-def get_graph_nodes(fp):
-    return ox.convert.graph_to_gdfs(ox.io.load_graphml(fp), edges=False, node_geometry=False)[
-        ["x", "y"]
-    ]
-
-
-# get an iterator of points around the perimeter of nodes' coordinates
-def get_perimeter_points(nodes):
-    tl = np.array((nodes["x"].min(), nodes["y"].max()))
-    t = np.array((nodes["x"].mean(), nodes["y"].max()))
-    tr = np.array((nodes["x"].max(), nodes["y"].max()))
-    r = np.array((nodes["x"].max(), nodes["y"].mean()))
-    br = np.array((nodes["x"].max(), nodes["y"].min()))
-    b = np.array((nodes["x"].mean(), nodes["y"].min()))
-    bl = np.array((nodes["x"].min(), nodes["y"].min()))
-    l = np.array((nodes["x"].min(), nodes["y"].mean()))  # noqa: E741
-    points = [tl, t, tr, r, br, b, bl, l]
-    multiplier = math.ceil(len(nodes) / coords_per_request / len(points))
-    return iter(points * multiplier)
-
-
-# group the nodes into nearest-neighbor clusters
-def get_clusters(nodes):
-    nodes_remaining = nodes
-    perimeter_points = get_perimeter_points(nodes)
-    clusters = []
-    while len(nodes_remaining) > 0:
-        if len(nodes_remaining) <= coords_per_request:
-            labels = nodes_remaining.index
-        else:
-            # find node nearest to next perimeter point, then get a cluster of
-            # its nearest `coords_per_request` neighbors around it
-            tree = cKDTree(nodes_remaining[["x", "y"]])
-            _, start_pos = tree.query(next(perimeter_points), k=1)
-            start_point = nodes_remaining.iloc[start_pos][["x", "y"]]
-            _, pos = tree.query(start_point, k=coords_per_request)
-            labels = nodes_remaining.iloc[pos].index
-        clusters.append(labels)
-        nodes_remaining = nodes_remaining.drop(labels)
-
-    # ensure each node has a cluster and each cluster is smaller than max size
-    assert set(itertools.chain.from_iterable(clusters)) == set(nodes.index)
-    for cluster in clusters:
-        assert len(cluster) <= coords_per_request
-
-    return clusters
-
-
-# load graph, cluster nodes, and save to disk
-def cluster_nodes(fp) -> None:
-    nodes = get_graph_nodes(fp)
-    clusters = get_clusters(nodes)
-    for count, cluster in enumerate(clusters):
-        nodes.loc[cluster, "cluster"] = f"{fp.stem}_{count}"
-
-    save_path = save_folder / (fp.stem + ".csv")
-    save_path.parent.mkdir(parents=True, exist_ok=True)
-    nodes.to_csv(save_path, index=True, encoding="utf-8")
-    msg = f"Clustered {fp.stem!r} {len(nodes):,} nodes into {len(clusters):,} clusters"
-    print(ox.ts(), msg, flush=True)
-
-
-filepaths = sorted(graphml_folder.glob("*/*.graphml"))
-args = [(fp,) for fp in filepaths if not (save_folder / (fp.stem + ".csv")).is_file()]
-print(ox.ts(), f"Clustering nodes from {len(args):,} remaining GraphML files")
-
-with mp.get_context().Pool(cpus) as pool:
-    pool.starmap_async(cluster_nodes, args).get()
+# load the global table of every graph's (deduplicated) node coordinates, so
+# nodes shared by overlapping urban centers are only clustered (and requested)
+# once and clusters aren't split up where urban centers meet
+nodes = tables.load_table(config["nodes_table_path"])
+print(ox.ts(), f"Loaded {len(nodes['osmid']):,} unique nodes")
+
+# split nodes into regions separated by empty space
+regions = partition.get_regions(nodes["x"], nodes["y"], region_cell_degrees)
+order = np.argsort(regions, kind="stable")
+splits = np.flatnonzero(np.diff(regions[order])) + 1
+print(ox.ts(), f"Split nodes into {len(splits) + 1:,} separate regions")
+
+# cluster each region's nodes in one pass, labeling each cluster as it's cut
+labels = np.full(len(nodes["osmid"]), -1, dtype=np.int64)
+clusters = []
+for region in np.split(order, splits):
+    x = nodes["x"][region]
+    y = nodes["y"][region]
+    for pos in partition.get_clusters(x, y, coords_per_request):
+        labels[region[pos]] = len(clusters)
+        clusters.append(region[pos])
+
+# ensure each node has a cluster and each cluster is smaller than max size
+assert (labels >= 0).all()
+assert all(len(pos) <= coords_per_request for pos in clusters)
+full = sum(len(pos) == coords_per_request for pos in clusters)
+print(ox.ts(), f"Clustered nodes into {len(clusters):,} clusters, {full:,} of them full")
+
+# report cluster compactness to check clusters are spatially tight
+radii = partition.get_compactness(nodes["x"], nodes["y"], clusters)
+median, p99 = np.percentile(radii, [50, 99])
+msg = f"Cluster RMS radius median {median:,.0f} m, 99th percentile {p99:,.0f} m"
+print(ox.ts(), f"{msg}, max {radii.max():,.0f} m")
+
+# save the node clusters as one global table
+save_path = config["elevation_nodeclusters_path"]
+columns = {"osmid": nodes["osmid"], "x": nodes["x"], "y": nodes["y"], "cluster": labels}
+tables.save_table(save_path, columns)
+print(ox.ts(), f"Saved node clusters to {save_path!r}")
@@ -2,18 +2,21 @@
 
 import json
 import multiprocessing as mp
-from itertools import batched
+from itertools import batched, chain
 from pathlib import Path
+from urllib.parse import unquote
 
+import numpy as np
 import osmnx as ox
 import pandas as pd
 from keys import api_keys
+from snm import polyline, tables
 
 # google usage limit: 512 locations and 16384 characters per request
-precision = 5
 coords_per_request = 512
 requests_per_key = 39000
 chars_per_url = 16384
+cost_per_request = 0.005  # USD
 url_template = (
     "https://maps.googleapis.com/maps/api/elevation/json?locations={locations}&key={{key}}"
 )
@@ -25,32 +28,50 @@ with Path("./config.json").open() as f:
 # configure multiprocessing
 cpus = mp.cpu_count() if config["cpus"] == 0 else config["cpus"]
 
-# set up the args
-filepaths = sorted(Path(config["elevation_nodeclusters_path"]).glob("*.csv"))
-args = ((fp,) for fp in filepaths)
-print(ox.ts(), f"Loading node clusters from {len(filepaths):,} files with {cpus} CPUs")
+# load the global table of (deduplicated) nodes and their clusters
+df = pd.DataFrame(tables.load_table(config["elevation_nodeclusters_path"])).set_index("osmid")
+print(ox.ts(), f"There are {len(df):,} unique nodes in {df['cluster'].nunique():,} clusters")
 
-# extract all nodes and coordinates from all graphs
-with mp.get_context().Pool(cpus) as pool:
-    result = pool.starmap_async(pd.read_csv, args)
-    df = pd.concat(result.get(), ignore_index=True).set_index("osmid").sort_index()
 
-df = df[~df.index.duplicated()]
-print(ox.ts(), f"There are {len(df):,} unique nodes")
+# the most characters each URL's locations parameter can have, given the
+# URL template and the longest API key
+max_locations_chars = chars_per_url - len(url_template.format(locations="")) + len("{key}")
+max_locations_chars -= max(len(api_key) for api_key in api_keys)
 
 
+# pack a cluster's locations into as few URLs as possible, checking that the
+# encoded polyline form round-trips to the same coordinates
 def url_add_locations(_, cluster):
     assert len(cluster) <= coords_per_request
-    strings = (
-        f"{y:.{precision}f},{x:.{precision}f}"
-        for y, x in zip(cluster["y"], cluster["x"], strict=True)
-    )
-    locations = "|".join(strings)
-    return tuple(cluster.index), url_template.format(locations=locations)
+    lats = cluster["y"].to_numpy()
+    lngs = cluster["x"].to_numpy()
+    args = (lats, lngs, coords_per_request, max_locations_chars)
+    urls = []
+    start = 0
+    for count, locations in polyline.pack_locations(*args):
+        end = start + count
+        if locations.startswith("enc"):
+            lats_decoded, lngs_decoded = polyline.decode(unquote(locations)[len("enc:") :])
+            assert np.array_equal(polyline.to_ints(lats_decoded), polyline.to_ints(lats[start:end]))
+            assert np.array_equal(polyline.to_ints(lngs_decoded), polyline.to_ints(lngs[start:end]))
+        nodes = tuple(cluster.index[start:end])
+        urls.append((nodes, url_template.format(locations=locations)))
+        start = end
+    return urls
 
 
 with mp.get_context().Pool(cpus) as pool:
-    urls = pool.starmap_async(url_add_locations, df.groupby("cluster")).get()
+    results = pool.starmap_async(url_add_locations, df.groupby("cluster")).get()
+urls = list(chain.from_iterable(results))
+
+# report the projected request count and cost per API key before sending any
+encoded_count = sum("locations=enc" in url for _, url in urls)
+msg = f"Packed {len(df):,} locations into {len(urls):,} URLs ({encoded_count:,} polyline-encoded)"
+print(ox.ts(), msg)
+for api_key, nodes_urls in zip(api_keys, batched(urls, requests_per_key), strict=False):
+    cost = len(nodes_urls) * cost_per_request
+    msg = f"Projected {len(nodes_urls):,} requests costing ${cost:,.2f}"
+    print(ox.ts(), f"{msg} with key {api_key!r}")
 
 # then add API keys to URLs, `requests_per_key` at a time
 urls_with_keys = []
@@ -1,87 +1,89 @@
 #!/usr/bin/env python
 
 import json
-import multiprocessing as mp
-import time
 from ast import literal_eval
 from pathlib import Path
 
 import osmnx as ox
 import pandas as pd
-import requests
+from snm import fetcher, httpcache
 
 # load configs
 with Path("./config.json").open() as f:
     config = json.load(f)
 
-# configure multiprocessing
-cpus = mp.cpu_count() if config["cpus"] == 0 else config["cpus"]
+# limit each API key's request rate and how many requests are in flight at once
+requests_per_second = 50
+concurrency = 32
+
+# save API responses to the cache in batches of this many
+flush_count = 100
 
-ox.settings.use_cache = True
 ox.settings.log_console = False
 ox.settings.log_file = True
 ox.settings.logs_folder = config["osmnx_log_path"]
-ox.settings.cache_folder = config["osmnx_cache_path"]
-
-
-def get_elevations(nodes, url, pause=0):
-    # check if this request is already in the cache
-    cached_response_json = ox._http._retrieve_from_cache(url)
-    if cached_response_json is not None:
-        response_json = cached_response_json
-        ox.log(f"Got URL from cache: {url}")
-
-    # otherwise, request the elevations from the API
-    else:
-        try:
-            ox.log(f"Requesting node elevations from API: {url}")
-            time.sleep(pause)
-            response = requests.get(url)
-            assert response.ok
-            response_json = response.json()
-            ox._http._save_to_cache(url, response_json, response.ok)
-        except Exception as e:
-            msg = f"Response: {response.status_code}, {response.reason}, {response.text}, {url}"
-            print(ox.ts(), msg, e)
-            return None
-
-    # extract the results and, if any, return as dataframe
-    results = response_json["results"]
-    if results is None:
-        return None
-    df = pd.DataFrame(results, index=literal_eval(nodes))
-    if "elevation" not in df.columns:
-        cache_filepath = ox._http._resolve_cache_filepath(url)
-        print(ox.ts(), f"No elevation results in {str(cache_filepath)!r}")
-        return None
+http_cache_path = config["http_cache_path"]
+
+
+# extract a response's results as a dataframe of elevations indexed by osmid
+def get_elevations(nodes, response_json):
+    df = pd.DataFrame(response_json["results"], index=nodes)
     return df[["elevation", "resolution"]].round(2)
 
 
-# load the URLs and count how many we already have responses cached for
+# load the URLs and check which we already have responses cached for
 urls = pd.read_csv(config["elevation_google_urls_path"])
-count_cached = 0
-count_uncached = 0
-for url in urls["url"]:
-    if ox._http._check_cache(url) is None:
-        count_uncached += 1
-    else:
-        count_cached += 1
-
-msg = f"Getting {count_cached:,} URLs from cache and {count_uncached:,} from API using {cpus} CPUs"
-print(ox.ts(), msg)
-
-# uncomment this if you want to actually hit the API (and pay for it)
-assert count_uncached == 0
-
-# download elevations from Google API in parallel
-with mp.get_context().Pool(cpus) as pool:
-    args = ((nodes_url.nodes, nodes_url.url) for nodes_url in urls.itertuples())
-    result = pool.starmap_async(get_elevations, args)
-    df = pd.concat(result.get(), ignore_index=False).sort_index()
-
-# save to disk
+urls["nodes"] = urls["nodes"].map(literal_eval)
+cached = httpcache.exists(http_cache_path, urls["url"])
+
+# stream node elevations to disk as we get them: first from the cache, then
+# from the API, saving the API responses to the cache in batches as they arrive
 save_path = Path(config["elevation_google_elevations_path"])
 save_path.parent.mkdir(parents=True, exist_ok=True)
-df.index.name = "osmid"
-df.to_csv(save_path, index=True, encoding="utf-8")
-print(ox.ts(), f"Saved {len(df):,} node elevations to disk at {save_path}")
+nodes_by_url = dict(zip(urls["url"], urls["nodes"], strict=True))
+requeued = set()
+failed = []
+pending = []
+with save_path.open("w", encoding="utf-8", newline="") as f:
+    f.write("osmid,elevation,resolution\n")
+    for url, response_json in httpcache.read(http_cache_path, urls.loc[cached, "url"]):
+        # the cache may hold responses that aren't OK or are missing results
+        # (like INVALID_REQUEST ones imported from the old OSMnx cache), so
+        # request those again from the API
+        nodes = nodes_by_url[url]
+        if not fetcher.is_complete(response_json, len(nodes)):
+            status = response_json.get("status") if isinstance(response_json, dict) else None
+            ox.log(f"Requeuing cached response with status {status!r} or missing results: {url}")
+            requeued.add(url)
+            continue
+        get_elevations(nodes, response_json).to_csv(f, header=False)
+
+    uncached = [not c or url in requeued for c, url in zip(cached, urls["url"], strict=True)]
+    uncached_urls = urls[uncached].reset_index(drop=True)
+    count_cached = sum(cached) - len(requeued)
+    count_uncached = len(uncached_urls)
+    msg = f"Got {count_cached:,} URLs from cache, getting {count_uncached:,} from API"
+    print(ox.ts(), msg)
+
+    # uncomment this if you want to actually hit the API (and pay for it)
+    assert count_uncached == 0
+
+    def on_result(i, response_json, attempts) -> None:
+        nodes, url = uncached_urls.loc[i, ["nodes", "url"]]
+        if response_json is None:
+            ox.log(f"Failed to get URL after {attempts} attempts: {url}")
+            failed.append(url)
+            return
+        pending.append((url, response_json))
+        if len(pending) >= flush_count:
+            httpcache.write(http_cache_path, pending)
+            pending.clear()
+        get_elevations(nodes, response_json).to_csv(f, header=False)
+
+    items = [(len(nodes), url) for nodes, url in uncached_urls.itertuples(index=False)]
+    try:
+        fetcher.fetch(items, on_result, requests_per_second, concurrency)
+    finally:
+        httpcache.write(http_cache_path, pending)
+
+print(ox.ts(), f"Saved node elevations to disk at {str(save_path)!r}, {len(failed):,} URLs failed")
@@ -1,13 +1,12 @@
 #!/usr/bin/env python
 
 import json
+import math
 import multiprocessing as mp
-from os.path import getsize
 from pathlib import Path
 
-import igraph as ig
-import networkx as nx
 import osmnx as ox
+from snm import centrality, csr, graphstore, scheduler, sidecars
 
 # we will calculate length-weighted betweenness centralities
 WEIGHT_ATTR = "length"
@@ -18,57 +17,63 @@ with Path("./config.json").open() as f:
 
 # configure multiprocessing
 cpus = mp.cpu_count() if config["cpus"] == 0 else config["cpus"]
+memory_budget = config["memory_budget_gb"]
 
 # configure where to find saved graphs and where to save results
-graphml_folder = Path(config["models_graphml_path"])
-save_folder = Path(config["node_bc_path"])
-save_folder.mkdir(parents=True, exist_ok=True)
+npz_folder = Path(config["models_npz_path"])
+attrs_root = Path(config["models_attrs_path"])
 
+# optionally estimate bc from a sample of source nodes, for graphs with more
+# nodes than the threshold (0 to always calculate exact bc)
+sample_threshold = config["bc_sample_threshold"]
+sample_size = config["bc_sample_size"]
 
-def convert_igraph(G_nx, weight_attr):
-    # relabel graph nodes as integers for igraph to ingest
-    G_nx = nx.relabel.convert_node_labels_to_integers(G_nx)
+# graphs with more nodes than this get their source nodes split across all the
+# CPUs, one graph at a time, instead of running one graph per CPU
+parallel_threshold = config["bc_parallel_threshold"]
 
-    # create igraph graph and add nodes/edges
-    G_ig = ig.Graph(directed=True)
-    G_ig.add_vertices(G_nx.nodes)
-    G_ig.add_edges(G_nx.edges(keys=False))
 
-    # add edge weights and ensure values >0 for igraph
-    weights = nx.get_edge_attributes(G_nx, weight_attr).values()
-    weights = (0.001 if w == 0 else w for w in weights)
-    G_ig.es[weight_attr] = list(weights)
-    return G_ig
-
-
-def calculate_bc(fp, save_path, weight_attr=WEIGHT_ATTR) -> None:
+def calculate_bc(fp, save_path, weight_attr=WEIGHT_ATTR, cpus=1) -> None:
     print(ox.ts(), f"{str(fp)!r}")
 
-    # load graphml, convert to igraph, calculate bc, and normalize values
-    G_nx = ox.io.load_graphml(fp)
-    bc_raw = convert_igraph(G_nx, weight_attr).betweenness(weights=weight_attr)
-    bc_norm = (x / (len(G_nx) - 1) / (len(G_nx) - 2) for x in bc_raw)
-    osmid_bc = dict(zip(G_nx.nodes, bc_norm, strict=True))
+    # load edge arrays then calculate normalized bc
+    osmids, u, v, weights = csr.load_edges(fp, weight_attr)
+    n = len(osmids)
+    k = sample_size if 0 < sample_threshold < n else None
+    edges = {"u": u, "v": v, "weights": weights}
+    bc_norm, k, error = centrality.calculate_bc(n, edges, weight_attr, k, cpus)
 
-    # set graph node attributes and re-save graphml file
-    nx.set_node_attributes(G_nx, osmid_bc, name="bc")
-    ox.io.save_graphml(G_nx, fp)
+    # save results to disk as this graph's bc sidecar, with its sampling info
+    meta = {"sample_size": k, "error": error}
+    sidecars.save_sidecar(save_path, {"osmid": osmids}, bc_norm, meta=meta)
 
-    # also save results to disk as JSON
-    with save_path.open("w") as f:
-        json.dump(osmid_bc, f)
 
-
-# get graph filepaths for which we have not yet calculated BC, sorted by size
-filepaths = sorted(graphml_folder.glob("*/*.graphml"), key=getsize)
-savepaths = (save_folder / f"{fp.parent.stem}-{fp.stem}.json" for fp in filepaths)
+# get graph filepaths for which we have not yet calculated BC, and each one's
+# node and edge counts (bc takes O(nm) time so n * m is a size too)
+filepaths = sorted(npz_folder.glob("*/*.npz"))
+savepaths = (sidecars.sidecar_path(attrs_root, "bc", fp) for fp in filepaths)
 args = [(fp, sp) for fp, sp in zip(filepaths, savepaths, strict=True) if not sp.is_file()]
-print(ox.ts(), f"There are {len(filepaths):,} total GraphML files")
+graph_sizes = {fp.stem: graphstore.graph_size(fp) for fp, _ in args}
+print(ox.ts(), f"There are {len(filepaths):,} total graph files")
 print(ox.ts(), f"Calculating BC for {len(args):,} remaining graphs")
 
-# multiprocess the queue
-with mp.get_context().Pool(cpus) as pool:
-    pool.starmap_async(calculate_bc, args).get()
-
-count_done = len(list(save_folder.glob("*.json")))
+# split the queue into big graphs (to run one at a time across all CPUs) and
+# small graphs (to run one per CPU), by node count
+big_args = [(fp, sp) for fp, sp in args if graph_sizes[fp.stem][0] > parallel_threshold]
+small_args = [(fp, sp) for fp, sp in args if graph_sizes[fp.stem][0] <= parallel_threshold]
+msg = f"Splitting {len(big_args):,} big graphs' BC calculation each across {cpus} CPUs"
+print(ox.ts(), msg)
+for fp, sp in sorted(big_args, key=lambda a: -math.prod(graph_sizes[a[0].stem])):
+    calculate_bc(fp, sp, cpus=cpus)
+
+# multiprocess the queue of small graphs, longest first
+print(ox.ts(), f"Calculating BC for {len(small_args):,} small graphs using {cpus} CPUs")
+items = {
+    fp.stem: ((fp, sp), (*graph_sizes[fp.stem], math.prod(graph_sizes[fp.stem])))
+    for fp, sp in small_args
+}
+profile_path = Path(config["stage_profiles_path"]) / "calculate-node-bc.json"
+scheduler.starmap(calculate_bc, items, cpus, memory_budget, profile_path)
+
+count_done = len(list((attrs_root / "bc").glob("*/*.npz")))
 print(ox.ts(), f"Calculated BC for {count_done:,} graphs")
@@ -5,14 +5,14 @@ from pathlib import Path
 
 import geopandas as gpd
 import osmnx as ox
-import pandas as pd
+from snm import resultstore
 
 # load configs
 with Path("./config.json").open() as f:
     config = json.load(f)
 
 uc_gpkg_path = config["uc_gpkg_path"]  # prepped urban centers dataset
-ind_street_path = config["indicators_street_path"]  # street network indicators to load
+ind_street_path = config["indicators_street_path"]  # street network indicators store to load
 ind_path = config["indicators_path"]  # merged indicators to save for repo upload
 ind_all_path = config["indicators_all_path"]  # all merged indicators to save for analysis
 
@@ -21,7 +21,7 @@ ucs = gpd.read_file(uc_gpkg_path).sort_index().drop(columns=["country_iso"])
 print(ox.ts(), f"Loaded urban centers dataset with shape={ucs.shape}")
 
 # load the previously calculated street network indicators dataset
-ind = pd.read_csv(ind_street_path)
+ind = resultstore.load_results(ind_street_path)
 print(ox.ts(), f"Loaded indicators dataset with shape={ind.shape}")
 
 # rename UC fields to something intelligible
@@ -73,6 +73,8 @@ drop = [
     "pop_greenness",
     "land_use_efficiency",
 ]
+for tolerance in config["intersect_clean_tolerances"]:
+    drop += [f"intersect_count_clean_{tolerance}m", f"intersect_count_clean_topo_{tolerance}m"]
 df = df.drop(columns=drop)
 df.to_csv(ind_path, index=False, encoding="utf-8")
 msg = f"Saved repo indicators to disk at {str(ind_path)!r}, shape={df.shape}"
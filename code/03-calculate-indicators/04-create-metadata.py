@@ -78,7 +78,9 @@ desc["avg_elevation"] = "Average elevation, meters above sea level (GHS)"
 desc["avg_precipitation"] = "Annual average precipitation, millimeters (GHS)"
 desc["avg_temperature"] = "Average temperature, celsius (GHS)"
 desc["bc_gini"] = "Gini coefficient of normalized distance-weighted node betweenness centralities"
+desc["bc_error"] = "Error bound of sampled betweenness centralities at 95% confidence (0 if exact)"
 desc["bc_max"] = "Max normalized distance-weighted node betweenness centralities"
+desc["bc_sample_size"] = "Count of source nodes sampled to calculate betweenness centralities"
 desc["built_height_m"] = "Average height of built surfaces, meters (GHS)"
 desc["built_up_area_m2"] = "Built-up surface area, square meters (GHS)"
 desc["built_up_area_percap"] = "Built-up surface area per-capita, square meters per person (GHS)"
@@ -106,6 +108,13 @@ desc["intersect_count_clean"] = (
 desc["intersect_count_clean_topo"] = (
     "Count of street intersections (merged within 10 meters topologically)"
 )
+for tolerance in config["intersect_clean_tolerances"]:
+    desc[f"intersect_count_clean_{tolerance}m"] = (
+        f"Count of street intersections (merged within {tolerance} meters geometrically)"
+    )
+    desc[f"intersect_count_clean_topo_{tolerance}m"] = (
+        f"Count of street intersections (merged within {tolerance} meters topologically)"
+    )
 desc["k_avg"] = "Average node degree (undirected)"
 desc["koppen_geiger"] = "Köppen-Geiger classification of majority of surface (GHS)"
 desc["land_use_efficiency"] = "Land use efficiency 1990-2015 (GHS)"
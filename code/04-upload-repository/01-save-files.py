@@ -6,6 +6,7 @@ from pathlib import Path
 
 import osmnx as ox
 import pandas as pd
+from snm import fusion, graphstore, scheduler, sidecars, tables
 
 # load configs
 with Path("./config.json").open() as f:
@@ -13,9 +14,12 @@ with Path("./config.json").open() as f:
 
 # configure multiprocessing
 cpus = mp.cpu_count() if config["cpus"] == 0 else config["cpus"]
+memory_budget = config["memory_budget_gb"]
 
 # set up save/load folder locations
-graphml_folder = Path(config["models_graphml_path"])  # where to load GraphML
+npz_folder = Path(config["models_npz_path"])  # where to load graph files
+attrs_root = Path(config["models_attrs_path"])  # where to load graph attribute sidecars
+graphml_folder = Path(config["models_graphml_path"])  # where to save GraphML
 gpkg_folder = Path(config["models_gpkg_path"])  # where to save GeoPackages
 nelist_folder = Path(config["models_nelist_path"])  # where to save node/edge lists
 
@@ -30,12 +34,26 @@ def to_int(value):
 
 node_dtypes = {"bc": float, "elevation_aster": to_int, "elevation_srtm": to_int}
 
-
-def save_graph(graphml_path, gpkg_path, nodes_path, edges_path, node_dtypes=node_dtypes) -> None:
-    print(ox.ts(), f"Saving {str(graphml_path)!r}", flush=True)
-
-    # load GraphML file and save as GeoPackage to disk
-    G = ox.io.load_graphml(graphml_path, node_dtypes=node_dtypes)
+# the ASTER/SRTM and chosen node elevations and the edge grades are in global
+# tables that all graphs share
+elev_raster = tables.load_table(config["elevation_raster_path"])
+elev_raster_cols = ["elevation_aster", "elevation_srtm"]
+elevations = tables.load_table(config["elevation_table_path"])
+grades = tables.load_table(config["grades_table_path"], ["grade", "grade_abs"])
+
+
+def save_graph(npz_path, graphml_path, gpkg_path, nelist_path, node_dtypes=node_dtypes) -> None:
+    print(ox.ts(), f"Saving {str(npz_path)!r}", flush=True)
+
+    # load graph file, merge in all the stages' attribute sidecars and the
+    # global tables' elevations and grades, then save this materialized graph
+    # to disk as GraphML and GeoPackage
+    G = graphstore.load_graph(npz_path)
+    G = tables.attach_table(G, elev_raster, elev_raster_cols, dtypes=node_dtypes)
+    G = sidecars.attach_sidecars(G, attrs_root, npz_path, dtypes=node_dtypes)
+    G = tables.attach_table(G, elevations, ["elevation"])
+    G = tables.attach_edge_table(G, grades, ["grade", "grade_abs"], fusion.edge_key)
+    ox.io.save_graphml(G, graphml_path)
     ox.io.save_graph_geopackage(G, gpkg_path)
 
     # get graph node/edge GeoDataFrames for node/edge lists
@@ -85,51 +103,60 @@ def save_graph(graphml_path, gpkg_path, nodes_path, edges_path, node_dtypes=node
     edges = edges.drop(columns=["geometry"]).reset_index().reindex(columns=edge_cols)
 
     # save graph node/edge lists as CSV files to disk
-    nodes_path.parent.mkdir(parents=True, exist_ok=True)
-    nodes.to_csv(nodes_path, index=False, encoding="utf-8")
-    edges.to_csv(edges_path, index=False, encoding="utf-8")
+    nelist_path.mkdir(parents=True, exist_ok=True)
+    nodes.to_csv(nelist_path / "node_list.csv", index=False, encoding="utf-8")
+    edges.to_csv(nelist_path / "edge_list.csv", index=False, encoding="utf-8")
 
 
-def make_args():
-    filepaths = sorted(graphml_folder.glob("*/*"))
-    print(ox.ts(), f"There are {len(filepaths):,} total GraphML files")
+def make_items():
+    filepaths = sorted(npz_folder.glob("*/*"))
+    print(ox.ts(), f"There are {len(filepaths):,} total graph files")
 
-    args = []
+    items = {}
     for fp in filepaths:
-        gpkg_path = gpkg_folder / fp.parent.stem / fp.name.replace("graphml", "gpkg")
+        graphml_path = graphml_folder / fp.parent.stem / (fp.stem + ".graphml")
+        gpkg_path = gpkg_folder / fp.parent.stem / (fp.stem + ".gpkg")
         nelist_output_folder = nelist_folder / fp.parent.stem / fp.stem
         nodes_path = nelist_output_folder / "node_list.csv"
         edges_path = nelist_output_folder / "edge_list.csv"
-        if not (gpkg_path.is_file() and nodes_path.is_file() and edges_path.is_file()):
-            args.append((fp, gpkg_path, nodes_path, edges_path))
+        paths = (graphml_path, gpkg_path, nodes_path, edges_path)
+        if not all(path.is_file() for path in paths):
+            args = (fp, graphml_path, gpkg_path, nelist_output_folder)
+            items[fp.stem] = (args, graphstore.graph_size(fp))
 
-    print(ox.ts(), f"Saving GeoPackage and node/edge lists for {len(args):,} remaining graphs")
-    return args
+    msg = f"Saving GraphML, GeoPackage, and node/edge lists for {len(items):,} remaining graphs"
+    print(ox.ts(), msg)
+    return items
 
 
-# multiprocess the queue
-with mp.get_context().Pool(cpus) as pool:
-    pool.starmap_async(save_graph, make_args()).get()
+# multiprocess the queue, longest first
+items = make_items()
+profile_path = Path(config["stage_profiles_path"]) / "save-files.json"
+scheduler.starmap(save_graph, items, cpus, memory_budget, profile_path)
 
 # final file count checks
 # verify same number of country folders across all file types
+npz_countries = list(npz_folder.glob("*"))
 graphml_countries = list(graphml_folder.glob("*"))
 gpkg_countries = list(gpkg_folder.glob("*"))
 nelist_countries = list(nelist_folder.glob("*"))
-assert len(graphml_countries) == len(gpkg_countries) == len(nelist_countries)
+assert len(npz_countries) == len(graphml_countries) == len(gpkg_countries) == len(nelist_countries)
 
 # verify same number of model files across all file types
+npz_paths = list(npz_folder.glob("*/*.npz"))
 graphml_paths = list(graphml_folder.glob("*/*.graphml"))
 gpkg_paths = list(gpkg_folder.glob("*/*.gpkg"))
 nlist_paths = list(nelist_folder.glob("*/*/node_list.csv"))
 elist_paths = list(nelist_folder.glob("*/*/edge_list.csv"))
-assert len(graphml_paths) == len(gpkg_paths) == len(nlist_paths) == len(elist_paths)
+assert len(npz_paths) == len(graphml_paths) == len(gpkg_paths)
+assert len(graphml_paths) == len(nlist_paths) == len(elist_paths)
 
 # verify same countries/cities across all file types
+npz_names = {fp.parent.stem + "/" + fp.stem for fp in npz_paths}
 graphml_names = {fp.parent.stem + "/" + fp.stem for fp in graphml_paths}
 gpkg_names = {fp.parent.stem + "/" + fp.stem for fp in gpkg_paths}
 nelist_names = {fp.parent.stem + "/" + fp.stem for fp in nelist_folder.glob("*/*")}
-assert graphml_names == gpkg_names == nelist_names
+assert npz_names == graphml_names == gpkg_names == nelist_names
 
 # verify an indicator row exists for every GraphML file
 df = pd.read_csv(config["indicators_path"])
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+# benchmark the elevation fetcher's throughput and retries against a local
+# stand-in Elevation API server that injects errors and partial responses
+
+import asyncio
+import time
+from collections import Counter
+
+import numpy as np
+import osmnx as ox
+from snm import fetcher, mockservers, polyline
+
+# how many requests to make, and how to make them
+n_requests = 2000
+coords_per_request = 512
+api_keys = ["key0", "key1", "key2"]
+rate = 200  # requests per second per key
+concurrency = 32
+
+# retry quickly against the local server
+fetcher.base_delay = 0.05
+
+
+# make requests of random locations, cycling through the API keys
+def make_items(base_url):
+    rng = np.random.default_rng(0)
+    items = []
+    for i in range(n_requests):
+        lats = 37.7 + rng.normal(0, 0.01, coords_per_request)
+        lngs = -122.3 + rng.normal(0, 0.01, coords_per_request)
+        locations = polyline.get_locations(lats, lngs)
+        key = api_keys[i % len(api_keys)]
+        url = f"{base_url}/maps/api/elevation/json?locations={locations}&key={key}"
+        items.append((coords_per_request, url))
+    return items
+
+
+async def main() -> None:
+    app = mockservers.elevation_app(error_rate=0.05, partial_rate=0.02, latency=0.01)
+    runner, base_url = await mockservers.start_app(app)
+    items = make_items(base_url)
+    attempts = Counter()
+    failed = []
+
+    def on_result(i, data, n_attempts) -> None:
+        attempts[n_attempts] += 1
+        if data is None:
+            failed.append(i)
+
+    print(ox.ts(), f"Fetching {len(items):,} URLs with concurrency {concurrency}")
+    start_time = time.time()
+    await fetcher.fetch_all(items, on_result, rate, concurrency)
+    elapsed = time.time() - start_time
+    await runner.cleanup()
+
+    msg = f"Fetched {len(items):,} URLs in {elapsed:,.1f} seconds"
+    print(ox.ts(), f"{msg} ({len(items) / elapsed:,.0f} URLs/second), {len(failed):,} failed")
+    print(ox.ts(), f"Attempts per URL: {dict(sorted(attempts.items()))}")
+    print(ox.ts(), f"Server counts: {dict(app['counts'])}")
+
+
+asyncio.run(main())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+# benchmark the DEM tile downloader's throughput, resumes, and retries against
+# a local stand-in file server that injects errors and dropped connections,
+# and check that every downloaded file is complete and intact
+
+import hashlib
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import osmnx as ox
+from snm import downloader, mockservers
+
+# how many files to download, how big, and with how many threads
+n_files = 40
+file_size = 4 * 1024 * 1024
+threads = 8
+
+# retry quickly against the local server
+downloader.base_delay = 0.05
+
+# make files of random bytes and their checksums
+rng = np.random.default_rng(0)
+files = {f"tile{i:03d}.tif": rng.bytes(file_size) for i in range(n_files)}
+checksums = {name: hashlib.sha256(data).hexdigest() for name, data in files.items()}
+
+app = mockservers.file_app(files, error_rate=0.05, drop_rate=0.1)
+stop, base_url = mockservers.start_app_thread(app)
+with tempfile.TemporaryDirectory() as tmp:
+    folder = Path(tmp)
+    items = [(f"{base_url}/files/{name}", folder / name) for name in files]
+
+    # leave some interrupted downloads to resume: a partial file, a complete
+    # one that was never renamed into place, and a corrupt oversized one
+    names = list(files)
+    (folder / f"{names[0]}.part").write_bytes(files[names[0]][: file_size // 3])
+    (folder / f"{names[1]}.part").write_bytes(files[names[1]])
+    (folder / f"{names[2]}.part").write_bytes(files[names[2]] + b"corrupt")
+
+    print(ox.ts(), f"Downloading {n_files:,} files with {threads} threads")
+    start_time = time.time()
+    url_checksums = {url: checksums[filepath.name] for url, filepath in items}
+    results = downloader.download_all(items, None, threads, url_checksums)
+    elapsed = time.time() - start_time
+    stop()
+
+    failed = [url for url, result in results.items() if isinstance(result, Exception)]
+    attempts = Counter(result for result in results.values() if isinstance(result, int))
+    mb = n_files * file_size / 1e6
+    msg = f"Downloaded {mb:,.0f} MB in {elapsed:,.1f} seconds ({mb / elapsed:,.0f} MB/second)"
+    print(ox.ts(), f"{msg}, {len(failed):,} failed")
+    print(ox.ts(), f"Attempts per file: {dict(sorted(attempts.items()))}")
+    print(ox.ts(), f"Server counts: {dict(app['counts'])}")
+
+    # every file must be complete and intact, with no parts left behind
+    assert not failed
+    assert not list(folder.glob("*.part"))
+    for name in files:
+        assert downloader.get_digest(folder / name) == checksums[name]
+
+# a server that can't serve a part's range and doesn't say the file's size
+# must not get the part accepted as complete, even without checksums
+app = mockservers.file_app(files, error_rate=0, drop_rate=0, range_sizes=False)
+stop, base_url = mockservers.start_app_thread(app)
+with tempfile.TemporaryDirectory() as tmp:
+    name = next(iter(files))
+    filepath = Path(tmp) / name
+    Path(tmp, f"{name}.part").write_bytes(files[name] + b"corrupt")
+    results = downloader.download_all([(f"{base_url}/files/{name}", filepath)], None, threads)
+    stop()
+    attempts = next(iter(results.values()))
+    msg = f"Resumed an oversized part from a server that doesn't say sizes in {attempts} attempts"
+    print(ox.ts(), msg)
+    assert downloader.get_digest(filepath) == checksums[name]
+print(ox.ts(), "All downloaded files are complete and intact")
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+# benchmark sampling SRTM tiles read in place from their zip files through
+# GDAL's /vsizip/ file system against sampling the same tiles extracted to hgt
+# files, and check that both return identical values
+
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import osmnx as ox
+from scipy.ndimage import zoom
+from snm import elevation, tiles
+
+# a grid of SRTMGL1 tiles (3601 x 3601 pixels each) starting at this corner
+tile_rows = 2
+tile_cols = 2
+min_lat = 37
+min_lng = -123
+tile_size = 3601
+
+# how many points to sample, and how many times to repeat each run
+n_points = 1_000_000
+n_runs = 3
+
+
+# make a tile of smooth, plausible terrain: a coarse random surface upsampled
+# with some fine noise added, so it compresses like real elevation data
+def make_tile(rng):
+    coarse = rng.uniform(0, 2000, (37, 37))
+    terrain = zoom(coarse, tile_size / 37, order=3)[:tile_size, :tile_size]
+    terrain += rng.normal(0, 3, terrain.shape)
+    return terrain.astype(">i2")
+
+
+# time sampling the points from a VRT, returning the best run's seconds and
+# the sampled values
+def time_sampling(vrt_path, x, y):
+    seconds = []
+    for _ in range(n_runs):
+        elevation.block_cache.clear()
+        start_time = time.time()
+        values, _ = elevation.sample_raster(vrt_path, x, y)
+        seconds.append(time.time() - start_time)
+    return min(seconds), values
+
+
+rng = np.random.default_rng(0)
+with tempfile.TemporaryDirectory() as tmp:
+    hgt_path = Path(tmp) / "hgt"
+    zip_path = Path(tmp) / "zip"
+    hgt_path.mkdir()
+    zip_path.mkdir()
+
+    # write each tile as an hgt file and as a zipped hgt file
+    for row in range(tile_rows):
+        for col in range(tile_cols):
+            tile_id = tiles.get_tile_ids(min_lng + col, min_lat + row)
+            name = tiles.get_tile_name(tile_id)
+            filepath = hgt_path / f"{name}.hgt"
+            make_tile(rng).tofile(filepath)
+            with zipfile.ZipFile(zip_path / f"{name}.SRTMGL1.hgt.zip", "w") as z:
+                z.write(filepath, filepath.name, compress_type=zipfile.ZIP_DEFLATED)
+
+    hgt_rasters = sorted(hgt_path.glob("*.hgt"))
+    zip_rasters = [
+        raster
+        for filepath in sorted(zip_path.glob("*.zip"))
+        for raster in elevation.get_zip_raster_paths(filepath)
+    ]
+    hgt_bytes = sum(fp.stat().st_size for fp in hgt_path.iterdir())
+    zip_bytes = sum(fp.stat().st_size for fp in zip_path.iterdir())
+    msg = f"Wrote {len(hgt_rasters)} tiles: {hgt_bytes / 1e6:,.0f} MB as hgt files"
+    print(ox.ts(), f"{msg}, {zip_bytes / 1e6:,.0f} MB as zip files")
+
+    hgt_vrt = elevation.get_vrt(Path(tmp) / "hgt.vrt", hgt_rasters)
+    zip_vrt = elevation.get_vrt(Path(tmp) / "zip.vrt", zip_rasters)
+
+    # sample random points across the tiles from each VRT
+    x = rng.uniform(min_lng, min_lng + tile_cols, n_points)
+    y = rng.uniform(min_lat, min_lat + tile_rows, n_points)
+    results = {}
+    for label, vrt_path in (("hgt", hgt_vrt), ("zip", zip_vrt)):
+        seconds, results[label] = time_sampling(vrt_path, x, y)
+        msg = f"Sampled {n_points:,} points from {label} tiles in {seconds:,.2f} seconds"
+        print(ox.ts(), f"{msg} ({n_points / seconds:,.0f} points/second)")
+
+    # both must return identical values
+    assert np.array_equal(results["hgt"], results["zip"], equal_nan=True)
+    assert not np.isnan(results["zip"]).any()
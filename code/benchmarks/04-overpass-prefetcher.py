@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+# benchmark the Overpass prefetcher's throughput against a local stand-in
+# Overpass server that replays responses, enforces a per-client slot rate
+# limit, and injects gateway timeouts. then check graph_from_polygon builds
+# graphs from the prefetched cache alone, so the planned queries' cache keys
+# match the ones OSMnx makes
+
+import asyncio
+import tempfile
+import time
+from collections import Counter
+
+import numpy as np
+import osmnx as ox
+from shapely import Point
+from snm import httpcache, mockservers, overpass
+
+# how many urban centers to prefetch, and their radius (degrees)
+n_ucs = 100
+radius = 0.02
+
+# the stand-in server's rate limit, and how long its queries take and cooldown
+rate_limit = 4
+query_seconds = 0.2
+cooldown = 0.5
+
+# retry quickly against the local server
+overpass.base_delay = 0.1
+overpass.status_pause = 0.1
+
+network_type = "drive"
+
+
+# make a response of a little street grid inside a polygon
+def make_response(polygon, first_id):
+    x, y = polygon.centroid.x, polygon.centroid.y
+    offsets = np.linspace(-radius / 2, radius / 2, 4)
+    elements = []
+    ids = np.arange(first_id, first_id + 16).reshape(4, 4)
+    for i, dy in enumerate(offsets):
+        for j, dx in enumerate(offsets):
+            node = {"type": "node", "id": int(ids[i, j]), "lat": y + dy, "lon": x + dx}
+            elements.append(node)
+    for k, way_nodes in enumerate([*ids.tolist(), *ids.T.tolist()]):
+        way = {"type": "way", "id": first_id + k, "nodes": way_nodes}
+        way["tags"] = {"highway": "residential"}
+        elements.append(way)
+    return {"version": 0.6, "elements": elements}
+
+
+async def main(cache_path) -> None:
+    rng = np.random.default_rng(0)
+    points = zip(rng.uniform(-120, -80, n_ucs), rng.uniform(30, 45, n_ucs), strict=True)
+    polygons = [Point(x, y).buffer(radius) for x, y in points]
+
+    # start the server, pointing OSMnx at it, then plan every polygon's queries
+    responses = {}
+    app = mockservers.overpass_app(responses, rate_limit, query_seconds, cooldown)
+    runner, base_url = await mockservers.start_app(app)
+    ox.settings.overpass_url = f"{base_url}/api"
+    queries = {}
+    for i, polygon in enumerate(polygons):
+        for url, query in overpass.plan_queries(polygon, network_type):
+            queries[url] = query
+            responses[query] = make_response(polygon, first_id=i * 100)
+    urls = list(queries)
+
+    attempts = Counter()
+    results = []
+
+    def on_result(i, data, n_attempts) -> None:
+        attempts[n_attempts] += 1
+        results.append((urls[i], data))
+
+    print(ox.ts(), f"Prefetching {len(urls):,} queries for {n_ucs:,} urban centers")
+    start_time = time.time()
+    await overpass.fetch_all(list(queries.values()), on_result, max_concurrency=16)
+    elapsed = time.time() - start_time
+    await runner.cleanup()
+    httpcache.write(cache_path, results)
+
+    msg = f"Fetched {len(urls):,} queries in {elapsed:,.1f} seconds"
+    print(ox.ts(), f"{msg} ({len(urls) / elapsed:,.1f} queries/second)")
+    print(ox.ts(), f"Attempts per query: {dict(sorted(attempts.items()))}")
+    print(ox.ts(), f"Server counts: {dict(app['counts'])}")
+    assert all(data is not None for _, data in results)
+    assert all(httpcache.exists(cache_path, urls))
+
+    # the server is gone, so these graphs can only be built from the cache
+    httpcache.install(cache_path)
+    ox.settings.use_cache = True
+    for polygon in polygons[:10]:
+        G = ox.graph_from_polygon(polygon, network_type=network_type, retain_all=True)
+        assert len(G) > 0
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    asyncio.run(main(tmp))
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+# check that graphs built from a PBF extract are identical to graphs built
+# from the Overpass API, on a small fixture street grid. the Overpass graphs
+# are built by graph_from_polygon against a local stand-in Overpass server
+# whose responses are found by brute force (every fixture way's tags and
+# geometry checked against every query), and the PBF graphs by
+# graph_from_polygon from the responses made from the fixture's PBF extract
+
+import tempfile
+import time
+from itertools import pairwise
+from pathlib import Path
+
+import numpy as np
+import osmium
+import osmnx as ox
+from shapely import LineString, Point, box
+from snm import httpcache, mockservers, overpass, pbf
+
+network_type = "drive"
+
+# the fixture: a grid of streets with this many nodes per side and spacing
+# (degrees), with each street's ways tagged at random from these tags
+grid_size = 20
+spacing = 0.002
+origin = (10.0, 50.0)
+way_tags = [
+    {"highway": "residential", "name": "Main Street"},
+    {"highway": "primary", "oneway": "yes", "lanes": "2"},
+    {"highway": "tertiary", "maxspeed": "30"},
+    {"highway": "footway"},
+    {"highway": "service", "service": "parking_aisle"},
+    {"highway": "residential", "access": "private"},
+    {"highway": "unclassified", "motor_vehicle": "no"},
+    {"highway": "pedestrian", "area": "yes"},
+    {"highway": "living_street"},
+]
+
+# force big urban centers' queries to be subdivided into several polygons
+ox.settings.max_query_area_size = 1_000_000
+
+
+# make the fixture's node and way elements, as Overpass API json elements
+def make_fixture():
+    rng = np.random.default_rng(0)
+    ids = np.arange(1, grid_size**2 + 1).reshape(grid_size, grid_size)
+    nodes = {}
+    for row in range(grid_size):
+        for col in range(grid_size):
+            node_id = int(ids[row, col])
+            lon = origin[0] + col * spacing + rng.normal(0, spacing / 10)
+            lat = origin[1] + row * spacing + rng.normal(0, spacing / 10)
+            node = {"type": "node", "id": node_id, "lat": round(lat, 7), "lon": round(lon, 7)}
+            if rng.random() < 0.1:  # noqa: PLR2004
+                node["tags"] = {"highway": "traffic_signals"}
+            nodes[node_id] = node
+
+    # cut each row and column of the grid into ways of a few segments
+    ways = []
+    for line in [*ids.tolist(), *ids.T.tolist()]:
+        cuts = [0, *sorted(rng.choice(range(2, grid_size - 2), 2, replace=False)), grid_size - 1]
+        for start, end in pairwise(cuts):
+            tags = dict(way_tags[rng.integers(len(way_tags))])
+            way = {"type": "way", "id": 1000 + len(ways), "nodes": line[start : end + 1]}
+            ways.append(way | {"tags": tags})
+
+    # add a long street that crosses the grid without any nodes inside it
+    lat = origin[1] + (grid_size / 2 + 0.5) * spacing
+    nodes[90001] = {"type": "node", "id": 90001, "lat": lat, "lon": origin[0] - 0.05}
+    nodes[90002] = {"type": "node", "id": 90002, "lat": lat, "lon": origin[0] + 0.1}
+    ways.append({"type": "way", "id": 9000, "nodes": [90001, 90002], "tags": {"highway": "trunk"}})
+    return nodes, ways
+
+
+# write fixture elements to a PBF file
+def write_pbf(filepath, nodes, ways) -> None:
+    with osmium.SimpleWriter(str(filepath)) as writer:
+        for node in nodes.values():
+            location = (node["lon"], node["lat"])
+            tags = node.get("tags", {})
+            writer.add_node(osmium.osm.mutable.Node(id=node["id"], location=location, tags=tags))
+        for way in ways:
+            writer.add_way(
+                osmium.osm.mutable.Way(id=way["id"], nodes=way["nodes"], tags=way["tags"]),
+            )
+
+
+# answer a query by brute force: every fixture way that passes the network
+# filter and intersects the query's polygon, and all those ways' nodes
+def answer_query(query, nodes, ways):
+    clauses = pbf.parse_filter(ox._overpass._get_network_filter(network_type))
+    polygon = pbf.parse_polygon(query)
+    elements = []
+    for way in ways:
+        line = LineString([(nodes[n]["lon"], nodes[n]["lat"]) for n in way["nodes"]])
+        if pbf.matches_filter(way["tags"], clauses) and line.intersects(polygon):
+            elements.append(way)
+    node_ids = sorted({n for way in elements for n in way["nodes"]})
+    return {"version": 0.6, "elements": [nodes[n] for n in node_ids] + elements}
+
+
+# build an urban center's graph the way the create graphs step does
+def make_graph(polygon):
+    return ox.graph_from_polygon(
+        polygon,
+        network_type=network_type,
+        retain_all=True,
+        simplify=True,
+        truncate_by_edge=True,
+    )
+
+
+# get a graph's node and edge attributes, with geometries as WKT
+def get_graph_data(G):
+    nodes = dict(G.nodes(data=True))
+    edges = {
+        (u, v, k): {a: getattr(x, "wkt", x) for a, x in d.items()}
+        for u, v, k, d in G.edges(keys=True, data=True)
+    }
+    return nodes, edges
+
+
+nodes, ways = make_fixture()
+size = grid_size * spacing
+polygons = [
+    Point(origin[0] + size / 2, origin[1] + size / 2).buffer(size / 3),
+    box(origin[0] + size / 10, origin[1] + size / 10, origin[0] + size / 3, origin[1] + size / 3),
+    box(origin[0] + 0.6 * size, origin[1] + 0.3 * size, origin[0] + 0.9 * size, origin[1] + size),
+]
+
+with tempfile.TemporaryDirectory() as tmp:
+    # build the graphs from the stand-in Overpass server
+    responses = {}
+    app = mockservers.overpass_app(responses, rate_limit=0, query_seconds=0, error_rate=0)
+    stop, base_url = mockservers.start_app_thread(app)
+    ox.settings.overpass_url = f"{base_url}/api"
+    ox.settings.overpass_rate_limit = False
+    ox.settings.use_cache = False
+    queries = {}
+    for polygon in polygons:
+        for url, query in overpass.plan_queries(polygon, network_type):
+            queries[url] = query
+            responses[query] = answer_query(query, nodes, ways)
+    overpass_graphs = [make_graph(polygon) for polygon in polygons]
+    stop()
+
+    # build the same graphs from the PBF extract's responses, with the server
+    # gone so they can only come from the cache
+    pbf_path = Path(tmp) / "fixture.osm.pbf"
+    write_pbf(pbf_path, nodes, ways)
+    start_time = time.time()
+    pbf_responses = pbf.make_responses(pbf_path, list(queries.values()), network_type)
+    elapsed = time.time() - start_time
+    httpcache.write(Path(tmp) / "cache", zip(queries, pbf_responses, strict=True))
+    httpcache.install(Path(tmp) / "cache")
+    ox.settings.use_cache = True
+    pbf_graphs = [make_graph(polygon) for polygon in polygons]
+
+msg = f"Made {len(queries):,} queries' responses from PBF in {elapsed:,.2f} seconds"
+print(ox.ts(), f"{msg}, for {len(polygons)} urban centers")
+for G_overpass, G_pbf in zip(overpass_graphs, pbf_graphs, strict=True):
+    print(ox.ts(), f"Overpass graph has {len(G_overpass):,} nodes, {len(G_overpass.edges):,} edges")
+    assert len(G_overpass) > 0
+    assert get_graph_data(G_overpass) == get_graph_data(G_pbf)
+print(ox.ts(), "PBF graphs are identical to Overpass graphs")
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+# benchmark the vectorized indicator kernels against the OSMnx functions they
+# replace, one indicator at a time, on synthetic street grids of increasing
+# size, and check that every indicator matches OSMnx's value
+
+import tempfile
+import time
+from pathlib import Path
+from statistics import mean, median
+
+import fixtures
+import networkx as nx
+import numpy as np
+import osmnx as ox
+import pandas as pd
+from snm import graphstore, indicators, sidecars
+
+# street grid sizes (nodes per side) to benchmark
+grid_sizes = [50, 150, 300]
+
+
+# call a function, returning its result and how many seconds it took
+def timed(function, *args):
+    start_time = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start_time
+
+
+def osmnx_elevation_grades(G):
+    grades = pd.Series(nx.get_edge_attributes(G, "grade_abs").values())
+    elevs = pd.Series(nx.get_node_attributes(G, "elevation").values())
+    return {
+        "elev_iqr": elevs.quantile(0.75) - elevs.quantile(0.25),
+        "elev_mean": elevs.mean(),
+        "elev_median": elevs.median(),
+        "elev_range": elevs.max() - elevs.min(),
+        "elev_std": elevs.std(),
+        "grade_mean": grades.mean(),
+        "grade_median": grades.median(),
+    }
+
+
+def osmnx_lengths(G):
+    lengths = nx.get_edge_attributes(G, "length").values()
+    return sum(lengths), mean(lengths), median(lengths)
+
+
+def osmnx_proportions(G):
+    spn = ox.stats.streets_per_node_proportions(G)
+    return {**spn, "intersect_count": ox.stats.intersection_count(G)}
+
+
+def kernel_proportions(nodes):
+    spn = indicators.street_count_proportions(nodes["street_count"])
+    return {**spn, "intersect_count": indicators.intersection_count(nodes["street_count"])}
+
+
+# time each indicator both ways on one graph file, returning a dict of
+# indicator: (osmnx seconds, kernel seconds) and asserting the values match
+def compare(filepath, attrs_root):
+    times = {}
+    G, t1 = timed(
+        lambda: sidecars.attach_sidecars(graphstore.load_graph(filepath), attrs_root, filepath),
+    )
+    (nodes, edges), t2 = timed(indicators.load_graph_arrays, filepath, attrs_root)
+    times["load"] = (t1, t2)
+
+    Gu, t1 = timed(ox.convert.to_undirected, G)
+    edges, t2 = timed(indicators.to_undirected, nodes, edges)
+    times["undirected"] = (t1, t2)
+    assert len(Gu.edges) == len(edges["u"])
+    G.clear()
+
+    bc = list(nx.get_node_attributes(Gu, "bc").values())
+    checks = [
+        ("lengths", osmnx_lengths, (Gu,), indicators.length_stats, (edges["length"],)),
+        (
+            "self_loops",
+            ox.stats.self_loop_proportion,
+            (Gu,),
+            indicators.self_loop_proportion,
+            (edges,),
+        ),
+        ("street_counts", osmnx_proportions, (Gu,), kernel_proportions, (nodes,)),
+        ("circuity", ox.stats.circuity_avg, (Gu,), indicators.circuity, (nodes, edges)),
+        (
+            "orientation",
+            lambda G: ox.bearing.orientation_entropy(ox.bearing.add_edge_bearings(G)),
+            (Gu,),
+            indicators.orientation_entropy,
+            (nodes, edges),
+        ),
+        (
+            "elevation_grades",
+            osmnx_elevation_grades,
+            (Gu,),
+            indicators.elevation_grade_stats,
+            (nodes["elevation"], edges["grade_abs"]),
+        ),
+        ("gini", indicators.gini, (bc,), indicators.gini, (nodes["bc"],)),
+    ]
+    for name, osmnx_function, osmnx_args, kernel, kernel_args in checks:
+        expected, t1 = timed(osmnx_function, *osmnx_args)
+        result, t2 = timed(kernel, *kernel_args)
+        times[name] = (t1, t2)
+        if isinstance(expected, dict):
+            assert expected.keys() == result.keys(), name
+            expected, result = list(expected.values()), list(result.values())
+        np.testing.assert_allclose(expected, result, rtol=1e-9, err_msg=name)
+    return times, len(Gu), len(Gu.edges)
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    attrs_root = Path(tmp) / "attrs"
+    for size in grid_sizes:
+        filepath = Path(tmp) / "npz" / "country-XX" / f"grid-{size}.npz"
+        fixtures.save_grid(fixtures.make_grid(size), filepath, attrs_root)
+        times, n, m = compare(filepath, attrs_root)
+        print(ox.ts(), f"Grid graph with {n:,} nodes and {m:,} undirected edges")
+        for name, (t1, t2) in times.items():
+            msg = f"{name:>16}: OSMnx {t1:8.3f}s, kernel {t2:8.3f}s ({t1 / t2:7,.1f}x)"
+            print(ox.ts(), msg)
+print(ox.ts(), "All indicators match OSMnx")
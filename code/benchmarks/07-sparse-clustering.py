@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+# benchmark the sparse-matrix clustering coefficients and PageRank against
+# networkx, one stat at a time, on synthetic street grids of increasing size,
+# and check that every stat matches networkx's value
+
+import tempfile
+import time
+from pathlib import Path
+
+import fixtures
+import networkx as nx
+import numpy as np
+import osmnx as ox
+from snm import clustering, graphstore
+
+# street grid sizes (nodes per side) to benchmark
+grid_sizes = [50, 300]
+
+
+# call a function, returning its result and how many seconds it took
+def timed(function, *args, **kwargs):
+    start_time = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start_time
+
+
+def pagerank_max(G):
+    return max(nx.pagerank(G, weight="length").values())
+
+
+def sparse_pagerank_max(W):
+    ranks, report = clustering.pagerank(W)
+    assert report["converged"]
+    return float(ranks.max())
+
+
+# time each stat both ways on one graph file, returning a dict of
+# stat: (networkx seconds, sparse seconds) and asserting the values match
+def compare(filepath):
+    times = {}
+    G, t1 = timed(lambda: ox.convert.to_digraph(graphstore.load_graph(filepath)))
+    (_, W), t2 = timed(clustering.load_matrix, filepath)
+    times["load"] = (t1, t2)
+    Gu, t1 = timed(nx.Graph, G)
+    Wu, t2 = timed(clustering.to_undirected, W)
+    times["undirected"] = (t1, t2)
+
+    checks = [
+        ("cc_avg_dir", G, W, {"directed": True}, None),
+        ("cc_wt_avg_dir", G, W, {"directed": True}, "length"),
+        ("cc_avg_undir", Gu, Wu, {"directed": False}, None),
+        ("cc_wt_avg_undir", Gu, Wu, {"directed": False}, "length"),
+    ]
+    for name, graph, matrix, kwargs, weight in checks:
+        expected, t1 = timed(nx.average_clustering, graph, weight=weight)
+        result, t2 = timed(
+            clustering.average_clustering,
+            matrix,
+            weighted=weight is not None,
+            **kwargs,
+        )
+        times[name] = (t1, t2)
+        np.testing.assert_allclose(result, expected, rtol=1e-9, err_msg=name)
+        assert expected > 0, name
+
+    expected, t1 = timed(pagerank_max, G)
+    result, t2 = timed(sparse_pagerank_max, W)
+    times["pagerank_max"] = (t1, t2)
+    np.testing.assert_allclose(result, expected, rtol=1e-9, err_msg="pagerank_max")
+    return times, len(G), len(G.edges)
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    for size in grid_sizes:
+        filepath = Path(tmp) / "npz" / "country-XX" / f"grid-{size}.npz"
+        fixtures.save_grid(fixtures.make_grid(size), filepath, Path(tmp) / "attrs")
+        times, n, m = compare(filepath)
+        print(ox.ts(), f"Grid graph with {n:,} nodes and {m:,} directed edges")
+        for name, (t1, t2) in times.items():
+            msg = f"{name:>16}: networkx {t1:8.3f}s, sparse {t2:8.3f}s ({t1 / t2:7,.1f}x)"
+            print(ox.ts(), msg)
+
+    # networkx raises an error if PageRank doesn't converge: we report it
+    clustering.max_iter = 5
+    clustering.tol = 1e-12
+    _, report = clustering.pagerank(clustering.load_matrix(filepath)[1])
+    msg = f"PageRank report with max_iter={clustering.max_iter}, tol={clustering.tol}"
+    print(ox.ts(), f"{msg}: {report}")
+    assert not report["converged"]
+    assert report["iterations"] == clustering.max_iter
+print(ox.ts(), "All clustering and PageRank stats match networkx")
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+# benchmark the one-pass, multi-tolerance clean intersection counts against
+# ox.consolidate_intersections, which buffers and unions the nodes twice per
+# tolerance, on dense synthetic street grids of increasing size with some
+# streets removed, and check that every count matches OSMnx's
+
+import tempfile
+import time
+from pathlib import Path
+
+import fixtures
+import osmnx as ox
+from snm import consolidation, indicators
+
+# street grid sizes (nodes per side) to benchmark and the tolerances (meters)
+# to count clean intersections at
+grid_sizes = [50, 150]
+tolerances = [5, 10, 15, 20]
+
+# space grid nodes 35 to 45 meters apart and remove some streets, so nearby
+# nodes merge at these tolerances without always being connected
+fixtures.spacing = 0.0004
+removed_streets = 0.3
+
+
+# call a function, returning its result and how many seconds it took
+def timed(function, *args):
+    start_time = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start_time
+
+
+def osmnx_counts(G, tolerances):
+    Gp = ox.projection.project_graph(G)
+    counts = {}
+    for tolerance in tolerances:
+        icc = len(ox.consolidate_intersections(Gp, tolerance=tolerance, rebuild_graph=False))
+        ict = len(ox.consolidate_intersections(Gp, tolerance=tolerance, reconnect_edges=False))
+        counts[tolerance] = (icc, ict)
+    return counts
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    for size in grid_sizes:
+        G = fixtures.make_grid(size)
+        fixtures.remove_streets(G, removed_streets)
+        filepath = Path(tmp) / "npz" / "country-XX" / f"grid-{size}.npz"
+        fixtures.save_grid(G, filepath, Path(tmp) / "attrs")
+        nodes, edges = indicators.load_graph_arrays(filepath, Path(tmp) / "attrs")
+        expected, t1 = timed(osmnx_counts, G, tolerances)
+        result, t2 = timed(consolidation.intersection_counts, nodes, edges, tolerances)
+        print(ox.ts(), f"Grid graph with {len(G):,} nodes and {len(G.edges):,} directed edges")
+        msg = f"{len(tolerances)} tolerances: OSMnx {t1:8.3f}s, one-pass {t2:8.3f}s"
+        print(ox.ts(), f"{msg} ({t1 / t2:7,.1f}x)")
+        for tolerance in tolerances:
+            (icc, ict), (expected_icc, expected_ict) = result[tolerance], expected[tolerance]
+            print(ox.ts(), f"{tolerance:>4}m: {icc:,} geometric, {ict:,} topological")
+            assert (icc, ict) == (expected_icc, expected_ict), tolerance
+
+        # some merged clusters should split topologically at the largest one
+        icc, ict = result[max(tolerances)]
+        assert ict > icc
+print(ox.ts(), "All clean intersection counts match OSMnx")
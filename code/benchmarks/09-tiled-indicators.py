@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+# benchmark the tiled, halo-based calculation of a giant graph's local
+# indicators (clean intersection counts and clustering coefficients) across a
+# process pool against calculating them on the whole graph at once, on a dense
+# synthetic street grid cut into many small tiles, and check that the tiled
+# results are identical to the monolithic ones
+
+import multiprocessing as mp
+import tempfile
+import time
+from pathlib import Path
+
+import fixtures
+import osmnx as ox
+from snm import clustering, consolidation, indicators, tiling
+
+# street grid size (nodes per side), the tolerances (meters) to count clean
+# intersections at, and how many CPUs to split the tiles across
+grid_size = 400
+tolerances = [5, 10, 15, 20]
+cpus = min(mp.cpu_count(), 8)
+
+# space grid nodes 35 to 45 meters apart and remove some streets, so nearby
+# nodes merge at these tolerances without always being connected, then cut the
+# grid (about 16 km across) into 2 km tiles so many clusters straddle them
+fixtures.spacing = 0.0004
+removed_streets = 0.3
+tiling.tile_size = 2000
+
+
+# call a function, returning its result and how many seconds it took
+def timed(function, *args):
+    start_time = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start_time
+
+
+# count clean intersections on the whole graph at once, from its projected
+# node coordinates like the tiled counts
+def monolithic_counts(xy, nodes, edges, tolerances):
+    xy, graph_edges = consolidation.intersection_graph(xy, nodes, edges)
+    return consolidation.consolidation_counts(xy, graph_edges, tolerances)
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        G = fixtures.make_grid(grid_size)
+        fixtures.remove_streets(G, removed_streets)
+        filepath = Path(tmp) / "npz" / "country-XX" / f"grid-{grid_size}.npz"
+        fixtures.save_grid(G, filepath, Path(tmp) / "attrs")
+        msg = f"Grid graph with {len(G):,} nodes and {len(G.edges):,} directed edges"
+        G = None
+        print(ox.ts(), msg)
+
+        nodes, edges = indicators.load_graph_arrays(filepath, Path(tmp) / "attrs")
+        xy = consolidation.project_nodes(nodes["x"], nodes["y"])
+        print(ox.ts(), f"Cut into {len(tiling.tile_cells(xy)):,} tiles of {tiling.tile_size} m")
+        with mp.get_context().Pool(cpus) as pool:
+            checks = [
+                (
+                    "intersection_counts",
+                    (monolithic_counts, xy, nodes, edges, tolerances),
+                    (tiling.intersection_counts, xy, nodes, edges, tolerances, pool),
+                ),
+                (
+                    "clustering",
+                    (clustering.calculate_clustering, filepath),
+                    (tiling.calculate_clustering, filepath, xy, pool),
+                ),
+            ]
+            for name, (function, *args), (tiled_function, *tiled_args) in checks:
+                expected, t1 = timed(function, *args)
+                result, t2 = timed(tiled_function, *tiled_args)
+                msg = f"monolithic {t1:8.3f}s, tiled on {cpus} CPUs {t2:8.3f}s ({t1 / t2:5.1f}x)"
+                print(ox.ts(), f"{name:>19}: {msg}")
+                print(ox.ts(), f"{name:>19}: {result}")
+                assert result == expected, name
+
+        # the tiles' halos must be big enough to merge nodes at every tolerance
+        try:
+            tiling.intersection_counts(xy, nodes, edges, [tiling.tile_size], None)
+        except ValueError as e:
+            print(ox.ts(), f"Tolerance bigger than half a tile: {e}")
+        else:
+            raise AssertionError
+    print(ox.ts(), "Tiled local indicators are identical to monolithic ones")
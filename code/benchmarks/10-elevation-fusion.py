@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+# benchmark the global elevation fusion and edge grade passes against choosing
+# elevations and calculating grades graph by graph with pandas, like the stage
+# used to, on many synthetic street grids that share node IDs (and some edges'
+# u, v, and key, with different lengths), and check that every graph's node
+# elevations and edge grades are identical both ways
+
+import tempfile
+import time
+from pathlib import Path
+
+import fixtures
+import numpy as np
+import osmnx as ox
+import pandas as pd
+from snm import fusion, graphstore, tables
+
+# how many street grids to make, and their size (nodes per side)
+n_graphs = 100
+grid_size = 40
+
+# share of nodes missing a Google elevation, or an SRTM elevation
+missing = 0.05
+
+
+# call a function, returning its result and how many seconds it took
+def timed(function, *args):
+    start_time = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start_time
+
+
+# make global tables of every node's ASTER/SRTM and Google elevations, with
+# some Google values missing and some SRTM values missing (where Google's isn't)
+def make_elevation_tables(osmids, seed=0):
+    rng = np.random.default_rng(seed)
+    truth = rng.uniform(0, 300, len(osmids))
+    aster = np.round(truth + rng.normal(0, 8, len(osmids)))
+    srtm = np.round(truth + rng.normal(0, 5, len(osmids)))
+    has_google = rng.random(len(osmids)) > missing
+    srtm[has_google & (rng.random(len(osmids)) < missing)] = np.nan
+    raster = {"osmid": osmids, "elevation_aster": aster, "elevation_srtm": srtm}
+    google = pd.DataFrame(
+        {
+            "osmid": osmids[has_google],
+            "elevation_google": truth[has_google] + rng.normal(0, 1, has_google.sum()),
+            "elevation_google_resolution": 9.5,
+        },
+    )
+    return raster, google.set_index("osmid")
+
+
+# choose one graph's node elevations and calculate its edge grades with pandas
+def graph_elevations(nodes, edges, raster, df_elev):
+    nodes = pd.DataFrame({"osmid": nodes["osmid"]}).set_index("osmid")
+    for attr in ("elevation_aster", "elevation_srtm"):
+        nodes[attr] = tables.get_values(raster, attr, nodes.index)
+    nodes = nodes.join(df_elev)
+    diff_aster = (nodes["elevation_aster"] - nodes["elevation_google"]).fillna(np.inf)
+    diff_srtm = (nodes["elevation_srtm"] - nodes["elevation_google"]).fillna(np.inf)
+    use_srtm = diff_srtm.abs() <= diff_aster.abs()
+    nodes["elevation"] = np.nan
+    nodes.loc[use_srtm, "elevation"] = nodes.loc[use_srtm, "elevation_srtm"]
+    nodes.loc[~use_srtm, "elevation"] = nodes.loc[~use_srtm, "elevation_aster"]
+    elevs = nodes["elevation"].astype(int)
+    rise = elevs.loc[edges["v"]].to_numpy() - elevs.loc[edges["u"]].to_numpy()
+    return elevs.to_numpy(), rise / edges["length"]
+
+
+def per_graph(graphs, raster, df_elev):
+    return [graph_elevations(nodes, edges, raster, df_elev) for nodes, edges in graphs]
+
+
+# choose every node's elevation then calculate every unique edge's grade, in
+# one pass each over the global tables
+def global_passes(graphs, raster, df_elev):
+    google = {
+        "osmid": df_elev.index.to_numpy(),
+        "elevation": df_elev["elevation_google"].to_numpy(),
+    }
+    google = tables.get_values(google, "elevation", raster["osmid"])
+    elevations, _, _ = fusion.choose_elevations(
+        raster["elevation_aster"],
+        raster["elevation_srtm"],
+        google,
+    )
+    elevations = {"osmid": raster["osmid"], "elevation": elevations.astype(int)}
+    edges = {attr: np.concatenate([edges[attr] for _, edges in graphs]) for attr in fusion.edge_key}
+    grades = tables.drop_duplicates(edges, key=fusion.edge_key)
+    grades["grade"] = fusion.edge_grades(elevations, grades["u"], grades["v"], grades["length"])
+    return elevations, grades
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    graphs = []
+    for seed in range(n_graphs):
+        filepath = Path(tmp) / "npz" / "country-XX" / f"grid-{seed}.npz"
+        fixtures.save_grid(fixtures.make_grid(grid_size, seed), filepath, Path(tmp) / "attrs")
+        graphs.append(graphstore.load_arrays(filepath, node_attrs=[], edge_attrs=["length"]))
+    osmids = np.unique(np.concatenate([nodes["osmid"] for nodes, _ in graphs]))
+    raster, df_elev = make_elevation_tables(osmids)
+    n_edges = sum(len(edges["u"]) for _, edges in graphs)
+    msg = f"{n_graphs} grid graphs with {len(osmids):,} unique nodes and {n_edges:,} edges"
+    print(ox.ts(), msg)
+
+    expected, t1 = timed(per_graph, graphs, raster, df_elev)
+    (elevations, grades), t2 = timed(global_passes, graphs, raster, df_elev)
+    msg = f"per graph {t1:8.3f}s, global {t2:8.3f}s ({t1 / t2:5.1f}x)"
+    print(ox.ts(), f"Elevations and grades: {msg}")
+    print(ox.ts(), f"Global grade table has {len(grades['u']):,} unique (u, v, length) edges")
+
+    # look up each graph's elevations and grades in the global tables
+    for (nodes, edges), (elevs, edge_grades) in zip(graphs, expected, strict=True):
+        result = tables.get_values(elevations, "elevation", nodes["osmid"])
+        np.testing.assert_array_equal(result, elevs)
+        result = tables.get_values(grades, "grade", edges, key=fusion.edge_key)
+        np.testing.assert_array_equal(result, edge_grades)
+print(ox.ts(), "All graphs' elevations and grades match the per-graph calculation")
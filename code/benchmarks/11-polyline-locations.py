@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+# benchmark packing clustered node coordinates into Google Elevation API
+# `locations` parameters (as encoded polylines, when shorter) and compare their
+# length to `lat,lng` pairs, and check that polylines and every packed parameter
+# decode exactly to the coordinates at 5 decimal places (including negative
+# coordinates, large deltas, and single points) within the request limits
+
+import time
+from urllib.parse import unquote
+
+import numpy as np
+import osmnx as ox
+from snm import polyline
+
+# google usage limits: locations per request and characters per locations
+# parameter (about what's left of a URL after the template and key)
+coords_per_request = 512
+max_chars = 16000
+
+# how many clusters of nodes to pack, and how big each cluster is
+n_clusters = 200
+cluster_size = 2000
+
+
+# decode a `locations` parameter in either form to integer lats and lngs
+def decode_locations(locations):
+    locations = unquote(locations)
+    if locations.startswith("enc:"):
+        lats, lngs = polyline.decode(locations[len("enc:") :])
+    else:
+        lats, lngs = np.array([pair.split(",") for pair in locations.split("|")], dtype=float).T
+    return polyline.to_ints(lats), polyline.to_ints(lngs)
+
+
+# check that packed `locations` parameters are within the limits and decode
+# exactly to the coordinates, in order
+def check_packed(packed, lats, lngs, max_points, max_chars):
+    assert sum(count for count, _ in packed) == len(lats)
+    start = 0
+    for count, locations in packed:
+        assert 0 < count <= max_points
+        assert len(locations) <= max_chars
+        end = start + count
+        lats_decoded, lngs_decoded = decode_locations(locations)
+        np.testing.assert_array_equal(lats_decoded, polyline.to_ints(lats[start:end]))
+        np.testing.assert_array_equal(lngs_decoded, polyline.to_ints(lngs[start:end]))
+        start = end
+
+
+# get the `locations` parameter for some coordinates as `lat,lng` pairs only
+def pairs_only(lats, lngs):
+    return "|".join(
+        f"{lat:.{polyline.precision}f},{lng:.{polyline.precision}f}"
+        for lat, lng in zip(lats, lngs, strict=True)
+    )
+
+
+rng = np.random.default_rng(0)
+
+# every polyline must round-trip exactly, from coordinates at the poles and
+# antimeridian (the biggest deltas), negative ones, ones a rounding unit apart,
+# and single points, to random ones anywhere on the globe
+cases = [
+    ([90, -90, 0, -90, 90], [180, -180, 0, 180, -180]),
+    (
+        [-33.86785, -33.86786, -33.86785, -0.00001, 0.00001],
+        [-0.00001, 0, 0.00001, -151.20732, -151.20731],
+    ),
+    ([-54.80191], [-68.30295]),
+    ([0], [0]),
+    ([89.999995], [-179.999995]),
+    (rng.uniform(-90, 90, 10_000), rng.uniform(-180, 180, 10_000)),
+]
+for lats, lngs in cases:
+    lats_decoded, lngs_decoded = polyline.decode(polyline.encode(lats, lngs))
+    np.testing.assert_array_equal(polyline.to_ints(lats_decoded), polyline.to_ints(lats))
+    np.testing.assert_array_equal(polyline.to_ints(lngs_decoded), polyline.to_ints(lngs))
+    assert polyline.to_ints(lats_decoded).dtype == np.int64
+print(ox.ts(), f"{len(cases)} polyline encodings round-trip exactly")
+
+# packing must stay within both limits: limited by point count for compact
+# and scattered (large delta) points, by characters for a tight character
+# limit, and for a single point
+checks = [
+    ("compact", -33.87 + rng.normal(0, 0.01, 2000), 151.21 + rng.normal(0, 0.01, 2000), max_chars),
+    ("scattered", rng.uniform(-90, 90, 2000), rng.uniform(-180, 180, 2000), max_chars),
+    ("tight", -22.9 + rng.normal(0, 0.01, 2000), -43.2 + rng.normal(0, 0.01, 2000), 500),
+    ("single", np.array([-41.28664]), np.array([174.77557]), max_chars),
+]
+for name, lats, lngs, chars in checks:
+    packed = polyline.pack_locations(lats, lngs, coords_per_request, chars)
+    check_packed(packed, lats, lngs, coords_per_request, chars)
+    counts = [count for count, _ in packed]
+    msg = f"packed {len(lats):,} points into {len(packed)} parameters"
+    print(ox.ts(), f"{name:>9}: {msg} of up to {max(counts)} points")
+    if name == "tight":
+        assert max(counts) < coords_per_request
+    else:
+        assert all(count == coords_per_request for count in counts[:-1])
+
+# then time packing many clusters both ways
+clusters = []
+for _ in range(n_clusters):
+    lat, lng = rng.uniform(-60, 70), rng.uniform(-180, 180)
+    lats = lat + rng.normal(0, 0.02, cluster_size)
+    lngs = lng + rng.normal(0, 0.02, cluster_size)
+    clusters.append((lats, lngs))
+start_time = time.perf_counter()
+packed_clusters = [
+    polyline.pack_locations(lats, lngs, coords_per_request, max_chars) for lats, lngs in clusters
+]
+elapsed = time.perf_counter() - start_time
+n_params = sum(len(packed) for packed in packed_clusters)
+msg = f"Packed {n_clusters * cluster_size:,} points into {n_params:,} parameters"
+print(ox.ts(), f"{msg} in {elapsed:,.2f} seconds")
+
+# check them and compare their length to the same points as `lat,lng` pairs
+n_chars = n_pairs_chars = n_encoded = 0
+for (lats, lngs), packed in zip(clusters, packed_clusters, strict=True):
+    check_packed(packed, lats, lngs, coords_per_request, max_chars)
+    start = 0
+    for count, locations in packed:
+        n_chars += len(locations)
+        n_pairs_chars += len(pairs_only(lats[start : start + count], lngs[start : start + count]))
+        n_encoded += locations.startswith("enc")
+        start += count
+msg = f"{n_chars / 1e6:,.1f}M characters vs {n_pairs_chars / 1e6:,.1f}M as pairs"
+print(ox.ts(), f"{n_encoded:,} of {n_params:,} parameters are polylines, {msg}")
+assert n_chars <= n_pairs_chars
+print(ox.ts(), "All packed locations are within the limits and decode exactly")
@@ -0,0 +1,123 @@
+# ruff: noqa: INP001
+
+# Synthetic street networks for the benchmarks: jittered street grids built
+# the way OSMnx builds simplified graphs, with everything that makes their
+# indicators fiddly to compute. Streets are two-way (with reversed geometries
+# and osmid lists in the reverse edges) or one-way, straight (no geometry) or
+# curvy, made of one way or merged from several. Some grid cells have diagonal
+# streets across them (so the graphs have triangles), some node pairs have two
+# different streets between them, and some nodes have self-loops.
+
+import networkx as nx
+import numpy as np
+import osmnx as ox
+from shapely import LineString
+from snm import graphstore, sidecars
+
+# grid spacing (degrees) and its southwest corner
+spacing = 0.001
+origin = (-122.3, 37.8)
+
+
+# make a street with this many midpoints between two points, returning its
+# coordinates and its great-circle length
+def make_street(rng, start, end, n_midpoints):
+    t = np.sort(rng.uniform(0.1, 0.9, n_midpoints))
+    offsets = rng.normal(0, spacing / 8, (n_midpoints, 2))
+    midpoints = np.array(start) + np.outer(t, np.subtract(end, start)) + offsets
+    coords = np.vstack([start, midpoints, end])
+    lengths = ox.distance.great_circle(coords[:-1, 1], coords[:-1, 0], coords[1:, 1], coords[1:, 0])
+    return coords, float(lengths.sum())
+
+
+# add a street between an edge's nodes u and v to a graph, as one edge if it's
+# one-way or as two reciprocal edges if not
+def add_street(G, rng, edge, n_midpoints, way_id):
+    u, v = edge
+    start = (G.nodes[u]["x"], G.nodes[u]["y"])
+    end = (G.nodes[v]["x"], G.nodes[v]["y"])
+    coords, length = make_street(rng, start, end, n_midpoints)
+    osmid = [way_id, way_id + 1, way_id + 2] if rng.random() < 0.2 else way_id  # noqa: PLR2004
+    oneway = bool(rng.random() < 0.3)  # noqa: PLR2004
+    data = {"osmid": osmid, "oneway": oneway, "reversed": False, "length": length}
+    if n_midpoints > 0:
+        data["geometry"] = LineString(coords)
+    G.add_edge(u, v, **data)
+    if not oneway:
+        data = dict(data, reversed=True)
+        if isinstance(osmid, list):
+            data["osmid"] = osmid[::-1]
+        if n_midpoints > 0:
+            data["geometry"] = LineString(coords[::-1])
+        G.add_edge(v, u, **data)
+
+
+# make a size x size street grid graph with elevations, grades, and bc
+def make_grid(size, seed=0):
+    rng = np.random.default_rng(seed)
+    G = nx.MultiDiGraph(crs="epsg:4326")
+    ids = np.arange(1, size * size + 1).reshape(size, size)
+    for row in range(size):
+        for col in range(size):
+            x = origin[0] + col * spacing + rng.normal(0, spacing / 10)
+            y = origin[1] + row * spacing + rng.normal(0, spacing / 10)
+            G.add_node(int(ids[row, col]), x=x, y=y, elevation=float(rng.uniform(0, 300)))
+
+    # streets between grid neighbors, some with a second, different street
+    # between the same nodes, some diagonal streets, and some self-loops
+    pairs = [
+        *zip(ids[:, :-1].flat, ids[:, 1:].flat, strict=True),
+        *zip(ids[:-1].flat, ids[1:].flat, strict=True),
+    ]
+    way_id = 1_000_000
+    for u, v in pairs:
+        add_street(G, rng, (int(u), int(v)), int(rng.choice([0, 0, 0, 1, 3])), way_id)
+        if rng.random() < 0.02:  # noqa: PLR2004
+            add_street(G, rng, (int(u), int(v)), 2, way_id + 3)
+        way_id += 4
+    for u, v in zip(ids[:-1, :-1].flat, ids[1:, 1:].flat, strict=True):
+        if rng.random() < 0.1:  # noqa: PLR2004
+            add_street(G, rng, (int(u), int(v)), int(rng.choice([0, 1])), way_id)
+            way_id += 4
+    for node in rng.choice(ids.flat, size * size // 100, replace=False).tolist():
+        add_street(G, rng, (node, node), 3, way_id)
+        way_id += 4
+
+    nx.set_node_attributes(G, ox.stats.count_streets_per_node(G), name="street_count")
+    elevations = G.nodes(data="elevation")
+    for u, v, data in G.edges(data=True):
+        data["grade_abs"] = round(abs(elevations[v] - elevations[u]) / max(data["length"], 1), 3)
+    nx.set_node_attributes(G, dict(zip(G.nodes, rng.pareto(3, len(G)), strict=True)), name="bc")
+    return G
+
+
+# remove a share of a grid graph's streets between different nodes (in both
+# directions) then recount its nodes' streets, so it has dead-ends and nearby
+# nodes that aren't connected
+def remove_streets(G, share, seed=0) -> None:
+    rng = np.random.default_rng(seed)
+    streets = sorted({tuple(sorted((u, v))) for u, v in G.edges() if u != v})
+    remove = rng.random(len(streets)) < share
+    for u, v in np.array(streets)[remove].tolist():
+        G.remove_edges_from([(u, v, k) for k in list(G[u].get(v, {}))])
+        G.remove_edges_from([(v, u, k) for k in list(G[v].get(u, {}))])
+    nx.set_node_attributes(G, ox.stats.count_streets_per_node(G), name="street_count")
+
+
+# save a graph to a graph file, with its elevation, grade_abs, and bc
+# attributes in sidecars under attrs_root instead of in the graph file
+def save_grid(G, filepath, attrs_root) -> None:
+    G = G.copy()
+    for attr in ("elevation", "bc"):
+        values = dict(G.nodes(data=attr))
+        keys = {"osmid": list(values)}
+        meta = {"sample_size": None, "error": None} if attr == "bc" else None
+        sidecar = sidecars.sidecar_path(attrs_root, attr, filepath)
+        sidecars.save_sidecar(sidecar, keys, list(values.values()), meta=meta)
+        for _, data in G.nodes(data=True):
+            del data[attr]
+    edges = list(G.edges(keys=True, data=True))
+    keys = {"u": [e[0] for e in edges], "v": [e[1] for e in edges], "key": [e[2] for e in edges]}
+    grades = [data.pop("grade_abs") for _, _, _, data in edges]
+    sidecars.save_sidecar(sidecars.sidecar_path(attrs_root, "grade_abs", filepath), keys, grades)
+    graphstore.save_graph(G, filepath)
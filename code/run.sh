@@ -1,8 +1,14 @@
 #!/bin/bash
 set -euo pipefail
+
+# make the shared snm package importable by every stage's scripts
+export PYTHONPATH=.
+
 python ./01-construct-models/01-prep-ghsl.py
 python ./01-construct-models/02-download-cache.py
 python ./01-construct-models/03-create-graphs.py
+python ./01-construct-models/04-build-node-table.py
+python ./01-construct-models/05-plan-dem-tiles.py
 python ./02-attach-elevation/01-aster-srtm/01-download-aster_v3.py
 python ./02-attach-elevation/01-aster-srtm/02-download-srtmgl1.py
 python ./02-attach-elevation/01-aster-srtm/03-build-vrts.py
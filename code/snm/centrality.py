@@ -0,0 +1,113 @@
+# Length-weighted node betweenness centrality, exact or approximated by pivot
+# sampling (Brandes & Pich 2007): accumulate shortest-path dependencies from a
+# uniform random sample of k source nodes only, then scale by n / k. Each
+# source's dependency on a node is at most n - 2, so by Hoeffding's inequality
+# (and a union bound over all n nodes) every node's normalized estimate is
+# within the error bound of its exact value, with probability 1 - delta.
+#
+# BC is a sum of per-source dependencies, so one big graph's sources can also
+# be split across a process pool: each worker builds the graph once from edge
+# arrays in shared memory, then returns the partial BC of its sources' chunks.
+
+import multiprocessing as mp
+from math import log, sqrt
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from snm import csr
+
+# probability that any node's sampled estimate exceeds the error bound
+error_delta = 0.05
+
+# how many chunks of sources to make per CPU when splitting up one graph
+chunks_per_cpu = 4
+
+# seed for sampling source nodes, so sampled results are reproducible
+sample_seed = 0
+
+# the igraph graph each pool worker builds once from the shared edge arrays
+worker_graph = {}
+
+
+# get the error bound of normalized BC estimated from k of n source nodes
+def get_bc_error(n, k, delta=error_delta):
+    if k >= n:
+        return 0.0
+    return n / (n - 1) * sqrt(log(2 * n / delta) / (2 * k))
+
+
+# get all n source nodes, or a uniform random sample of them without replacement
+def get_sources(n, sample_size=None, seed=sample_seed):
+    if sample_size is None or sample_size >= n:
+        return np.arange(n)
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.choice(n, size=sample_size, replace=False))
+
+
+# copy arrays into shared memory blocks, returning the blocks and their specs
+def share_arrays(arrays):
+    blocks = []
+    specs = {}
+    for name, arr in arrays.items():
+        block = SharedMemory(create=True, size=max(arr.nbytes, 1))
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=block.buf)[:] = arr
+        blocks.append(block)
+        specs[name] = (block.name, arr.shape, arr.dtype.str)
+    return blocks, specs
+
+
+# pool worker initializer: build this worker's igraph graph from the shared
+# edge arrays (igraph copies them, so the blocks can be closed right after)
+def init_worker(n, specs, weight_attr) -> None:
+    blocks = {name: SharedMemory(name=spec[0]) for name, spec in specs.items()}
+    arrays = {
+        name: np.ndarray(shape, dtype=dtype, buffer=blocks[name].buf)
+        for name, (_, shape, dtype) in specs.items()
+    }
+    G_ig = csr.to_igraph(n, arrays["u"], arrays["v"], arrays["weights"], weight_attr)
+    worker_graph["G"] = G_ig
+    worker_graph["weight_attr"] = weight_attr
+    del arrays
+    for block in blocks.values():
+        block.close()
+
+
+# calculate the (unnormalized) BC contributed by a chunk of source nodes
+def calculate_partial_bc(sources):
+    G_ig = worker_graph["G"]
+    return np.array(G_ig.betweenness(sources=sources.tolist(), weights=worker_graph["weight_attr"]))
+
+
+# sum the partial BC of chunks of sources, calculated across a process pool
+def sum_partial_bc(n, edges, weight_attr, sources, cpus):
+    blocks, specs = share_arrays(edges)
+    chunks = np.array_split(sources, min(len(sources), cpus * chunks_per_cpu))
+    bc = np.zeros(n)
+    try:
+        initargs = (n, specs, weight_attr)
+        with mp.get_context().Pool(cpus, initializer=init_worker, initargs=initargs) as pool:
+            for partial_bc in pool.imap_unordered(calculate_partial_bc, chunks):
+                bc += partial_bc
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    return bc
+
+
+# calculate normalized BC from a graph's edge arrays (a dict of u, v, and
+# weights arrays of node positions and edge weights), exactly or (if
+# sample_size is less than the node count) from a sample of source nodes, and
+# in one process or split across a pool of cpus processes. returns the values,
+# the number of sources used, and the error bound
+def calculate_bc(n, edges, weight_attr, sample_size=None, cpus=1):
+    sources = get_sources(n, sample_size)
+    k = len(sources)
+    if cpus > 1:
+        bc = sum_partial_bc(n, edges, weight_attr, sources, cpus)
+    else:
+        G_ig = csr.to_igraph(n, edges["u"], edges["v"], edges["weights"], weight_attr)
+        bc_sources = None if k == n else sources.tolist()
+        bc = np.array(G_ig.betweenness(sources=bc_sources, weights=weight_attr))
+    return bc * n / k / (n - 1) / (n - 2), k, get_bc_error(n, k)
@@ -0,0 +1,114 @@
+# Count a graph's street intersections after consolidating nearby nodes, like
+# `ox.consolidate_intersections`, for many tolerances in one pass and without
+# buffering and unioning every node per tolerance. OSMnx buffers each
+# (non-dead-end) node by the tolerance and merges overlapping buffers: its
+# geometric count is the count of merged buffers, and its topological count
+# further splits each merged cluster into its nodes' connected components.
+#
+# Merged buffers are the connected components of the graph of node pairs whose
+# buffers intersect, so this is single-linkage clustering: a k-d tree finds
+# all node pairs within twice the largest tolerance once, then each tolerance
+# keeps the pairs its buffers merge. Buffers are polygons inscribed in their
+# circles (with geopandas' 16 segments per quarter circle), so pairs closer
+# than twice their inner radius always merge, pairs farther than twice the
+# tolerance never do, and only the few in between get their actual buffers
+# intersected.
+
+import geopandas as gpd
+import numpy as np
+import osmnx as ox
+import shapely
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import KDTree
+
+from snm import indicators
+
+# buffer resolution (segments per quarter circle), like geopandas' default
+quad_segs = 16
+
+
+# project nodes' lat-lng coordinates to the UTM zone ox.projection.project_graph
+# would choose for them, returning an array of x, y rows
+def project_nodes(x, y):
+    points = gpd.GeoDataFrame(geometry=gpd.points_from_xy(x, y), crs=ox.settings.default_crs)
+    return shapely.get_coordinates(ox.projection.project_gdf(points)["geometry"].array)
+
+
+# get the pairs of nodes (as rows of positions in xy) whose buffers of
+# tolerance meters intersect, from candidate pairs and their distances
+def merge_pairs(xy, pairs, distances, tolerance):
+    inner_radius = tolerance * np.cos(np.pi / (4 * quad_segs))
+    merged = distances < 2 * inner_radius
+    check = ~merged & (distances <= 2 * tolerance)
+    if check.any():
+        nodes, index = np.unique(pairs[check], return_inverse=True)
+        buffers = shapely.buffer(shapely.points(xy[nodes]), tolerance, quad_segs=quad_segs)
+        index = index.reshape(-1, 2)
+        merged[check] = shapely.intersects(buffers[index[:, 0]], buffers[index[:, 1]])
+    return pairs[merged]
+
+
+# count the connected components of a graph of n nodes and some edges (as
+# rows of node positions), returning the count and each node's label
+def components(n, edges):
+    data = np.ones(len(edges), dtype=bool)
+    graph = coo_matrix((data, (edges[:, 0], edges[:, 1])), shape=(n, n))
+    return connected_components(graph, directed=False)
+
+
+# find all pairs of nodes (as rows of projected x, y coordinates) within a
+# distance of each other, returning the pairs (as rows of positions in xy,
+# first position lowest) and their distances
+def candidate_pairs(xy, distance):
+    pairs = KDTree(xy).query_pairs(distance, output_type="ndarray")
+    return pairs, np.hypot(*(xy[pairs[:, 0]] - xy[pairs[:, 1]]).T)
+
+
+# count the clusters of n nodes given the pairs merged at each tolerance (as a
+# dict of tolerance:pairs), and those clusters' connected components given
+# graph edges (as rows of node positions). returns a dict of tolerance:
+# (geometric count, topological count)
+def cluster_counts(n, edges, merged):
+    counts = {}
+    for tolerance, pairs in merged.items():
+        n_clusters, labels = components(n, pairs)
+        inside = labels[edges[:, 0]] == labels[edges[:, 1]]
+        n_components, _ = components(n, edges[inside])
+        counts[tolerance] = (n_clusters, n_components)
+    return counts
+
+
+# count clusters of nodes (as rows of projected x, y coordinates) merged
+# within each tolerance, and those clusters' connected components given
+# graph edges (as rows of node positions). returns a dict of tolerance:
+# (geometric count, topological count)
+def consolidation_counts(xy, edges, tolerances):
+    pairs, distances = candidate_pairs(xy, 2 * max(tolerances))
+    merged = {t: merge_pairs(xy, pairs, distances, t) for t in tolerances}
+    return cluster_counts(len(xy), edges, merged)
+
+
+# get the nodes that count as intersections (non-dead-ends, like OSMnx by
+# default) from a graph's projected node coordinates and its node and edge
+# arrays: returns their coordinates and the edges between them, as rows of
+# positions in those coordinates
+def intersection_graph(xy, nodes, edges):
+    keep = np.asarray(nodes["street_count"]) > 1
+    positions = np.full(len(keep), -1)
+    positions[keep] = np.arange(keep.sum())
+    u = positions[indicators.node_positions(nodes["osmid"], edges["u"])]
+    v = positions[indicators.node_positions(nodes["osmid"], edges["v"])]
+    remaining = (u >= 0) & (v >= 0)
+    return xy[keep], np.c_[u, v][remaining]
+
+
+# count a graph's consolidated intersections from its node and edge arrays at
+# each tolerance (meters), ignoring dead-end nodes like OSMnx does by default.
+# returns a dict of tolerance: (geometric count, topological count)
+def intersection_counts(nodes, edges, tolerances):
+    xy = project_nodes(nodes["x"], nodes["y"])
+    xy, graph_edges = intersection_graph(xy, nodes, edges)
+    if len(xy) == 0:
+        return dict.fromkeys(tolerances, (0, 0))
+    return consolidation_counts(xy, graph_edges, tolerances)
@@ -0,0 +1,40 @@
+# Sparse representations of saved graphs built straight from their columnar
+# edge arrays, with no networkx graph and no per-edge python loop. Nodes are
+# renumbered by their position in the graph's node array, so the edge arrays
+# can be used directly as igraph vertex IDs or as scipy.sparse row/col indices.
+
+import igraph as ig
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from snm import graphstore
+
+
+# load a graph file's node osmids plus its edges' u/v node positions and weights
+def load_edges(filepath, weight_attr="length"):
+    nodes, edges = graphstore.load_arrays(filepath, node_attrs=[], edge_attrs=[weight_attr])
+    osmids = nodes["osmid"]
+    order = np.argsort(osmids, kind="stable")
+    u = order[np.searchsorted(osmids, edges["u"], sorter=order)]
+    v = order[np.searchsorted(osmids, edges["v"], sorter=order)]
+    return osmids, u, v, np.asarray(edges[weight_attr], dtype=float)
+
+
+# build an n x n CSR adjacency matrix of edge weights, collapsing parallel
+# edges to their minimum weight (like ox.convert.to_digraph). if undirected,
+# each edge is added in both directions
+def to_csr(n, u, v, weights, *, directed=True):
+    if not directed:
+        u, v, weights = np.r_[u, v], np.r_[v, u], np.r_[weights, weights]
+    order = np.lexsort((weights, v, u))
+    u, v, weights = u[order], v[order], weights[order]
+    first = np.r_[True, (np.diff(u) != 0) | (np.diff(v) != 0)]
+    return csr_matrix((weights[first], (u[first], v[first])), shape=(n, n))
+
+
+# build a directed igraph multigraph with a weight attribute on its edges, and
+# ensure weight values are >0 for igraph
+def to_igraph(n, u, v, weights, weight_attr="length"):
+    weights = np.where(weights == 0, 0.001, weights)
+    edges = np.column_stack((u, v))
+    return ig.Graph(n=n, edges=edges, directed=True, edge_attrs={weight_attr: weights.tolist()})
@@ -0,0 +1,154 @@
+# Streaming, resumable file downloads on a pool of threads. Each thread reuses
+# one authenticated HTTP session (so NASA EarthData's login redirect and
+# cookies are handled once per thread, not once per file), streams each file
+# to a temporary ".part" file next to its destination, resumes an interrupted
+# ".part" file with an HTTP Range request, checks its size (and its checksum,
+# if known), and only then atomically renames it into place, so a file at its
+# final path is always a complete download.
+
+import hashlib
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import requests
+
+# NASA EarthData login host: requests may be redirected to it to authenticate
+auth_host = "urs.earthdata.nasa.gov"
+
+# stream responses in chunks of this many bytes
+chunk_size = 1 << 20
+
+# retry failed downloads up to this many times, with backoff starting at this
+# many seconds and doubling per retry
+max_retries = 5
+base_delay = 1.0
+
+# give up on a connection or read that takes longer than this many seconds
+timeout = 60
+
+
+# a requests session that keeps its credentials on redirects to and from the
+# EarthData login host, which requests would otherwise drop as cross-host
+class AuthSession(requests.Session):
+    def rebuild_auth(self, prepared_request, response) -> None:
+        original = urlsplit(response.request.url).hostname
+        redirect = urlsplit(prepared_request.url).hostname
+        if "Authorization" in prepared_request.headers and auth_host not in {original, redirect}:
+            super().rebuild_auth(prepared_request, response)
+
+
+# get the current thread's session, creating it on first use
+def get_session(local, auth):
+    if not hasattr(local, "session"):
+        local.session = AuthSession()
+        local.session.trust_env = False
+        local.session.auth = auth
+    return local.session
+
+
+# get a file's hex digest with some hashlib algorithm
+def get_digest(filepath, algorithm="sha256"):
+    digest = hashlib.new(algorithm)
+    with Path(filepath).open("rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# get the total size of the file a (possibly partial) response is serving, or
+# None if the server doesn't say
+def get_total_size(response, offset):
+    content_range = response.headers.get("Content-Range", "")
+    if "/" in content_range and not content_range.endswith("/*"):
+        return int(content_range.rsplit("/", 1)[1])
+    if "Content-Length" in response.headers and response.ok:
+        return offset + int(response.headers["Content-Length"])
+    return None
+
+
+# stream one URL to a ".part" file, resuming from its current size, and
+# return the file's total size according to the server
+def stream_part(session, url, part_path):
+    offset = part_path.stat().st_size if part_path.is_file() else 0
+    headers = {"Range": f"bytes={offset}-"} if offset > 0 else {}
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        # the part is already complete, so the server can't serve its range. if
+        # the server doesn't say the file's size we can't tell, so start over
+        if response.status_code == 416:  # noqa: PLR2004
+            total_size = get_total_size(response, 0)
+            if total_size is None:
+                part_path.unlink()
+                msg = "Range not satisfiable and file size unknown"
+                raise ValueError(msg)
+            return total_size
+        response.raise_for_status()
+
+        # the server ignored the range request, so start over
+        if response.status_code != 206:  # noqa: PLR2004
+            offset = 0
+        total_size = get_total_size(response, offset)
+        with part_path.open("r+b" if offset > 0 else "wb") as f:
+            f.seek(offset)
+            f.truncate()
+            for chunk in response.iter_content(chunk_size):
+                f.write(chunk)
+    return total_size
+
+
+# make one attempt to download a URL to a filepath: stream (or resume) its
+# ".part" file, check its size and sha256 (if given), then rename it into
+# place. raises an exception if the download failed or the part is bad
+def download_part(session, url, filepath, part_path, sha256=None) -> None:
+    total_size = stream_part(session, url, part_path)
+    size = part_path.stat().st_size
+    if total_size is not None and size != total_size:
+        # a part bigger than the file can't be resumed, so start over
+        if size > total_size:
+            part_path.unlink()
+        msg = f"Expected {total_size:,} bytes but got {size:,}"
+        raise ValueError(msg)
+    if sha256 is not None and get_digest(part_path) != sha256:
+        part_path.unlink()
+        msg = "Checksum mismatch"
+        raise ValueError(msg)
+    part_path.replace(filepath)
+
+
+# download a URL to a filepath, retrying and resuming on failure. if sha256 is
+# given, the file's digest must match it. returns the count of attempts made
+def download_file(session, url, filepath, sha256=None):
+    filepath = Path(filepath)
+    part_path = filepath.with_name(filepath.name + ".part")
+    for attempt in range(max_retries + 1):
+        try:
+            download_part(session, url, filepath, part_path, sha256)
+        except (requests.RequestException, ValueError):
+            if attempt == max_retries:
+                raise
+        else:
+            return attempt + 1
+        time.sleep(random.uniform(0, base_delay * 2**attempt))
+    return max_retries + 1
+
+
+# download (url, filepath) items on a pool of threads, each reusing one
+# session with some (username, password) auth, optionally checking each file
+# against checksums (a dict of url -> sha256 hex digest). returns a dict of
+# url -> count of attempts, or the exception if every attempt failed
+def download_all(items, auth, threads, checksums=None):
+    local = threading.local()
+    checksums = {} if checksums is None else checksums
+
+    def download(url, filepath):
+        try:
+            return download_file(get_session(local, auth), url, filepath, checksums.get(url))
+        except (requests.RequestException, ValueError, OSError) as e:
+            return e
+
+    with ThreadPoolExecutor(threads) as pool:
+        futures = {url: pool.submit(download, url, filepath) for url, filepath in items}
+    return {url: future.result() for url, future in futures.items()}
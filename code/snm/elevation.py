@@ -0,0 +1,149 @@
+# Vectorized elevation sampling from DEM rasters. We build one VRT per DEM
+# source, once, then sample a whole array of node coordinates from it at a
+# time: points are grouped by DEM tile, and each tile's points are read with a
+# single windowed read covering just their pixels, instead of opening the VRT
+# and sampling it point by point for every graph. Zipped DEM tiles are read in
+# place through GDAL's /vsizip/ file system, without extracting them.
+
+from collections import OrderedDict
+from pathlib import Path
+from xml.etree import ElementTree as ET
+from zipfile import ZipFile
+
+import numpy as np
+import rasterio
+from rasterio.env import get_gdal_config
+from rasterio.windows import Window
+from rio_vrt import build_vrt
+
+from snm import tiles
+
+# a model of the GDAL block cache of the VRT that sample_raster has open: the
+# raster blocks it has read (and their sizes in bytes), least recently read
+# first, evicted like GDAL's LRU cache once they outgrow GDAL_CACHEMAX, to
+# estimate how often reads are served from the block cache rather than from
+# disk. GDAL drops a dataset's cached blocks when it's closed, so the model is
+# cleared each time sample_raster opens the VRT
+block_cache = OrderedDict()
+
+
+# get GDAL /vsizip/ paths to the raster files in a zip file, with the zip's
+# path in braces so it survives path normalization (like rio_vrt's)
+def get_zip_raster_paths(zip_path, suffix=".hgt"):
+    zip_path = Path(zip_path).resolve()
+    with ZipFile(zip_path) as z:
+        names = [name for name in z.namelist() if name.endswith(suffix)]
+    return [f"/vsizip/{{{zip_path}}}/{name}" for name in names]
+
+
+# get the file on disk that a raster path reads: its zip file, for /vsizip/
+# paths
+def get_raster_file(raster_path):
+    raster_path = str(raster_path)
+    if raster_path.startswith("/vsizip/{"):
+        return Path(raster_path[len("/vsizip/{") : raster_path.index("}/")])
+    return Path(raster_path)
+
+
+# get the set of raster paths a VRT file composites
+def get_vrt_sources(vrt_path):
+    root = ET.parse(vrt_path).getroot()
+    return {source.text for source in root.iter("SourceFilename")}
+
+
+# build a VRT file compositing all the raster files, unless it already exists
+# with the same rasters (as rio_vrt writes their paths) and is newer than all
+# of them, so a stale VRT isn't reused after the tile plan or rasters change
+def get_vrt(vrt_path, raster_paths):
+    vrt_path = Path(vrt_path)
+    raster_paths = sorted(raster_paths, key=str)
+    if vrt_path.is_file():
+        sources = {str(Path(fp).resolve()) for fp in raster_paths}
+        newest = max((get_raster_file(fp).stat().st_mtime for fp in raster_paths), default=0)
+        if get_vrt_sources(vrt_path) == sources and vrt_path.stat().st_mtime >= newest:
+            return vrt_path
+    vrt_path.parent.mkdir(parents=True, exist_ok=True)
+    build_vrt(vrt_path, raster_paths)
+    return vrt_path
+
+
+# get the size of GDAL's block cache in bytes. GDAL_CACHEMAX is in megabytes
+# if it's less than 100,000, otherwise in bytes
+def get_cache_max():
+    cache_max = int(get_gdal_config("GDAL_CACHEMAX"))
+    return cache_max * 1024 * 1024 if cache_max < 100_000 else cache_max  # noqa: PLR2004
+
+
+# count how many raster blocks a window covers and how many of them are still
+# in the modeled block cache, then add them to it, evicting the least recently
+# read blocks beyond the cache's size
+def count_blocks(vrt_path, window, block_shape, block_bytes):
+    block_h, block_w = block_shape
+    last_row = window.row_off + window.height - 1
+    last_col = window.col_off + window.width - 1
+    block_rows = range(window.row_off // block_h, last_row // block_h + 1)
+    block_cols = range(window.col_off // block_w, last_col // block_w + 1)
+    cached = 0
+    for block in ((str(vrt_path), r, c) for r in block_rows for c in block_cols):
+        if block in block_cache:
+            cached += 1
+            block_cache.move_to_end(block)
+        else:
+            block_cache[block] = block_bytes
+    cache_bytes = sum(block_cache.values())
+    cache_max = get_cache_max()
+    while cache_bytes > cache_max and block_cache:
+        cache_bytes -= block_cache.popitem(last=False)[1]
+    return len(block_rows) * len(block_cols), cached
+
+
+# sample raster values at points, one windowed read per tile's worth of points,
+# visiting tiles in hilbert curve order. returns the values and a list of each
+# tile's read stats
+def sample_raster(vrt_path, x, y, band=1):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    values = np.full(len(x), np.nan)
+    stats = []
+    block_cache.clear()
+    with rasterio.open(vrt_path) as src:
+        # get each point's pixel row/col in the (north-up) raster
+        t = src.transform
+        cols = np.floor((x - t.c) / t.a).astype(np.int64)
+        rows = np.floor((y - t.f) / t.e).astype(np.int64)
+        inside = (cols >= 0) & (cols < src.width) & (rows >= 0) & (rows < src.height)
+        block_shape = src.block_shapes[band - 1]
+        block_bytes = np.dtype(src.dtypes[band - 1]).itemsize * block_shape[0] * block_shape[1]
+
+        # group the points by tile then read one window per tile
+        positions = np.flatnonzero(inside)
+        tile_ids = tiles.get_tile_ids(x[positions], y[positions])
+        order = np.lexsort((tile_ids, tiles.get_hilbert_index(tile_ids)))
+        positions = positions[order]
+        tile_ids = tile_ids[order]
+        starts = np.flatnonzero(np.diff(tile_ids, prepend=-1))
+        ends = np.append(starts[1:], len(tile_ids))[: len(starts)]
+        for start, end in zip(starts, ends, strict=True):
+            group = positions[start:end]
+            tile_id = tile_ids[start]
+            row_off = rows[group].min()
+            col_off = cols[group].min()
+            height = rows[group].max() - row_off + 1
+            width = cols[group].max() - col_off + 1
+            window = Window(col_off, row_off, width, height)
+            data = src.read(band, window=window, masked=False)
+            blocks, cached = count_blocks(vrt_path, window, block_shape, block_bytes)
+            stats.append(
+                {
+                    "tile": tiles.get_tile_name(tile_id),
+                    "points": len(group),
+                    "bytes_read": data.nbytes,
+                    "blocks_read": blocks,
+                    "blocks_cached": cached,
+                },
+            )
+            group_values = data[rows[group] - row_off, cols[group] - col_off].astype(float)
+            if src.nodata is not None:
+                group_values[group_values == src.nodata] = np.nan
+            values[group] = group_values
+    return values, stats
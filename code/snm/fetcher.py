@@ -0,0 +1,123 @@
+# Asynchronous fetching of Google Elevation API URLs over one pooled HTTP
+# client. Each API key gets a token bucket that caps its request rate, failed
+# requests (HTTP errors, connection errors, retryable API statuses, or partial
+# results) are retried with exponential backoff and full jitter, and each
+# response is handed to a callback as soon as it arrives, so results can be
+# streamed to disk instead of held in memory until everything finishes.
+
+import asyncio
+import random
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import aiohttp
+
+# retry failed requests up to this many times, with backoff starting at this
+# many seconds and doubling per retry
+max_retries = 5
+base_delay = 1.0
+
+# API statuses worth retrying: anything else that isn't OK is a permanent error
+retry_statuses = {"OVER_QUERY_LIMIT", "UNKNOWN_ERROR"}
+
+# HTTP statuses worth retrying
+retry_http_statuses = {429, 500, 502, 503, 504}
+
+# give up on a request that takes longer than this many seconds
+timeout = 60
+
+
+# a token bucket rate limiter: allows `rate` requests per second on average,
+# with bursts of up to `capacity` requests
+class TokenBucket:
+    def __init__(self, rate, capacity) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    # wait until a token is available, then take it
+    async def acquire(self) -> None:
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# get the API key from a URL's query string
+def get_key(url):
+    return parse_qs(urlsplit(url).query).get("key", [""])[0]
+
+
+# check that an API response is OK and has an elevation for each of count
+# locations
+def is_complete(data, count):
+    if not isinstance(data, dict):
+        return False
+    results = data.get("results")
+    if data.get("status") != "OK" or not isinstance(results, list) or len(results) != count:
+        return False
+    return all(isinstance(r, dict) and r.get("elevation") is not None for r in results)
+
+
+# request a URL until it returns a complete result or we run out of retries.
+# returns the response json (or None if it failed) and the count of attempts
+async def fetch_json(session, url, count, bucket):
+    for attempt in range(max_retries + 1):
+        await bucket.acquire()
+        retry = True
+        try:
+            async with session.get(url) as response:
+                data = await response.json(content_type=None)
+                http_status = response.status
+            if http_status == 200 and is_complete(data, count):  # noqa: PLR2004
+                return data, attempt + 1
+            # a body that isn't a json object (e.g., from a proxy's error page)
+            # has no status, so retry it like any other failed request
+            if isinstance(data, dict):
+                status = data.get("status")
+                retry = (
+                    http_status in retry_http_statuses or status in retry_statuses or status == "OK"
+                )
+        except (aiohttp.ClientError, TimeoutError, ValueError):
+            pass
+        if not retry:
+            return None, attempt + 1
+        if attempt < max_retries:
+            await asyncio.sleep(random.uniform(0, base_delay * 2**attempt))
+    return None, max_retries + 1
+
+
+# fetch (count of nodes, url) items with `concurrency` requests in flight at a
+# time and each API key limited to `rate` requests per second, calling
+# on_result(i, data, attempts) as each item's response arrives
+async def fetch_all(items, on_result, rate, concurrency):
+    queue = asyncio.Queue()
+    for i, item in enumerate(items):
+        queue.put_nowait((i, item))
+    buckets = {}
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async def worker(session) -> None:
+        while not queue.empty():
+            i, (count, url) = queue.get_nowait()
+            key = get_key(url)
+            if key not in buckets:
+                buckets[key] = TokenBucket(rate, capacity=rate)
+            data, attempts = await fetch_json(session, url, count, buckets[key])
+            on_result(i, data, attempts)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+
+
+# run fetch_all in a new event loop
+def fetch(items, on_result, rate, concurrency) -> None:
+    asyncio.run(fetch_all(items, on_result, rate, concurrency))
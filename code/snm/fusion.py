@@ -0,0 +1,39 @@
+# Elevation fusion and edge grades, computed once over the global tables
+# instead of graph by graph. Each node's elevation is chosen in one vectorized
+# pass over the global node elevations table (with its ASTER, SRTM, and Google
+# values), then each edge's grade is calculated in one vectorized pass over the
+# global edge table of every unique (u, v, length). Graphs don't store either:
+# they look them up in the resulting tables when they're loaded for stats or
+# exported.
+
+import numpy as np
+
+from snm import tables
+
+# edges' grades depend only on their nodes and their length, so the global
+# edge and grade tables are keyed by all three
+edge_key = ["u", "v", "length"]
+
+
+# choose each node's elevation as its SRTM or ASTER value, whichever is closer
+# to its Google value (as a tie-breaker), or SRTM if there's no Google value.
+# returns the elevations, whether each node uses SRTM, and a dict of each
+# source's differences from Google (inf where missing)
+def choose_elevations(aster, srtm, google):
+    diffs = {
+        "elev_diff_aster_google": np.asarray(aster) - google,
+        "elev_diff_srtm_google": np.asarray(srtm) - google,
+    }
+    diffs = {name: np.where(np.isnan(diff), np.inf, diff) for name, diff in diffs.items()}
+    use_srtm = np.abs(diffs["elev_diff_srtm_google"]) <= np.abs(diffs["elev_diff_aster_google"])
+    return np.where(use_srtm, srtm, aster), use_srtm, diffs
+
+
+# calculate edges' grades (rise over run) from their u, v, and length arrays
+# and a node elevations table (inf or NaN where an edge's length is 0)
+def edge_grades(elevations, u, v, lengths):
+    u_pos, _ = tables.lookup(elevations["osmid"], u)
+    v_pos, _ = tables.lookup(elevations["osmid"], v)
+    rise = elevations["elevation"][v_pos] - elevations["elevation"][u_pos]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return rise / lengths
@@ -0,0 +1,265 @@
+# Binary columnar graph store, used as the intermediate model format between
+# pipeline stages so we only pay the GraphML parse/serialize cost once, at the
+# very end, when we save the files we publish to the repository.
+#
+# Each graph is saved as one uncompressed NumPy .npz file holding one array
+# per node/edge attribute. Numeric and boolean attributes are stored natively.
+# Everything else (strings, lists of OSM IDs, etc) is stored like GraphML does
+# it, as stringified values, then converted back on load exactly the way that
+# `ox.io.load_graphml` converts them. Edge geometries are stored as one flat
+# coordinates array plus per-edge offsets into it.
+
+import ast
+import contextlib
+import itertools
+import json
+from pathlib import Path
+
+import networkx as nx
+import numpy as np
+import shapely
+from osmnx.io import _convert_bool_string
+
+# same default attribute types that ox.io.load_graphml uses
+default_node_dtypes = {
+    "elevation": float,
+    "elevation_res": float,
+    "osmid": int,
+    "street_count": int,
+    "x": float,
+    "y": float,
+}
+default_edge_dtypes = {
+    "bearing": float,
+    "grade": float,
+    "grade_abs": float,
+    "length": float,
+    "oneway": _convert_bool_string,
+    "osmid": int,
+    "reversed": _convert_bool_string,
+    "speed_kph": float,
+    "travel_time": float,
+}
+
+
+# determine how to store a column of (non-null) attribute values
+def get_kind(values):
+    kinds = set()
+    for value in values:
+        if isinstance(value, bool | np.bool_):
+            kinds.add("bool")
+        elif isinstance(value, int | np.integer):
+            kinds.add("int")
+        elif isinstance(value, float | np.floating):
+            kinds.add("float")
+        else:
+            return "str"
+    if kinds == {"bool"}:
+        return "bool"
+    if kinds == {"int"}:
+        return "int"
+    return "str" if "bool" in kinds else "float"
+
+
+# convert a list of attribute values into arrays keyed by name
+def encode_column(name, values, kind):
+    mask = np.array([value is not None for value in values], dtype=bool)
+    arrays = {} if mask.all() else {f"{name}/mask": mask}
+    if kind == "bool":
+        arrays[name] = np.array([bool(value) for value in values], dtype=bool)
+    elif kind == "int":
+        arrays[name] = np.array([0 if value is None else value for value in values], dtype=np.int64)
+    elif kind == "float":
+        arrays[name] = np.array(
+            [np.nan if value is None else value for value in values],
+            dtype=float,
+        )
+    else:
+        # store strings as one UTF-8 text blob plus character offsets into it
+        strings = ["" if value is None else str(value) for value in values]
+        lengths = np.fromiter((len(s) for s in strings), dtype=np.int64, count=len(strings))
+        arrays[f"{name}/text"] = np.frombuffer("".join(strings).encode("utf-8"), dtype=np.uint8)
+        arrays[f"{name}/offsets"] = np.concatenate([[0], np.cumsum(lengths)])
+    return arrays
+
+
+# convert a list of edge geometries into flat coordinates plus offsets
+def encode_geometry(name, geoms):
+    mask = np.array([geom is not None for geom in geoms], dtype=bool)
+    arrays = {} if mask.all() else {f"{name}/mask": mask}
+    geoms = np.array([shapely.LineString() if g is None else g for g in geoms], dtype=object)
+    coords, index = shapely.get_coordinates(geoms, return_index=True)
+    counts = np.bincount(index, minlength=len(geoms))
+    arrays[f"{name}/coords"] = coords
+    arrays[f"{name}/offsets"] = np.concatenate([[0], np.cumsum(counts)])
+    return arrays
+
+
+def encode_attrs(prefix, datas):
+    arrays = {}
+    kinds = {}
+    names = sorted({attr for data in datas for attr in data})
+    for attr in names:
+        values = [data.get(attr) for data in datas]
+        name = f"{prefix}/{attr}"
+        if attr == "geometry" and prefix == "edges":
+            kinds[attr] = "geometry"
+            arrays.update(encode_geometry(name, values))
+        else:
+            kinds[attr] = get_kind(value for value in values if value is not None)
+            arrays.update(encode_column(name, values, kinds[attr]))
+    return arrays, kinds
+
+
+# save a graph to disk in the columnar store format
+def save_graph(G, filepath) -> None:
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+
+    nodes, node_datas = zip(*G.nodes(data=True), strict=True) if len(G) else ((), ())
+    edges = list(G.edges(keys=True, data=True))
+    edge_datas = [data for _, _, _, data in edges]
+    node_arrays, node_kinds = encode_attrs("nodes", node_datas)
+    edge_arrays, edge_kinds = encode_attrs("edges", edge_datas)
+
+    meta = {
+        "graph": {attr: str(value) for attr, value in G.graph.items()},
+        "nodes": node_kinds,
+        "edges": edge_kinds,
+    }
+    arrays = {
+        "meta": np.array(json.dumps(meta)),
+        "nodes/osmid": np.array(nodes, dtype=np.int64),
+        "edges/u": np.array([u for u, _, _, _ in edges], dtype=np.int64),
+        "edges/v": np.array([v for _, v, _, _ in edges], dtype=np.int64),
+        "edges/key": np.array([k for _, _, k, _ in edges], dtype=np.int64),
+    }
+    arrays.update(node_arrays)
+    arrays.update(edge_arrays)
+    with filepath.open("wb") as f:
+        np.savez(f, **arrays)
+
+
+# decode one stored column back into an array of values
+def decode_column(f, name, kind):
+    if kind == "geometry":
+        coords = f[f"{name}/coords"]
+        offsets = f[f"{name}/offsets"]
+        counts = np.diff(offsets)
+        has_coords = counts > 0
+        index = np.repeat(np.arange(has_coords.sum()), counts[has_coords])
+        values = np.full(len(counts), None, dtype=object)
+        values[has_coords] = shapely.linestrings(coords, indices=index)
+        return values
+    if kind == "str":
+        text = f[f"{name}/text"].tobytes().decode("utf-8")
+        offsets = f[f"{name}/offsets"].tolist()
+        values = np.empty(len(offsets) - 1, dtype=object)
+        values[:] = [text[i:j] for i, j in itertools.pairwise(offsets)]
+        return values
+    return f[name]
+
+
+def get_mask(f, name, n):
+    key = f"{name}/mask"
+    return f[key] if key in f.files else np.ones(n, dtype=bool)
+
+
+# convert stringified values the same way ox.io.load_graphml does
+def convert_str(value, dtype, lists):
+    if (value.startswith("[") and value.endswith("]")) or (
+        value.startswith("{") and value.endswith("}")
+    ):
+        with contextlib.suppress(SyntaxError, ValueError):
+            value = ast.literal_eval(value)
+    if dtype is None:
+        return value
+    if lists and isinstance(value, list):
+        return [dtype(item) for item in value]
+    return dtype(value)
+
+
+def decode_attrs(f, prefix, kinds, n, dtypes):
+    defaults = default_node_dtypes if prefix == "nodes" else default_edge_dtypes
+    datas = [{} for _ in range(n)]
+    for attr, kind in kinds.items():
+        name = f"{prefix}/{attr}"
+        values = decode_column(f, name, kind).tolist()
+        mask = get_mask(f, name, n).tolist()
+        if kind == "str":
+            dtype = dtypes.get(attr, defaults.get(attr))
+            for data, value, present in zip(datas, values, mask, strict=True):
+                if present:
+                    data[attr] = convert_str(value, dtype, prefix == "edges")
+        else:
+            dtype = dtypes.get(attr) if kind != "geometry" else None
+            for data, value, present in zip(datas, values, mask, strict=True):
+                if present:
+                    data[attr] = value if dtype is None else dtype(value)
+    return datas
+
+
+# load a graph from the columnar store format as a MultiDiGraph
+def load_graph(filepath, node_dtypes=None, edge_dtypes=None):
+    node_dtypes = {} if node_dtypes is None else node_dtypes
+    edge_dtypes = {} if edge_dtypes is None else edge_dtypes
+    with np.load(filepath) as f:
+        meta = json.loads(str(f["meta"]))
+        graph_attrs = meta["graph"]
+        for attr in ("consolidated", "simplified"):
+            if attr in graph_attrs:
+                graph_attrs[attr] = _convert_bool_string(graph_attrs[attr])
+
+        nodes = f["nodes/osmid"].tolist()
+        u = f["edges/u"].tolist()
+        v = f["edges/v"].tolist()
+        k = f["edges/key"].tolist()
+        node_datas = decode_attrs(f, "nodes", meta["nodes"], len(nodes), node_dtypes)
+        edge_datas = decode_attrs(f, "edges", meta["edges"], len(u), edge_dtypes)
+
+    G = nx.MultiDiGraph(**graph_attrs)
+    G.add_nodes_from(zip(nodes, node_datas, strict=True))
+    G.add_edges_from(zip(u, v, k, edge_datas, strict=True))
+    return G
+
+
+def decode_arrays(f, prefix, kinds, keys, attrs):
+    if attrs is None:
+        attrs = [attr for attr, kind in kinds.items() if kind in {"bool", "int", "float"}]
+    result = {key: f[f"{prefix}/{key}"] for key in keys}
+    n = len(result[keys[0]])
+    for attr in attrs:
+        if attr in result:
+            continue
+        if attr not in kinds:
+            msg = f"{prefix} attribute {attr!r} not found"
+            raise KeyError(msg)
+        name = f"{prefix}/{attr}"
+        values = decode_column(f, name, kinds[attr])
+        mask = get_mask(f, name, n)
+        if not mask.all():
+            if kinds[attr] in {"int", "float"}:
+                values = values.astype(float)
+                values[~mask] = np.nan
+            else:
+                values = values.astype(object)
+                values[~mask] = None
+        result[attr] = values
+    return result
+
+
+# load a graph's node and edge attributes as arrays, without building a graph
+# if attrs are None, return all numeric/boolean attributes, otherwise return
+# the requested ones (missing values are NaN in numeric arrays, else None)
+def load_arrays(filepath, node_attrs=None, edge_attrs=None):
+    with np.load(filepath) as f:
+        meta = json.loads(str(f["meta"]))
+        nodes = decode_arrays(f, "nodes", meta["nodes"], ["osmid"], node_attrs)
+        edges = decode_arrays(f, "edges", meta["edges"], ["u", "v", "key"], edge_attrs)
+    return nodes, edges
+
+
+# get a graph's node and edge counts without decoding any attributes
+def graph_size(filepath):
+    with np.load(filepath) as f:
+        return len(f["nodes/osmid"]), len(f["edges/u"])
@@ -0,0 +1,157 @@
+# Consolidated cache of HTTP JSON responses (Overpass and Google Elevation
+# API), replacing OSMnx's one-JSON-file-per-URL cache folder. Responses are
+# zlib-compressed blobs in a few SQLite shard databases, indexed by the SHA-1
+# digest of their URL (the same key OSMnx uses to name its cache files, so
+# the two formats convert losslessly). Existence checks and reads are done in
+# bulk, one indexed query per shard per chunk of keys, instead of one file
+# system lookup per URL.
+
+import json
+import sqlite3
+import zlib
+from contextlib import contextmanager
+from hashlib import sha1
+from pathlib import Path
+
+import osmnx as ox
+
+# count of shard databases, and zlib compression level of response blobs
+n_shards = 16
+compression_level = 6
+
+# query at most this many keys per SQL statement
+chunk_size = 500
+
+# wait this many seconds for another process's write lock before failing
+busy_timeout = 60
+
+# SQLite journal mode of the shards. the default rollback journal works on
+# network filesystems, unlike WAL, which needs shared memory between processes:
+# only use WAL if every process using the cache is on the same machine
+journal_mode = "DELETE"
+
+
+# get a URL's cache key: its SHA-1 hex digest, like OSMnx's cache filenames
+def get_key(url):
+    return sha1(url.encode("utf-8")).hexdigest()
+
+
+# get the shard a key is stored in
+def get_shard(key):
+    return int(key[:8], 16) % n_shards
+
+
+# open (and create if needed) one shard database of a cache, committing (or
+# rolling back, on error) and closing it on exit
+@contextmanager
+def open_shard(folder, shard):
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(folder / f"shard-{shard:02d}.sqlite", timeout=busy_timeout)
+    con.execute(f"PRAGMA journal_mode={journal_mode}")
+    sql = "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, data BLOB) WITHOUT ROWID"
+    con.execute(sql)
+    try:
+        with con:
+            yield con
+    finally:
+        con.close()
+
+
+# group keys by their shard: returns a dict of shard -> list of keys
+def group_keys(keys):
+    groups = {}
+    for key in keys:
+        groups.setdefault(get_shard(key), []).append(key)
+    return groups
+
+
+# yield (key, compressed data) rows of the stored keys among `keys`
+def query_keys(folder, keys, columns):
+    for shard, shard_keys in group_keys(keys).items():
+        with open_shard(folder, shard) as con:
+            for i in range(0, len(shard_keys), chunk_size):
+                chunk = shard_keys[i : i + chunk_size]
+                placeholders = ",".join("?" * len(chunk))
+                sql = f"SELECT {columns} FROM responses WHERE key IN ({placeholders})"
+                yield from con.execute(sql, chunk)
+
+
+# check which URLs have cached responses: returns a list of bools
+def exists(folder, urls):
+    keys = [get_key(url) for url in urls]
+    found = {row[0] for row in query_keys(folder, keys, "key")}
+    return [key in found for key in keys]
+
+
+# yield (url, response json) for each URL that has a cached response, in
+# shard order rather than the order given
+def read(folder, urls):
+    urls_by_key = {get_key(url): url for url in urls}
+    for key, data in query_keys(folder, list(urls_by_key), "key, data"):
+        yield urls_by_key[key], json.loads(zlib.decompress(data))
+
+
+# store (key, response json) items, one transaction per shard
+def write_keys(folder, items):
+    rows = {}
+    for key, response_json in items:
+        data = zlib.compress(json.dumps(response_json).encode("utf-8"), compression_level)
+        rows.setdefault(get_shard(key), []).append((key, data))
+    for shard, shard_rows in rows.items():
+        with open_shard(folder, shard) as con:
+            con.executemany(
+                "INSERT OR REPLACE INTO responses (key, data) VALUES (?, ?)",
+                shard_rows,
+            )
+    return sum(len(shard_rows) for shard_rows in rows.values())
+
+
+# store (url, response json) items. returns the count of responses stored
+def write(folder, items):
+    return write_keys(folder, ((get_key(url), response_json) for url, response_json in items))
+
+
+# import an OSMnx per-file cache folder into a cache, in batches of files.
+# returns the count of responses imported
+def import_folder(folder, cache_folder, batch_size=10_000):
+    count = 0
+    batch = []
+    for filepath in Path(cache_folder).glob("*.json"):
+        batch.append((filepath.stem, json.loads(filepath.read_text(encoding="utf-8"))))
+        if len(batch) >= batch_size:
+            count += write_keys(folder, batch)
+            batch = []
+    return count + write_keys(folder, batch)
+
+
+# export every response in a cache to an OSMnx per-file cache folder. returns
+# the count of responses exported
+def export_folder(folder, cache_folder):
+    cache_folder = Path(cache_folder)
+    cache_folder.mkdir(parents=True, exist_ok=True)
+    count = 0
+    for shard in range(n_shards):
+        with open_shard(folder, shard) as con:
+            for key, data in con.execute("SELECT key, data FROM responses"):
+                (cache_folder / f"{key}.json").write_bytes(zlib.decompress(data))
+                count += 1
+    return count
+
+
+# make OSMnx read and save its HTTP responses in a cache instead of its
+# per-file cache folder. responses are only saved under the same conditions
+# OSMnx uses: caching is on, the request was OK, and there's no server remark
+def install(folder) -> None:
+    def retrieve_from_cache(url):
+        if not ox.settings.use_cache:
+            return None
+        return next((response_json for _, response_json in read(folder, [url])), None)
+
+    def save_to_cache(url, response_json, ok) -> None:
+        remark = isinstance(response_json, dict) and "remark" in response_json
+        if ox.settings.use_cache and ok and response_json is not None and not remark:
+            write(folder, [(url, response_json)])
+
+    ox._http._retrieve_from_cache = retrieve_from_cache
+    ox._http._save_to_cache = save_to_cache
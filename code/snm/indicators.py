@@ -0,0 +1,251 @@
+# Vectorized street network indicators, computed straight from a saved graph's
+# node and edge arrays instead of from networkx graph objects. Each kernel is a
+# function of plain arrays that reproduces the OSMnx function the indicators
+# stage used to call (to within floating point tolerance), so the stage loads
+# a graph's arrays once and never builds the directed, undirected, and
+# projected copies of it just to read their attributes.
+#
+# The undirected representation matches `ox.convert.to_undirected`: reciprocal
+# directed edges are collapsed to one edge if they have the same osmid (or set
+# of osmids) and the same geometry in either direction, or the same key and
+# geometry, where edges without a geometry get a straight line between their
+# nodes. Geometries are compared by an exact polynomial hash of their
+# coordinates' bits, computed both forwards and backwards for all edges at once.
+
+import numpy as np
+import osmnx as ox
+import scipy.stats
+import shapely
+
+from snm import graphstore, sidecars
+
+# node and edge attributes the indicators need from a graph file
+node_attrs = ["street_count", "x", "y"]
+edge_attrs = ["geometry", "length", "osmid"]
+
+# odd multipliers for hashing coordinates: one mixes each point's y into its
+# x, the other weights each point by its position along the edge
+point_multiplier = np.uint64(0x9E3779B97F4A7C15)
+position_multiplier = np.uint64(0xC2B2AE3D27D4EB4F)
+
+
+# load a graph file's node and edge arrays with its attribute sidecars attached
+def load_graph_arrays(filepath, attrs_root):
+    nodes, edges = graphstore.load_arrays(filepath, node_attrs, edge_attrs)
+    return sidecars.attach_arrays(nodes, edges, attrs_root, filepath)
+
+
+# get the positions of node IDs in a graph's node osmid array
+def node_positions(osmids, ids):
+    order = np.argsort(osmids, kind="stable")
+    return order[np.searchsorted(osmids, ids, sorter=order)]
+
+
+# get each edge's endpoint coordinates as (y1, x1, y2, x2) arrays
+def endpoint_coords(nodes, edges):
+    u = node_positions(nodes["osmid"], edges["u"])
+    v = node_positions(nodes["osmid"], edges["v"])
+    return nodes["y"][u], nodes["x"][u], nodes["y"][v], nodes["x"][v]
+
+
+# convert edge osmids (ints, or strings of ints or of lists of ints) into
+# integer codes that are equal when the osmids or sets of osmids are equal:
+# single osmids are their own codes and sets of osmids get negative codes
+def osmid_codes(osmids):
+    if osmids.dtype != object:
+        return osmids.astype(np.int64)
+    is_list = np.char.startswith(osmids.astype(str), "[")
+    codes = np.zeros(len(osmids), dtype=np.int64)
+    codes[~is_list] = osmids[~is_list].astype(np.int64)
+    sets = {}
+    codes[is_list] = [
+        sets.setdefault(frozenset(int(x) for x in s[1:-1].split(",")), -1 - len(sets))
+        for s in osmids[is_list]
+    ]
+    return codes
+
+
+# get the coordinates of each edge's geometry (or straight line between its
+# nodes, if it has no geometry) as one flat array, plus each edge's count of
+# coordinates and its first coordinate's position in the flat array
+def edge_coords(nodes, edges):
+    y1, x1, y2, x2 = endpoint_coords(nodes, edges)
+    geoms = edges.get("geometry", np.full(len(y1), None, dtype=object))
+    has_geom = ~shapely.is_missing(geoms)
+    geom_coords, index = shapely.get_coordinates(geoms[has_geom], return_index=True)
+    counts = np.full(len(geoms), 2)
+    counts[has_geom] = np.bincount(index, minlength=has_geom.sum())
+    starts = np.r_[0, np.cumsum(counts)[:-1]]
+
+    # copy each geometry's coordinates to its edge's position in the flat array
+    coords = np.empty((counts.sum(), 2))
+    geom_starts = np.r_[0, np.cumsum(counts[has_geom])[:-1]]
+    offsets = (starts[has_geom] - geom_starts)[index]
+    coords[np.arange(len(index)) + offsets] = geom_coords
+    straight = starts[~has_geom]
+    coords[straight] = np.c_[x1, y1][~has_geom]
+    coords[straight + 1] = np.c_[x2, y2][~has_geom]
+    return coords, counts, starts
+
+
+# hash each edge's coordinates so that they hash the same in either direction:
+# each point's coordinates' bits are mixed then weighted by the multiplier to
+# the power of its position along the edge, forwards or backwards
+def geometry_hashes(coords, counts, starts):
+    index = np.repeat(np.arange(len(counts)), counts)
+    positions = (np.arange(len(index)) - starts[index]).astype(np.uint64)
+    reverse_positions = counts[index].astype(np.uint64) - np.uint64(1) - positions
+
+    # integer arithmetic wraps around, which is what we want for hashing
+    bits = np.ascontiguousarray(coords).view(np.uint64)
+    points = bits[:, 0] * point_multiplier + bits[:, 1]
+    forward = np.add.reduceat(points * np.power(position_multiplier, positions), starts)
+    reverse = np.add.reduceat(points * np.power(position_multiplier, reverse_positions), starts)
+    return np.minimum(forward, reverse).view(np.int64)
+
+
+# get the positions of the first (or last) of each set of identical rows of
+# some equal-length integer columns, in their original order
+def unique_rows(columns, *, last=False):
+    order = np.lexsort(columns[::-1])
+    new = np.zeros(len(order), dtype=bool)
+    new[0] = True
+    for column in columns:
+        values = column[order]
+        new[1:] |= values[1:] != values[:-1]
+    keep = np.r_[new[1:], True] if last else new
+    return np.sort(order[keep])
+
+
+# get the undirected representation of a graph's edges, like
+# ox.convert.to_undirected: returns the edge arrays with one directed edge
+# kept per set of duplicates. first, reciprocal edges with the same key and
+# geometry are merged (the undirected MultiGraph keeps the last one's data)
+# whatever their osmids. then edges with the same osmid and geometry are
+# deduplicated (keeping the first one). finally, edges are oriented the way
+# the MultiGraph reports them, from whichever node comes first in the graph
+def to_undirected(nodes, edges):
+    coords, counts, starts = edge_coords(nodes, edges)
+    hashes = geometry_hashes(coords, counts, starts)
+    a = np.minimum(edges["u"], edges["v"])
+    b = np.maximum(edges["u"], edges["v"])
+    keep = unique_rows([a, b, edges["key"], counts, hashes], last=True)
+    osmids = osmid_codes(edges["osmid"][keep])
+    keep = keep[unique_rows([a[keep], b[keep], osmids, counts[keep], hashes[keep]])]
+    edges = {attr: values[keep] for attr, values in edges.items()}
+
+    u = node_positions(nodes["osmid"], edges["u"])
+    v = node_positions(nodes["osmid"], edges["v"])
+    swap = v < u
+    edges["u"], edges["v"] = (
+        np.where(swap, edges["v"], edges["u"]),
+        np.where(swap, edges["u"], edges["v"]),
+    )
+    if "geometry" in edges:
+        edges["geometry"][swap] = shapely.reverse(edges["geometry"][swap])
+    return edges
+
+
+# total, mean, and median edge length
+def length_stats(lengths):
+    return float(np.sum(lengths)), float(np.mean(lengths)), float(np.median(lengths))
+
+
+# proportion of undirected edges that are self-loops, like
+# ox.stats.self_loop_proportion
+def self_loop_proportion(edges):
+    return float(np.mean(edges["u"] == edges["v"]))
+
+
+# proportion of nodes with each count of streets, like
+# ox.stats.streets_per_node_proportions
+def street_count_proportions(street_counts):
+    counts = np.bincount(np.asarray(street_counts, dtype=np.int64))
+    return dict(enumerate((counts / len(street_counts)).tolist()))
+
+
+# count of nodes with at least min_streets streets, like
+# ox.stats.intersection_count
+def intersection_count(street_counts, min_streets=2):
+    return int(np.sum(np.asarray(street_counts) >= min_streets))
+
+
+# ratio of undirected edges' total length to their total great-circle
+# (haversine) distance between endpoints, like ox.stats.circuity_avg
+def circuity(nodes, edges):
+    y1, x1, y2, x2 = endpoint_coords(nodes, edges)
+    sl_dists = ox.distance.great_circle(y1, x1, y2, x2)
+    return float(np.sum(edges["length"]) / sl_dists[~np.isnan(sl_dists)].sum())
+
+
+# count bearings in num_bins bins centered on 0, 360 / num_bins, etc degrees,
+# like OSMnx: bins are split in half then merged in pairs, so that bearings
+# near common values like 0 or 90 degrees don't straddle bin edges
+def bearing_histogram(bearings, num_bins=36):
+    split_bin_edges = np.linspace(0, 360, num_bins * 2 + 1)
+    split_bin_counts, _ = np.histogram(bearings, bins=split_bin_edges)
+    split_bin_counts = np.roll(split_bin_counts, 1)
+    return split_bin_counts[::2] + split_bin_counts[1::2]
+
+
+# entropy of undirected edges' bidirectional bearings, ignoring self-loops and
+# edges shorter than min_length, like ox.bearing.orientation_entropy
+def orientation_entropy(nodes, edges, num_bins=36, min_length=0):
+    y1, x1, y2, x2 = endpoint_coords(nodes, edges)
+    keep = (edges["u"] != edges["v"]) & (edges["length"] >= min_length)
+    bearings = ox.bearing.calculate_bearing(y1[keep], x1[keep], y2[keep], x2[keep])
+    bearings = bearings[~np.isnan(bearings)]
+    bearings = np.r_[bearings, (bearings - 180) % 360]
+    return float(scipy.stats.entropy(bearing_histogram(bearings, num_bins)))
+
+
+# node elevation and undirected edge grade stats, skipping missing values
+def elevation_grade_stats(elevations, grades):
+    q25, q75 = np.nanquantile(elevations, [0.25, 0.75])
+    return {
+        "elev_iqr": float(q75 - q25),
+        "elev_mean": float(np.nanmean(elevations)),
+        "elev_median": float(np.nanmedian(elevations)),
+        "elev_range": float(np.nanmax(elevations) - np.nanmin(elevations)),
+        "elev_std": float(np.nanstd(elevations, ddof=1)),
+        "grade_mean": float(np.nanmean(grades)),
+        "grade_median": float(np.nanmedian(grades)),
+    }
+
+
+def gini(x):
+    sorted_x = np.sort(x)
+    n = len(x)
+    cumx = np.cumsum(sorted_x, dtype=float)
+    return float((n + 1 - 2 * np.sum(cumx) / cumx[-1]) / n)
+
+
+# calculate all the indicators from a graph's node and edge arrays (with
+# elevation, grade_abs, and bc attached)
+def calculate_indicators(nodes, edges):
+    edges = to_undirected(nodes, edges)
+    n = len(nodes["osmid"])
+    m = len(edges["u"])
+    length_total, length_mean, length_median = length_stats(edges["length"])
+    spn = street_count_proportions(nodes["street_count"])
+    circuity_avg = circuity(nodes, edges)
+    results = {
+        "circuity": circuity_avg,
+        "intersect_count": intersection_count(nodes["street_count"]),
+        "k_avg": 2 * m / n,
+        "length_mean": length_mean,
+        "length_median": length_median,
+        "length_total": length_total,
+        "street_segment_count": m,
+        "node_count": n,
+        "orientation_entropy": orientation_entropy(nodes, edges),
+        "prop_4way": spn.get(4, 0),
+        "prop_3way": spn.get(3, 0),
+        "prop_deadend": spn.get(1, 0),
+        "self_loop_proportion": self_loop_proportion(edges),
+        "straightness": 1 / circuity_avg,
+        "bc_gini": gini(nodes["bc"]),
+        "bc_max": float(np.max(nodes["bc"])),
+    }
+    results.update(elevation_grade_stats(nodes["elevation"], edges["grade_abs"]))
+    return results
@@ -0,0 +1,199 @@
+# Local stand-in servers that mimic the external services the workflow calls,
+# so fetchers' throughput and retry behavior can be benchmarked offline. Each
+# server randomly injects failures (at configurable rates) the way the real
+# service fails, and counts the requests it handles.
+
+import asyncio
+import datetime as dt
+import random
+import threading
+import time
+from collections import Counter
+from math import ceil
+from urllib.parse import unquote
+
+from aiohttp import web
+
+from snm import polyline
+
+# statuses the Elevation API returns with its JSON error responses
+elevation_errors = [
+    (429, "OVER_QUERY_LIMIT"),
+    (500, "UNKNOWN_ERROR"),
+]
+
+
+# parse a Google Elevation API locations parameter into lats and lngs
+def parse_locations(locations):
+    locations = unquote(locations)
+    if locations.startswith("enc:"):
+        return polyline.decode(locations[len("enc:") :])
+    pairs = [pair.split(",") for pair in locations.split("|")]
+    return [float(lat) for lat, _ in pairs], [float(lng) for _, lng in pairs]
+
+
+# make a stand-in Google Elevation API app: responds to
+# /maps/api/elevation/json with the API's JSON, with elevations made up from
+# each location's coordinates. some responses (at error_rate) are errors and
+# some (at partial_rate) are missing some of their results
+def elevation_app(error_rate=0.05, partial_rate=0.02, latency=0.01, seed=0):
+    rng = random.Random(seed)
+    counts = Counter()
+
+    async def handle(request):
+        await asyncio.sleep(latency)
+        counts["requests"] += 1
+        if rng.random() < error_rate:
+            http_status, status = rng.choice(elevation_errors)
+            counts[status] += 1
+            data = {"results": [], "status": status, "error_message": "Mock error"}
+            return web.json_response(data, status=http_status)
+
+        lats, lngs = parse_locations(request.query["locations"])
+        results = [
+            {
+                "elevation": 100 + 10 * lat - lng,
+                "location": {"lat": lat, "lng": lng},
+                "resolution": 9.5,
+            }
+            for lat, lng in zip(lats, lngs, strict=True)
+        ]
+        if rng.random() < partial_rate:
+            counts["partial"] += 1
+            results = results[: len(results) // 2]
+        return web.json_response({"results": results, "status": "OK"})
+
+    app = web.Application()
+    app.router.add_get("/maps/api/elevation/json", handle)
+    app["counts"] = counts
+    return app
+
+
+# make a stand-in Overpass API app: /api/interpreter replays responses (a dict
+# of query -> response json, with an empty result for any other query) and
+# /api/status reports slots like the real server. the client gets rate_limit
+# slots (or unlimited, if 0): each query holds a slot while it runs, for
+# query_seconds, then for `cooldown` seconds more, and a query with no free
+# slot gets a 429. some queries (at error_rate) get a 504 gateway timeout
+def overpass_app(responses, rate_limit=2, query_seconds=0.05, cooldown=1.0, error_rate=0.02):
+    rng = random.Random(0)
+    counts = Counter()
+    slots = [0.0] * rate_limit
+
+    async def handle_status(_request):
+        now = time.time()
+        busy = sorted(t for t in slots if t > now)
+        lines = [
+            "Connected as: 2130706433",
+            f"Current time: {dt.datetime.now(tz=dt.UTC):%Y-%m-%dT%H:%M:%SZ}",
+            "Announced endpoint: none",
+            f"Rate limit: {rate_limit}",
+            f"{len(slots) - len(busy)} slots available now.",
+        ]
+        for t in busy:
+            after = dt.datetime.fromtimestamp(t, tz=dt.UTC)
+            lines.append(
+                f"Slot available after: {after:%Y-%m-%dT%H:%M:%SZ}, in {ceil(t - now)} seconds.",
+            )
+        lines.append("Currently running queries (pid, space limit, time limit, start time):")
+        return web.Response(text="\n".join(lines) + "\n")
+
+    async def handle_interpreter(request):
+        counts["requests"] += 1
+        query = (await request.post())["data"]
+        now = time.time()
+        if rate_limit > 0:
+            free = [i for i, t in enumerate(slots) if t <= now]
+            if not free:
+                counts["429"] += 1
+                raise web.HTTPTooManyRequests
+            slots[free[0]] = now + query_seconds + cooldown
+        if rng.random() < error_rate:
+            counts["504"] += 1
+            raise web.HTTPGatewayTimeout
+        await asyncio.sleep(query_seconds)
+        return web.json_response(responses.get(query, {"version": 0.6, "elements": []}))
+
+    app = web.Application()
+    app.router.add_get("/api/status", handle_status)
+    app.router.add_post("/api/interpreter", handle_interpreter)
+    app["counts"] = counts
+    return app
+
+
+# make a stand-in file server app: responds to /files/{name} with the bytes
+# of files (a dict of name -> bytes), honoring HTTP Range requests. some
+# requests (at error_rate) get an error status and some (at drop_rate) have
+# their connection dropped partway through the body. if not range_sizes, a
+# range it can't serve gets no Content-Range header with the file's size
+def file_app(files, error_rate=0.05, drop_rate=0.1, seed=0, *, range_sizes=True):
+    rng = random.Random(seed)
+    counts = Counter()
+
+    async def handle(request):
+        counts["requests"] += 1
+        name = request.match_info["name"]
+        if name not in files:
+            raise web.HTTPNotFound
+        if rng.random() < error_rate:
+            counts["errors"] += 1
+            raise web.HTTPServiceUnavailable
+
+        data = files[name]
+        start = request.http_range.start or 0
+        if start >= len(data):
+            counts["unsatisfiable"] += 1
+            headers = {"Content-Range": f"bytes */{len(data)}"} if range_sizes else {}
+            raise web.HTTPRequestRangeNotSatisfiable(headers=headers)
+        if start > 0:
+            counts["resumes"] += 1
+            response = web.StreamResponse(status=206)
+            response.headers["Content-Range"] = f"bytes {start}-{len(data) - 1}/{len(data)}"
+        else:
+            response = web.StreamResponse()
+        response.content_length = len(data) - start
+        await response.prepare(request)
+
+        # send the body in chunks, maybe dropping the connection partway
+        end = len(data)
+        if rng.random() < drop_rate:
+            counts["drops"] += 1
+            end = rng.randint(start, len(data) - 1)
+        for i in range(start, end, 1 << 16):
+            await response.write(data[i : min(i + (1 << 16), end)])
+        if end < len(data):
+            request.transport.close()
+            return response
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_get("/files/{name}", handle)
+    app["counts"] = counts
+    return app
+
+
+# start serving an app on a local port, returning its runner and base URL
+async def start_app(app, port=0):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+# serve an app on a local port from an event loop in a background thread, for
+# benchmarking synchronous clients. returns a function to stop it and the URL
+def start_app_thread(app, port=0):
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    runner, base_url = asyncio.run_coroutine_threadsafe(start_app(app, port), loop).result()
+
+    def stop() -> None:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+    return stop, base_url
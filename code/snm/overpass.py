@@ -0,0 +1,141 @@
+# Asynchronous prefetching of the Overpass API queries OSMnx makes to build
+# each urban center's street network, so graphs can later be built from the
+# cache. Every urban center's sub-queries are planned up front exactly the way
+# `ox.graph_from_polygon` plans them (so they have the same cache keys), then
+# sent concurrently over one pooled HTTP client. Concurrency follows the
+# server's rate limit: with a per-client limit of N slots we run N workers,
+# and each waits for a free slot according to the server's /status endpoint
+# before sending a query. 429 and 504 responses are retried with exponential
+# backoff and full jitter.
+
+import asyncio
+import random
+import re
+from collections import OrderedDict
+
+import aiohttp
+import osmnx as ox
+import requests
+
+# retry failed queries up to this many times, with backoff starting at this
+# many seconds and doubling per retry (but waiting at most max_delay seconds)
+max_retries = 8
+base_delay = 5.0
+max_delay = 120.0
+
+# HTTP statuses worth retrying: the server is busy or timed out
+retry_http_statuses = {429, 504}
+
+# when the server's status doesn't say when a slot frees up, check again in
+# this many seconds
+status_pause = 5.0
+
+# buffer urban center polygons by this many meters, like graph_from_polygon
+buffer_dist = 500
+
+
+# plan the Overpass queries for an urban center's street network exactly the
+# way graph_from_polygon does: returns a list of (cache key URL, query) tuples
+def plan_queries(polygon, network_type):
+    poly_proj, crs_utm = ox.projection.project_geometry(polygon)
+    poly_buff, _ = ox.projection.project_geometry(
+        poly_proj.buffer(buffer_dist),
+        crs=crs_utm,
+        to_latlong=True,
+    )
+    overpass_settings = ox._overpass._make_overpass_settings()
+    way_filter = ox._overpass._get_network_filter(network_type)
+    url = ox.settings.overpass_url.rstrip("/") + "/interpreter"
+    queries = []
+    for coord_str in ox._overpass._make_overpass_polygon_coord_strs(poly_buff):
+        query = f"{overpass_settings};(way{way_filter}(poly:{coord_str!r});>;);out;"
+        params = OrderedDict(data=query)
+        queries.append((str(requests.Request("GET", url, params=params).prepare().url), query))
+    return queries
+
+
+# parse the text of an Overpass /status response into the client's rate limit
+# (count of slots, or 0 if unlimited), its count of slots available now, and
+# the seconds until the next slot frees up (or None if not stated)
+def parse_status(text):
+    rate_limit = re.search(r"Rate limit: (\d+)", text)
+    available = re.search(r"(\d+) slots? available now", text)
+    waits = [int(s) for s in re.findall(r"Slot available after: \S+, in (-?\d+) seconds", text)]
+    return (
+        0 if rate_limit is None else int(rate_limit.group(1)),
+        0 if available is None else int(available.group(1)),
+        max(min(waits), 0) if waits else None,
+    )
+
+
+# get the server's rate limit, slots available now, and seconds until a slot
+async def get_status(session, base_url):
+    async with session.get(base_url.rstrip("/") + "/status") as response:
+        return parse_status(await response.text())
+
+
+# wait until the server says one of our slots is available
+async def wait_for_slot(session, base_url) -> None:
+    while True:
+        rate_limit, available, wait = await get_status(session, base_url)
+        if rate_limit == 0 or available > 0:
+            return
+        await asyncio.sleep(status_pause if wait is None else wait + random.random())
+
+
+# send a query until the server returns a complete result or we run out of
+# retries. returns the response json (or None if it failed) and the count of
+# attempts. a response with a "remark" means the query ran out of time or
+# memory on the server, so it's retried too
+async def fetch_query(session, base_url, query, *, limited):
+    for attempt in range(max_retries + 1):
+        if limited:
+            await wait_for_slot(session, base_url)
+        retry = True
+        try:
+            url = base_url.rstrip("/") + "/interpreter"
+            async with session.post(url, data={"data": query}) as response:
+                http_status = response.status
+                data = await response.json(content_type=None) if response.ok else None
+            if data is not None and "remark" not in data:
+                return data, attempt + 1
+            retry = response.ok or http_status in retry_http_statuses
+        except (aiohttp.ClientError, TimeoutError, ValueError):
+            pass
+        if not retry:
+            return None, attempt + 1
+        if attempt < max_retries:
+            await asyncio.sleep(random.uniform(0, min(max_delay, base_delay * 2**attempt)))
+    return None, max_retries + 1
+
+
+# send queries with as many in flight as the server gives us slots (or
+# max_concurrency, if it's unlimited), calling on_result(i, data, attempts)
+# as each query's response arrives
+async def fetch_all(queries, on_result, max_concurrency):
+    base_url = ox.settings.overpass_url
+    queue = asyncio.Queue()
+    for i, query in enumerate(queries):
+        queue.put_nowait((i, query))
+    timeout = aiohttp.ClientTimeout(total=ox.settings.requests_timeout + 60)
+    headers = ox._http._get_http_headers()
+
+    async with aiohttp.ClientSession(timeout=timeout, headers=headers) as session:
+        rate_limit, _, _ = await get_status(session, base_url)
+        limited = rate_limit > 0
+        concurrency = min(rate_limit, max_concurrency) if limited else max_concurrency
+        msg = f"Overpass rate limit is {rate_limit} slots: sending with concurrency {concurrency}"
+        print(ox.ts(), msg)
+
+        async def worker() -> None:
+            while not queue.empty():
+                i, query = queue.get_nowait()
+                data, attempts = await fetch_query(session, base_url, query, limited=limited)
+                on_result(i, data, attempts)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+# run fetch_all in a new event loop
+def fetch(queries, on_result, max_concurrency) -> None:
+    asyncio.run(fetch_all(queries, on_result, max_concurrency))
@@ -0,0 +1,77 @@
+# Single-pass spatial partitioning of points into compact clusters of at most
+# some maximum size, by recursive k-d splits: split the points at the median
+# of their longer axis, with the split rounded to a multiple of the max size,
+# until every part is small enough. Every cluster but one is full, the fewest
+# possible clusters are made, and it takes O(n log n) time on numpy arrays.
+# Points can first be split into regions separated by empty space, so no
+# cluster spans the gap between two distant groups of points.
+
+from math import ceil, cos, radians
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+# approximate meters per degree of latitude
+meters_per_degree = 111_320
+
+
+# label each point by its region: points are in the same region if they're in
+# the same or adjacent (including diagonally) grid cells of cell_size degrees
+def get_regions(x, y, cell_size):
+    cols = np.floor(np.asarray(x) / cell_size).astype(np.int64)
+    rows = np.floor(np.asarray(y) / cell_size).astype(np.int64)
+    n_cols = cols.max() - cols.min() + 3
+    cell_ids = (rows - rows.min() + 1) * n_cols + (cols - cols.min() + 1)
+    cells, point_cells = np.unique(cell_ids, return_inverse=True)
+
+    # link each occupied cell to its occupied neighbors
+    links = []
+    for offset in (1, n_cols - 1, n_cols, n_cols + 1):
+        neighbors = cells + offset
+        pos = np.searchsorted(cells, neighbors)
+        pos[pos == len(cells)] = 0
+        found = np.flatnonzero(cells[pos] == neighbors)
+        links.append((found, pos[found]))
+    sources, targets = (np.concatenate(ids) for ids in zip(*links, strict=True))
+    shape = (len(cells), len(cells))
+    adj = coo_matrix((np.ones(len(sources)), (sources, targets)), shape=shape)
+    _, cell_labels = connected_components(adj, directed=False)
+    return cell_labels[point_cells]
+
+
+# yield arrays of point positions, one per cluster of at most max_size points
+def get_clusters(x, y, max_size):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(x) == 0:
+        return
+
+    # scale longitudes so distances along both axes are comparable
+    x = x * cos(radians(np.mean(y)))
+    stack = [np.arange(len(x))]
+    while stack:
+        pos = stack.pop()
+        if len(pos) <= max_size:
+            yield pos
+            continue
+
+        # split along the longer axis so the left part gets a whole number of
+        # full clusters, about half of them, and the right part gets the rest
+        axis = x[pos] if np.ptp(x[pos]) >= np.ptp(y[pos]) else y[pos]
+        k = ceil(ceil(len(pos) / max_size) / 2) * max_size
+        order = np.argpartition(axis, k)
+        stack.extend((pos[order[k:]], pos[order[:k]]))
+
+
+# get each cluster's compactness: the root mean square distance (meters) of
+# its points from their centroid
+def get_compactness(x, y, clusters):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    radii = []
+    for pos in clusters:
+        dx = (x[pos] - x[pos].mean()) * cos(radians(y[pos].mean()))
+        dy = y[pos] - y[pos].mean()
+        radii.append(np.sqrt(np.mean(dx**2 + dy**2)) * meters_per_degree)
+    return np.array(radii)
@@ -0,0 +1,133 @@
+# Answer the Overpass queries OSMnx makes for urban centers' street networks
+# from a local OSM PBF extract instead of the Overpass API. The extract is
+# streamed once: every way that passes the network type's Overpass way filter
+# gets its geometry from its nodes' locations, a spatial index of all the
+# queries' polygons assigns it to the queries whose polygon it intersects (or
+# drops it, if it intersects none), and each query's ways and their nodes are
+# assembled into the JSON response the Overpass API would return. These responses are stored in an HTTP cache under
+# the queries' cache keys, so graph_from_polygon then builds the same graphs
+# from them as from the Overpass API's responses.
+
+import re
+from pathlib import Path
+
+import numpy as np
+import osmium
+import osmnx as ox
+from shapely import LineString, Polygon, STRtree
+
+# matches one clause of an Overpass tag filter like ["highway"] (has key),
+# ["area"~"yes"] (value matches regex), or ["area"!~"yes"] (doesn't match)
+filter_pattern = re.compile(r'\["([^"]+)"(?:(!?~)"([^"]*)")?\]')
+
+# matches the polygon coordinates string in an Overpass query
+poly_pattern = re.compile(r"\(poly:'([^']*)'\)")
+
+
+# parse an Overpass tag filter into a list of (key, operator, compiled regex)
+# clauses, where the operator is None (has key), "~", or "!~"
+def parse_filter(way_filter):
+    return [
+        (key, op or None, re.compile(pattern) if op else None)
+        for key, op, pattern in filter_pattern.findall(way_filter)
+    ]
+
+
+# check if some tags pass all of a filter's clauses, with Overpass semantics:
+# a regex matches anywhere in the value, and "!~" passes if the key is absent
+def matches_filter(tags, clauses):
+    for key, op, regex in clauses:
+        value = tags.get(key)
+        if op is None and value is None:
+            return False
+        if op == "~" and (value is None or regex.search(value) is None):
+            return False
+        if op == "!~" and value is not None and regex.search(value) is not None:
+            return False
+    return True
+
+
+# get the polygon of an Overpass query's (poly:'lat lng lat lng ...') filter
+def parse_polygon(query):
+    coords = np.array(poly_pattern.search(query).group(1).split(), dtype=float).reshape(-1, 2)
+    return Polygon(coords[:, ::-1])
+
+
+# convert an osmium way to its Overpass element, its geometry, and its nodes'
+# elements, or return None if it doesn't pass a tag filter or if any of its
+# nodes are missing from the extract
+def convert_way(way, clauses):
+    tags = {tag.k: tag.v for tag in way.tags}
+    if not matches_filter(tags, clauses):
+        return None
+    refs = list(way.nodes)
+    if len(refs) < 2 or not all(ref.location.valid() for ref in refs):  # noqa: PLR2004
+        return None
+    element = {"type": "way", "id": way.id, "nodes": [ref.ref for ref in refs], "tags": tags}
+    geometry = LineString([(ref.lon, ref.lat) for ref in refs])
+    nodes = [{"type": "node", "id": ref.ref, "lat": ref.lat, "lon": ref.lon} for ref in refs]
+    return element, geometry, nodes
+
+
+# stream a PBF extract once and collect the ways that pass a tag filter and
+# intersect any query polygon in an STRtree. node locations are indexed in
+# memory, or in a dense file array at locations_path (which suits planet-sized
+# extracts). returns a list of each query's way elements and a dict of the
+# kept ways' node elements (with only OSMnx's useful node tags) keyed by ID
+def read_ways(pbf_path, clauses, tree, locations_path=None):
+    useful_tags_node = set(ox.settings.useful_tags_node)
+    node_tags = {}
+    queries_ways = [[] for _ in range(len(tree))]
+    nodes = {}
+
+    # skip untagged nodes and ways without the filter's required keys in C++,
+    # after their locations are indexed
+    storage = "flex_mem"
+    if locations_path is not None:
+        Path(locations_path).parent.mkdir(parents=True, exist_ok=True)
+        storage = f"dense_file_array,{locations_path}"
+    processor = osmium.FileProcessor(str(pbf_path)).with_locations(storage)
+    required_keys = {key for key, op, _ in clauses if op is None}
+    if required_keys:
+        processor = processor.with_filter(
+            osmium.filter.KeyFilter(*useful_tags_node | required_keys),
+        )
+    for obj in processor:
+        if obj.is_node():
+            tags = {tag.k: tag.v for tag in obj.tags if tag.k in useful_tags_node}
+            if tags:
+                node_tags[obj.id] = tags
+        elif obj.is_way() and (converted := convert_way(obj, clauses)) is not None:
+            # keep the way only if it intersects a query's polygon, assigning it
+            # to every query whose polygon it intersects
+            element, geometry, way_nodes = converted
+            query_positions = tree.query(geometry, predicate="intersects")
+            if len(query_positions) > 0:
+                for query_position in query_positions.tolist():
+                    queries_ways[query_position].append(element)
+                nodes.update((node["id"], node) for node in way_nodes)
+
+    # node tags are seen before the ways, so attach them to the ways' nodes now
+    for node_id, tags in node_tags.items():
+        if node_id in nodes:
+            nodes[node_id]["tags"] = tags
+    return queries_ways, nodes
+
+
+# make the Overpass API's responses to queries (a list of query strings, as
+# planned by overpass.plan_queries for a network type) from a PBF extract,
+# optionally indexing node locations in a file at locations_path. returns a
+# list of response jsons, one per query
+def make_responses(pbf_path, queries, network_type, locations_path=None):
+    clauses = parse_filter(ox._overpass._get_network_filter(network_type))
+    tree = STRtree([parse_polygon(query) for query in queries])
+    queries_ways, nodes = read_ways(pbf_path, clauses, tree, locations_path)
+
+    # the Overpass API returns the nodes then the ways, each sorted by ID
+    responses = []
+    for query_ways in queries_ways:
+        node_ids = sorted({node_id for way in query_ways for node_id in way["nodes"]})
+        elements = [nodes[node_id] for node_id in node_ids]
+        elements.extend(sorted(query_ways, key=lambda way: way["id"]))
+        responses.append({"version": 0.6, "elements": elements})
+    return responses
@@ -0,0 +1,85 @@
+# Pack node coordinates into Google Elevation API `locations` parameters.
+# Locations can be sent as `lat,lng` pairs joined by `|` or in encoded
+# polyline form (`enc:` then each coordinate's delta from the previous one,
+# zigzag encoded as base64-like chunks of 5 bits). The polyline form is usually
+# much shorter, but its characters need URL-escaping, so we build both forms
+# and use whichever fits the most points into a request's character limit.
+
+from urllib.parse import quote
+
+import numpy as np
+
+# encoded polylines store coordinates as integers at 5 decimal places
+precision = 5
+
+
+# get coordinates as the integers an encoded polyline stores
+def to_ints(values):
+    return np.round(np.asarray(values, dtype=float) * 10**precision).astype(np.int64)
+
+
+# encode one signed integer as polyline characters
+def encode_value(value):
+    value = ~(value << 1) if value < 0 else value << 1
+    chars = []
+    while value >= 0x20:  # noqa: PLR2004
+        chars.append(chr((0x20 | (value & 0x1F)) + 63))
+        value >>= 5
+    chars.append(chr(value + 63))
+    return "".join(chars)
+
+
+# encode lat/lng coordinates as a polyline string
+def encode(lats, lngs):
+    coords = to_ints(np.column_stack((lats, lngs)))
+    deltas = np.diff(coords, axis=0, prepend=0).ravel().tolist()
+    return "".join(encode_value(delta) for delta in deltas)
+
+
+# decode a polyline string to arrays of lats and lngs
+def decode(polyline):
+    values = []
+    value = 0
+    shift = 0
+    for char in polyline:
+        chunk = ord(char) - 63
+        value |= (chunk & 0x1F) << shift
+        shift += 5
+        if chunk < 0x20:  # noqa: PLR2004
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = 0
+            shift = 0
+    coords = np.cumsum(np.array(values, dtype=np.int64).reshape(-1, 2), axis=0)
+    return coords[:, 0] / 10**precision, coords[:, 1] / 10**precision
+
+
+# get the `locations` parameter for some coordinates in both forms (with the
+# polyline form URL-escaped) and return the shorter one
+def get_locations(lats, lngs):
+    pairs = "|".join(
+        f"{lat:.{precision}f},{lng:.{precision}f}" for lat, lng in zip(lats, lngs, strict=True)
+    )
+    encoded = quote("enc:" + encode(lats, lngs), safe="")
+    return min(pairs, encoded, key=len)
+
+
+# split coordinates into as few `locations` parameters as possible, each with
+# at most max_points points and max_chars characters, returning a list of
+# (count of points, locations) tuples in order
+def pack_locations(lats, lngs, max_points, max_chars):
+    packed = []
+    start = 0
+    while start < len(lats):
+        # binary search for the most points from `start` that fit
+        low, high = 1, min(max_points, len(lats) - start)
+        while low < high:
+            mid = (low + high + 1) // 2
+            end = start + mid
+            if len(get_locations(lats[start:end], lngs[start:end])) <= max_chars:
+                low = mid
+            else:
+                high = mid - 1
+        end = start + low
+        packed.append((low, get_locations(lats[start:end], lngs[start:end])))
+        start = end
+    return packed
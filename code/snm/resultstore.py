@@ -0,0 +1,68 @@
+# Append-only, crash-safe store of per-urban center results (like the street
+# network indicators) in a SQLite database in WAL mode. Each result is a row
+# of its urban center ID and its JSON-encoded dict of values, written as soon
+# as it's calculated and committed in periodic batches, so a crash loses at
+# most one batch and a rerun resumes from whatever is already stored.
+
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+import pandas as pd
+
+# commit buffered results at least this often (count of results or seconds)
+flush_count = 100
+flush_seconds = 60
+
+
+# convert numpy scalars to python types for JSON encoding
+def to_python(value):
+    return value.item()
+
+
+# open (and create if needed) a results store
+def open_store(filepath):
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(filepath)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.execute("CREATE TABLE IF NOT EXISTS results (uc_id INTEGER PRIMARY KEY, data TEXT)")
+    return con
+
+
+# get the set of urban center IDs that already have stored results
+def load_done(filepath):
+    if not Path(filepath).is_file():
+        return set()
+    with sqlite3.connect(filepath) as con:
+        return {row[0] for row in con.execute("SELECT uc_id FROM results")}
+
+
+# load all stored results as a dataframe, one row per urban center
+def load_results(filepath):
+    with sqlite3.connect(filepath) as con:
+        rows = con.execute("SELECT data FROM results ORDER BY uc_id").fetchall()
+    return pd.DataFrame([json.loads(row[0]) for row in rows])
+
+
+# write results from an iterable of dicts (each with a uc_id) into the store
+# as they arrive, committing in batches. returns the count of results written
+def write_results(filepath, results):
+    con = open_store(filepath)
+    count = 0
+    last_flush = time.time()
+    try:
+        for result in results:
+            data = json.dumps(result, default=to_python)
+            sql = "INSERT OR REPLACE INTO results (uc_id, data) VALUES (?, ?)"
+            con.execute(sql, (int(result["uc_id"]), data))
+            count += 1
+            if count % flush_count == 0 or time.time() - last_flush > flush_seconds:
+                con.commit()
+                last_flush = time.time()
+    finally:
+        con.commit()
+        con.close()
+    return count
@@ -0,0 +1,177 @@
+# Longest-processing-time-first (LPT) scheduling with memory admission
+# control, for the multiprocessing stages that process one urban center at a
+# time. Each item has a tuple of sizes (like its graph's node and edge counts)
+# and each stage keeps a profile of every item's runtime and peak memory from
+# earlier runs. An item's cost is its recorded runtime if we have one, or else
+# is predicted from its sizes by a linear model fit to the stage's recorded
+# runtimes, and likewise for its peak memory. Items are dispatched longest
+# first, so the biggest urban centers never start last, and tiny items are
+# batched together so they don't pay per-task overhead. A task is only
+# admitted while the predicted peak memory of all running tasks fits in the
+# memory budget, so small graphs run wide and big ones run narrow.
+#
+# Items are given as a dict of key:(args, sizes), and their keys (like graph
+# file stems) identify them across runs.
+
+import json
+import multiprocessing as mp
+import queue
+import resource
+import time
+from pathlib import Path
+
+import numpy as np
+from scipy.optimize import nnls
+
+# how many tasks to make per CPU: items costlier than the total cost divided by
+# this many tasks get a task of their own, and cheaper items get batched up
+tasks_per_cpu = 8
+
+
+# load a stage's profile as a dict of item key:{"sizes", "seconds", "peak_gb"}
+def load_profile(filepath):
+    filepath = Path(filepath)
+    if not filepath.is_file():
+        return {}
+    with filepath.open() as f:
+        return json.load(f)
+
+
+# add new items' records to a stage's profile, saved atomically
+def save_profile(filepath, records) -> None:
+    records = {**load_profile(filepath), **records}
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = filepath.with_suffix(".tmp")
+    with temp_path.open("w") as f:
+        json.dump(records, f, indent=2, sort_keys=True)
+    temp_path.replace(filepath)
+
+
+# predict a measure (like "seconds" or "peak_gb") for each item: its recorded
+# value if available, otherwise a non-negative linear model of its sizes plus
+# an intercept, fit to all the recorded items. if there are too few records to
+# fit the model, return `default` for unrecorded items (or their size sum)
+def predict(sizes, profile, measure, default=None):
+    recorded = [record for record in profile.values() if measure in record]
+    n_coefs = len(next(iter(sizes.values()), ())) + 1
+    coefs = None
+    if len(recorded) > n_coefs:
+        X = np.array([[1, *record["sizes"]] for record in recorded], dtype=float)
+        y = np.array([record[measure] for record in recorded], dtype=float)
+        scales = np.maximum(X.max(axis=0), 1e-12)
+        coefs = nnls(X / scales, y)[0] / scales
+    predictions = {}
+    for key, size in sizes.items():
+        if key in profile and measure in profile[key]:
+            predictions[key] = profile[key][measure]
+        elif coefs is not None:
+            predictions[key] = float(np.dot(coefs, [1, *size]))
+        else:
+            predictions[key] = sum(size) if default is None else default
+    return predictions
+
+
+# group item keys into tasks in LPT order: costly items alone, cheap ones
+# batched until their total cost reaches the costly item threshold
+def make_tasks(costs, n_tasks):
+    threshold = sum(costs.values()) / max(n_tasks, 1)
+    tasks = []
+    batch = []
+    batch_cost = 0
+    for key in sorted(costs, key=costs.get, reverse=True):
+        if costs[key] >= threshold:
+            tasks.append([key])
+            continue
+        batch.append(key)
+        batch_cost += costs[key]
+        if batch_cost >= threshold:
+            tasks.append(batch)
+            batch = []
+            batch_cost = 0
+    if batch:
+        tasks.append(batch)
+    return tasks
+
+
+# reset this process's peak RSS (linux only, otherwise a no-op)
+def reset_peak_rss() -> None:
+    try:
+        with Path("/proc/self/clear_refs").open("w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+# get this process's peak RSS in GB since it was last reset (or since it began)
+def get_peak_rss():
+    try:
+        with Path("/proc/self/status").open() as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1e6
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e6
+
+
+# run a task's function on its batch of items' args, timing each item and
+# measuring its peak memory
+def run_task(func, items):
+    results = []
+    for key, args in items:
+        reset_peak_rss()
+        start_time = time.time()
+        result = func(*args)
+        results.append((key, time.time() - start_time, get_peak_rss(), result))
+    return results
+
+
+# run func(*args) for every item in a process pool, longest first, yielding
+# (key, result) tuples as they complete. only admit the next task when the
+# predicted peak memory of all running tasks fits in memory_budget GB (or if
+# none are running), and record each item's runtime and peak memory in the
+# stage's profile (even if a task failed, so a rerun is still scheduled well)
+def imap(func, items, cpus, memory_budget, profile_path):
+    profile = load_profile(profile_path)
+    sizes = {key: tuple(item_sizes) for key, (_, item_sizes) in items.items()}
+    costs = predict(sizes, profile, "seconds")
+    memory = predict(sizes, profile, "peak_gb", default=memory_budget / cpus)
+    tasks = list(enumerate(make_tasks(costs, cpus * tasks_per_cpu)))
+    done = queue.Queue()
+    records = {}
+    running = {}
+    try:
+        with mp.get_context().Pool(cpus) as pool:
+            while tasks or running:
+                # admit tasks in LPT order while they fit in the memory budget
+                while tasks and len(running) < cpus:
+                    task_memory = max(memory[key] for key in tasks[0][1])
+                    if running and sum(running.values()) + task_memory > memory_budget:
+                        break
+                    task_id, task = tasks.pop(0)
+                    running[task_id] = task_memory
+                    task_args = (func, [(key, items[key][0]) for key in task])
+                    pool.apply_async(
+                        run_task,
+                        task_args,
+                        callback=lambda r, i=task_id: done.put((i, r, None)),
+                        error_callback=lambda e, i=task_id: done.put((i, None, e)),
+                    )
+
+                # wait for a running task to finish, then yield its results
+                task_id, task_results, error = done.get()
+                del running[task_id]
+                if error is not None:
+                    raise error
+                for key, seconds, peak_gb, result in task_results:
+                    records[key] = {"sizes": sizes[key], "seconds": seconds, "peak_gb": peak_gb}
+                    yield key, result
+    finally:
+        save_profile(profile_path, records)
+
+
+# run func(*args) for every item in a process pool, longest first, and return
+# a dict of key:result once they've all completed
+def starmap(func, items, cpus, memory_budget, profile_path):
+    return dict(imap(func, items, cpus, memory_budget, profile_path))
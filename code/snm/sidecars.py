@@ -0,0 +1,90 @@
+# Attribute-patch sidecars: each stage that computes a new node or edge
+# attribute saves it as a small keyed file per urban center instead of
+# rewriting the whole graph. Node sidecars are keyed by osmid and edge sidecars
+# by (u, v, key). Sidecars live at `root/attr/country/city.npz` so a stage can
+# be rerun (by deleting its attribute folder) without touching anything else,
+# and they all get merged into the graph once, when it's materialized.
+
+import json
+from pathlib import Path
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+node_keys = ("osmid",)
+edge_keys = ("u", "v", "key")
+
+
+# get the path to an attribute's sidecar file for some graph file
+def sidecar_path(root, attr, model_fp):
+    model_fp = Path(model_fp)
+    return Path(root) / attr / model_fp.parent.name / (model_fp.stem + ".npz")
+
+
+# save an attribute's values keyed by osmid or by (u, v, key)
+def save_sidecar(filepath, keys, values, meta=None) -> None:
+    if tuple(keys) not in {node_keys, edge_keys}:
+        msg = f"Sidecar keys must be {node_keys} or {edge_keys}"
+        raise ValueError(msg)
+    arrays = {key: np.asarray(keys[key], dtype=np.int64) for key in keys}
+    arrays["values"] = np.asarray(values)
+    arrays["meta"] = np.array(json.dumps({} if meta is None else meta))
+
+    # write to a temp file then rename, so a crash never leaves a partial sidecar
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = filepath.with_suffix(".tmp")
+    with temp_path.open("wb") as f:
+        np.savez(f, **arrays)
+    temp_path.replace(filepath)
+
+
+# load a sidecar's keys dict, values array, and metadata dict
+def load_sidecar(filepath):
+    with np.load(filepath) as f:
+        keys = {key: f[key] for key in (*node_keys, *edge_keys) if key in f.files}
+        return keys, f["values"], json.loads(str(f["meta"]))
+
+
+# merge all of a graph file's sidecars into its graph object, optionally
+# converting attribute values with a dict of attribute names:types
+def attach_sidecars(G, root, model_fp, dtypes=None):
+    dtypes = {} if dtypes is None else dtypes
+    for attr_folder in sorted(Path(root).glob("*")):
+        attr = attr_folder.name
+        filepath = sidecar_path(root, attr, model_fp)
+        if filepath.is_file():
+            keys, values, _ = load_sidecar(filepath)
+            values = values.tolist()
+            if attr in dtypes:
+                values = [dtypes[attr](value) for value in values]
+            if "osmid" in keys:
+                lookup = zip(keys["osmid"].tolist(), values, strict=True)
+                nx.set_node_attributes(G, dict(lookup), name=attr)
+            else:
+                uvk = zip(keys["u"].tolist(), keys["v"].tolist(), keys["key"].tolist(), strict=True)
+                nx.set_edge_attributes(G, dict(zip(uvk, values, strict=True)), name=attr)
+    return G
+
+
+# add all of a graph file's sidecars to its node and edge arrays (as loaded by
+# graphstore.load_arrays), aligned by osmid or by (u, v, key). nodes or edges
+# missing from a sidecar get NaN
+def attach_arrays(nodes, edges, root, model_fp):
+    node_index = pd.Index(nodes["osmid"])
+    edge_index = pd.MultiIndex.from_arrays([edges[key] for key in edge_keys])
+    for attr_folder in sorted(Path(root).glob("*")):
+        attr = attr_folder.name
+        filepath = sidecar_path(root, attr, model_fp)
+        if filepath.is_file():
+            keys, values, _ = load_sidecar(filepath)
+            if "osmid" in keys:
+                arrays, positions = nodes, pd.Index(keys["osmid"]).get_indexer(node_index)
+            else:
+                sidecar_index = pd.MultiIndex.from_arrays([keys[key] for key in edge_keys])
+                arrays, positions = edges, sidecar_index.get_indexer(edge_index)
+            found = positions >= 0
+            arrays[attr] = np.full(len(positions), np.nan)
+            arrays[attr][found] = values[positions[found]]
+    return nodes, edges
@@ -0,0 +1,127 @@
+# Global keyed tables (like the deduplicated node and edge tables or the
+# elevation and grade tables) stored as a folder of one .npy file per column,
+# sorted by the key column (or columns). Columns can be memory-mapped so many
+# worker processes can share one copy through the OS page cache, and lookups
+# are binary searches on the (first) key.
+
+import json
+from pathlib import Path
+
+import networkx as nx
+import numpy as np
+
+
+# get a table's key as a list of key columns
+def key_columns(key):
+    return [key] if isinstance(key, str) else list(key)
+
+
+# save a dict of equal-length column arrays as a table sorted by `key` (a
+# column name, or a list of them to sort by)
+def save_table(folder, columns, key="osmid") -> None:
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    order = np.lexsort([columns[k] for k in key_columns(key)[::-1]])
+    for name, values in columns.items():
+        np.save(folder / f"{name}.npy", np.asarray(values)[order])
+    with (folder / "meta.json").open("w") as f:
+        json.dump({"key": key, "columns": list(columns), "rows": len(order)}, f)
+
+
+# drop duplicate rows (by their key columns) from a dict of equal-length
+# column arrays, returning the rest sorted by key like save_table
+def drop_duplicates(columns, key):
+    keys = key_columns(key)
+    order = np.lexsort([columns[k] for k in keys[::-1]])
+    changes = [np.diff(np.asarray(columns[k])[order]) != 0 for k in keys]
+    first = np.r_[True, np.logical_or.reduce(changes)]
+    return {name: np.asarray(values)[order][first] for name, values in columns.items()}
+
+
+# load a table's columns as a dict of (by default, memory-mapped) arrays
+def load_table(folder, columns=None, *, mmap=True):
+    folder = Path(folder)
+    with (folder / "meta.json").open() as f:
+        meta = json.load(f)
+    columns = meta["columns"] if columns is None else [*key_columns(meta["key"]), *columns]
+    mmap_mode = "r" if mmap else None
+    return {name: np.load(folder / f"{name}.npy", mmap_mode=mmap_mode) for name in columns}
+
+
+# find the positions of `keys` in a sorted key column, plus a found mask
+def lookup(sorted_keys, keys):
+    keys = np.asarray(keys)
+    if len(sorted_keys) == 0:
+        return np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=bool)
+    pos = np.searchsorted(sorted_keys, keys)
+    pos[pos == len(sorted_keys)] = 0
+    return pos, np.asarray(sorted_keys[pos]) == keys
+
+
+# find the positions of rows of keys (a dict of key column:array) in a table
+# sorted by several key columns, plus a found mask: binary search the first
+# key column, then scan its (short) runs of equal values for the other columns
+def lookup_rows(table, keys, key):
+    first, *rest = key_columns(key)
+    keys = {column: np.asarray(keys[column]) for column in key_columns(key)}
+    start = np.searchsorted(table[first], keys[first], side="left")
+    end = np.searchsorted(table[first], keys[first], side="right")
+    pos = np.zeros(len(start), dtype=np.int64)
+    found = np.zeros(len(start), dtype=bool)
+    candidates = start.copy()
+    check = candidates < end
+    while check.any():
+        match = check.copy()
+        for column in rest:
+            match[check] &= np.asarray(table[column][candidates[check]]) == keys[column][check]
+        pos[match] = candidates[match]
+        found |= match
+        candidates += 1
+        check = ~found & (candidates < end)
+    return pos, found
+
+
+# get a table column's values for some keys (NaN where key is not found). for
+# a table with several key columns, keys is a dict of key column:array
+def get_values(table, column, keys, key="osmid"):
+    if isinstance(key, str):
+        pos, found = lookup(table[key], keys)
+    else:
+        pos, found = lookup_rows(table, keys, key)
+    values = np.full(len(pos), np.nan)
+    values[found] = table[column][pos[found]]
+    return values
+
+
+# add table columns to a graph's nodes as attributes, optionally converting
+# attribute values with a dict of attribute names:types
+def attach_table(G, table, columns, dtypes=None):
+    dtypes = {} if dtypes is None else dtypes
+    osmids = np.fromiter(G.nodes, dtype=np.int64, count=len(G))
+    pos, found = lookup(table["osmid"], osmids)
+    osmids = osmids[found].tolist()
+    for column in columns:
+        values = np.asarray(table[column][pos[found]]).tolist()
+        if column in dtypes:
+            values = [dtypes[column](value) for value in values]
+        nx.set_node_attributes(G, dict(zip(osmids, values, strict=True)), name=column)
+    return G
+
+
+# add table columns to a graph's edges as attributes, looking up each edge by
+# the table's key columns: u, v, and edge attributes (like length)
+def attach_edge_table(G, table, columns, key):
+    uvks = list(G.edges(keys=True))
+    keys = {
+        "u": np.array([u for u, _, _ in uvks], dtype=np.int64),
+        "v": np.array([v for _, v, _ in uvks], dtype=np.int64),
+    }
+    for column in key_columns(key):
+        if column not in keys:
+            keys[column] = np.array([value for *_, value in G.edges(keys=True, data=column)])
+    pos, found = lookup_rows(table, keys, key)
+    uvks = [uvk for uvk, is_found in zip(uvks, found, strict=True) if is_found]
+    for column in columns:
+        values = np.asarray(table[column][pos[found]]).tolist()
+        nx.set_edge_attributes(G, dict(zip(uvks, values, strict=True)), name=column)
+    return G
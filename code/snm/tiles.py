@@ -0,0 +1,138 @@
+# Spatial scheduling of raster work over 1-degree DEM tiles. Each tile gets an
+# integer ID from its row/col in the global 1-degree grid. Tiles covered by the
+# same urban center's bounding box are grouped together, and groups are put in
+# Hilbert curve order then cut into batches, so each worker reads a compact,
+# contiguous set of tiles and neighboring tiles are read by the same worker.
+# A tile plan lists just the tiles that urban centers and their nodes touch,
+# so only those tiles get downloaded and built into the VRTs.
+
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+# the global grid of 1-degree tiles is 360 cols by 180 rows
+grid_cols = 360
+grid_rows = 180
+
+# tile names like N37W122 as they appear in SRTM and ASTER file names
+tile_name_pattern = re.compile(r"[NS]\d{2}[EW]\d{3}", flags=re.IGNORECASE)
+
+# a hilbert curve of order 9 covers a 512 x 512 grid, enough for every tile
+hilbert_order = 9
+
+
+# get each coordinate's tile ID, as row * 360 + col in the global grid
+def get_tile_ids(x, y):
+    cols = np.floor(np.asarray(x)).astype(np.int64) + grid_cols // 2
+    rows = np.floor(np.asarray(y)).astype(np.int64) + grid_rows // 2
+    return np.clip(rows, 0, grid_rows - 1) * grid_cols + np.clip(cols, 0, grid_cols - 1)
+
+
+# get a tile's name like N37W122, as used in SRTM and ASTER file names
+def get_tile_name(tile_id):
+    row, col = divmod(int(tile_id), grid_cols)
+    lat = row - grid_rows // 2
+    lng = col - grid_cols // 2
+    return f"{'N' if lat >= 0 else 'S'}{abs(lat):02d}{'E' if lng >= 0 else 'W'}{abs(lng):03d}"
+
+
+# find the tile name in a DEM file's name or URL, or None if it has none
+def find_tile_name(path):
+    match = tile_name_pattern.search(Path(path).name)
+    return None if match is None else match.group(0).upper()
+
+
+# plan which tiles to use: every tile that intersects an urban center's
+# bounding box or contains a node, with each tile's count of nodes
+def plan_tiles(bboxes, x, y):
+    bbox_tile_ids = [get_bbox_tile_ids(*bbox) for bbox in bboxes]
+    node_tile_ids, node_counts = np.unique(get_tile_ids(x, y), return_counts=True)
+    tile_ids = np.unique(np.concatenate([*bbox_tile_ids, node_tile_ids]))
+    counts = np.zeros(len(tile_ids), dtype=np.int64)
+    counts[np.searchsorted(tile_ids, node_tile_ids)] = node_counts
+    names = [get_tile_name(tile_id) for tile_id in tile_ids]
+    return pd.DataFrame({"tile_id": tile_ids, "tile": names, "nodes": counts})
+
+
+# load a saved tile plan's set of tile names
+def load_plan(filepath):
+    return set(pd.read_csv(filepath)["tile"])
+
+
+# keep only the DEM file paths or URLs whose tiles are in a tile plan
+def filter_planned(paths, plan):
+    return [path for path in paths if find_tile_name(path) in plan]
+
+
+# get all the tile IDs that intersect a bounding box
+def get_bbox_tile_ids(minx, miny, maxx, maxy):
+    cols = np.arange(np.floor(minx), np.floor(maxx) + 1)
+    rows = np.arange(np.floor(miny), np.floor(maxy) + 1)
+    xx, yy = np.meshgrid(cols, rows)
+    return np.unique(get_tile_ids(xx.ravel(), yy.ravel()))
+
+
+# get each tile's distance along a hilbert curve through the global grid
+def get_hilbert_index(tile_ids):
+    y, x = np.divmod(np.asarray(tile_ids, dtype=np.int64), grid_cols)
+    n = 2**hilbert_order
+    d = np.zeros(len(x), dtype=np.int64)
+    s = n // 2
+    while s > 0:
+        rx = ((x & s) > 0).astype(np.int64)
+        ry = ((y & s) > 0).astype(np.int64)
+        d += s * s * ((3 * rx) ^ ry)
+
+        # rotate the quadrant so the curve stays continuous
+        flip = (ry == 0) & (rx == 1)
+        x = np.where(flip, n - 1 - x, x)
+        y = np.where(flip, n - 1 - y, y)
+        swap = ry == 0
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s //= 2
+    return d
+
+
+# label each tile in the global grid by its group: tiles are grouped together
+# if any one urban center's bounding box covers them both
+def get_tile_groups(bboxes):
+    n = grid_cols * grid_rows
+    rows = []
+    cols = []
+    for bbox in bboxes:
+        tile_ids = get_bbox_tile_ids(*bbox)
+        rows.extend([tile_ids[0]] * len(tile_ids))
+        cols.extend(tile_ids)
+    adj = coo_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, n))
+    _, labels = connected_components(adj, directed=False)
+    return labels
+
+
+# cut tiles into batches of roughly equal weight, keeping each tile group in
+# one batch and ordering tiles along the hilbert curve, return each tile's
+# batch number in a lookup array indexed by tile ID
+def make_batches(tile_ids, weights, groups, n_batches):
+    tile_ids = np.asarray(tile_ids)
+    weights = np.asarray(weights, dtype=float)
+    hilbert = get_hilbert_index(tile_ids)
+
+    # order groups by their first tile's hilbert index, then tiles within groups
+    group_start = {}
+    for group, h in zip(groups[tile_ids].tolist(), hilbert.tolist(), strict=True):
+        group_start[group] = min(h, group_start.get(group, h))
+    starts = np.array([group_start[g] for g in groups[tile_ids].tolist()], dtype=np.int64)
+    order = np.lexsort((hilbert, starts))
+
+    # cut the ordered tiles into contiguous runs of equal cumulative weight,
+    # only cutting where one group ends and the next begins
+    cumulative = np.cumsum(weights[order]) - weights[order]
+    cuts = np.floor(n_batches * cumulative / max(weights.sum(), 1)).astype(np.int64)
+    group_changes = np.r_[True, np.diff(starts[order]) != 0]
+    batch_numbers = np.maximum.accumulate(np.where(group_changes, cuts, 0))
+    lookup = np.full(grid_cols * grid_rows, -1, dtype=np.int64)
+    lookup[tile_ids[order]] = batch_numbers
+    return lookup
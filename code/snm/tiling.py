@@ -0,0 +1,154 @@
+# Tiled, halo-based calculation of a giant graph's local indicators, so the
+# work on the largest urban centers can be split across a process pool instead
+# of running as one monolithic graph on one CPU. Nodes are binned into square
+# tiles by their projected coordinates. Each tile calculates its own (core)
+# nodes' results from a subgraph of its core nodes plus a halo of the nodes
+# those results depend on, and the tiles' partial results are merged exactly:
+#
+# A node's clustering coefficient only depends on its neighbors and the edges
+# between them, so a tile's halo is its core nodes' neighbors. Each node's
+# coefficient is calculated by its own tile (with the whole graph's max weight
+# for the weighted ones) and the averages are taken over all nodes' values.
+#
+# Whether two nodes' buffers merge only depends on the two nodes, and nodes
+# farther apart than twice the largest tolerance never merge, so a tile's halo
+# is every node within that distance of it. Each tile returns the pairs it
+# merges whose first node is a core node (so each pair is checked by just one
+# tile), and the clusters, the connected components of all the tiles' merged
+# pairs, are then counted once for the whole graph.
+#
+# PageRank is a global indicator, so it is still calculated on the whole graph.
+
+from itertools import product
+
+import numpy as np
+
+from snm import clustering, consolidation
+
+# side length of the square tiles, in meters
+tile_size = 5000
+
+
+# get the positions of each tile's nodes from the nodes' projected x, y
+# coordinates, as a dict of tile cell (column, row):sorted node positions
+def tile_cells(xy):
+    cells = np.floor(xy / tile_size).astype(np.int64)
+    order = np.lexsort((cells[:, 1], cells[:, 0]))
+    splits = np.flatnonzero((np.diff(cells[order], axis=0) != 0).any(axis=1)) + 1
+    starts = order[np.r_[0, splits]]
+    return {
+        (int(cells[start, 0]), int(cells[start, 1])): np.sort(positions)
+        for start, positions in zip(starts, np.split(order, splits), strict=True)
+    }
+
+
+# get the positions of a tile's nodes plus all the nodes within halo meters of
+# its cell, which are all in its neighboring cells as the halo can't be bigger
+# than a tile
+def distance_halo(xy, cells, cell, halo):
+    col, row = cell
+    neighbors = product(range(col - 1, col + 2), range(row - 1, row + 2))
+    near = np.sort(np.concatenate([cells[c] for c in neighbors if c in cells]))
+    lower = np.array(cell) * tile_size - halo
+    upper = lower + tile_size + 2 * halo
+    inside = ((xy[near] >= lower) & (xy[near] <= upper)).all(axis=1)
+    return near[inside]
+
+
+# get the node pairs a tile merges at each tolerance, from the projected x, y
+# coordinates of its core and halo nodes, whether each one is a core node, and
+# their positions in the graph. returns a dict of tolerance:merged pairs (as
+# rows of positions in the graph)
+def consolidation_tile(xy, core, positions, tolerances):
+    pairs, distances = consolidation.candidate_pairs(xy, 2 * max(tolerances))
+    owned = core[pairs[:, 0]]
+    pairs, distances = pairs[owned], distances[owned]
+    return {t: positions[consolidation.merge_pairs(xy, pairs, distances, t)] for t in tolerances}
+
+
+# count a giant graph's consolidated intersections at each tolerance (meters)
+# tile by tile across a process pool, from its projected node coordinates and
+# its node and edge arrays, exactly like consolidation.intersection_counts
+def intersection_counts(xy, nodes, edges, tolerances, pool):
+    xy, graph_edges = consolidation.intersection_graph(xy, nodes, edges)
+    if len(xy) == 0:
+        return dict.fromkeys(tolerances, (0, 0))
+    halo = 2 * max(tolerances)
+    if halo > tile_size:
+        msg = f"Tolerances up to {max(tolerances)} meters need tiles of at least {halo} meters"
+        raise ValueError(msg)
+
+    cells = tile_cells(xy)
+    args = []
+    for cell, tile in cells.items():
+        positions = distance_halo(xy, cells, cell, halo)
+        core = np.isin(positions, tile)
+        args.append((xy[positions], core, positions, tolerances))
+    merged = {t: [np.empty((0, 2), dtype=np.int64)] for t in tolerances}
+    for tile_merged in pool.starmap(consolidation_tile, args):
+        for tolerance, pairs in tile_merged.items():
+            merged[tolerance].append(pairs)
+    merged = {t: np.concatenate(pairs) for t, pairs in merged.items()}
+    return consolidation.cluster_counts(len(xy), graph_edges, merged)
+
+
+# calculate the clustering coefficients of a tile's core nodes from the
+# directed and undirected adjacency matrices of its core and halo nodes, given
+# the whole graph's max weights (directed, undirected)
+def clustering_tile(W, Wu, core, max_weights):
+    max_weight, max_weight_undir = max_weights
+    coefs = {
+        "cc_avg_dir": clustering.clustering(W, directed=True, weighted=False),
+        "cc_wt_avg_dir": clustering.clustering(
+            W,
+            directed=True,
+            weighted=True,
+            max_weight=max_weight,
+        ),
+        "cc_avg_undir": clustering.clustering(Wu, directed=False, weighted=False),
+        "cc_wt_avg_undir": clustering.clustering(
+            Wu,
+            directed=False,
+            weighted=True,
+            max_weight=max_weight_undir,
+        ),
+    }
+    return {name: values[core] for name, values in coefs.items()}
+
+
+# calculate a giant graph file's clustering and PageRank stats, exactly like
+# clustering.calculate_clustering but with the clustering coefficients
+# calculated tile by tile across a process pool, given the graph's projected
+# node coordinates. returns the stats and the PageRank convergence report
+def calculate_clustering(filepath, xy, pool, weight_attr="length"):
+    _, W = clustering.load_matrix(filepath, weight_attr)
+    Wu = clustering.to_undirected(W)
+    max_weights = (W.data.max(), Wu.data.max()) if W.nnz else (1, 1)
+
+    # each tile's halo is its nodes' in and out neighbors
+    W_in = W.T.tocsr()
+    tiles = list(tile_cells(xy).values())
+    args = []
+    for tile in tiles:
+        positions = np.union1d(tile, np.r_[W[tile].indices, W_in[tile].indices])
+        core = np.isin(positions, tile)
+        W_tile = W[positions][:, positions]
+        Wu_tile = Wu[positions][:, positions]
+        args.append((W_tile, Wu_tile, core, max_weights))
+
+    # calculate pagerank on the whole graph while the pool works on the tiles,
+    # then gather every node's coefficients from the tiles and average them
+    tiles_coefs = pool.starmap_async(clustering_tile, args)
+    ranks, report = clustering.pagerank(W)
+    coefs = {}
+    for tile, tile_coefs in zip(tiles, tiles_coefs.get(), strict=True):
+        for name, values in tile_coefs.items():
+            coefs.setdefault(name, np.zeros(W.shape[0]))[tile] = values
+    stats = {
+        "cc_avg_dir": float(np.mean(coefs["cc_avg_dir"])),
+        "cc_wt_avg_dir": float(np.mean(coefs["cc_wt_avg_dir"])),
+        "pagerank_max": float(ranks.max()),
+        "cc_avg_undir": float(np.mean(coefs["cc_avg_undir"])),
+        "cc_wt_avg_undir": float(np.mean(coefs["cc_wt_avg_undir"])),
+    }
+    return stats, report